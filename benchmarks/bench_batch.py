@@ -0,0 +1,72 @@
+"""execute_batch throughput vs. one initiate_transaction call per line.
+
+    python -m benchmarks.bench_batch [--lines 100000] [--calls 2000] [--accounts 1000]
+"""
+import argparse
+import random
+import time
+
+from benchmarks.common import BenchBank
+from frappster.models import Account, User, UserData
+from frappster.types import AccessRole, AccountType
+
+FIRST_ACCOUNT = 500000
+
+
+def seed(bank, accounts):
+    session = bank.db_manager.open_session()
+    user = User(login_id=1, first_name="Bench", last_name="Mark",
+                address="-", email="-", phone_number="-", password="-",
+                access_role=AccessRole.CUSTOMER)
+    session.add(user)
+    session.flush()
+    session.add_all([Account(clearings_number=123, account_number=FIRST_ACCOUNT + i,
+                             account_type=AccountType.BUSINESS,
+                             balance=10**9, user_id=user.id)
+                     for i in range(accounts)])
+    session.commit()
+    data = UserData(**user.to_dict())
+    bank.db_manager.close_session()
+    return data
+
+
+def make_lines(count, accounts, rng):
+    lines = []
+    for _ in range(count):
+        sender, reciever = rng.sample(range(accounts), 2)
+        lines.append((FIRST_ACCOUNT + sender, FIRST_ACCOUNT + reciever, rng.randint(1, 500)))
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=100_000)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with BenchBank() as bank:
+        bank.auth_service.current_user = seed(bank, args.accounts)
+        service = bank.transaction_service
+
+        lines = make_lines(args.calls, args.accounts, rng)
+        start = time.perf_counter()
+        for line in lines:
+            service.initiate_transaction(*line)
+        per_call = args.calls / (time.perf_counter() - start)
+
+        lines = make_lines(args.lines, args.accounts, rng)
+        start = time.perf_counter()
+        results = service.execute_batch(lines)
+        batch = args.lines / (time.perf_counter() - start)
+        failed = sum(not result['ok'] for result in results)
+
+    print(f"initiate_transaction: {per_call:>10.0f} transfers/s ({args.calls} calls)")
+    print(f"execute_batch:        {batch:>10.0f} transfers/s ({args.lines} lines, {failed} failed)")
+    print(f"speedup:              {batch / per_call:>10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Many workers hammering one hot account.
+
+Every worker (a process with its own DatabaseManager, or a thread
+sharing one) deposits into the same account. Prints throughput and
+checks that the final balance & version lost no update.
+
+    python -m benchmarks.bench_contention [--workers 8] [--ops 200] [--threads]
+"""
+import argparse
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import BenchBank
+from frappster.auth import AuthService
+from frappster.database import DatabaseManager
+from frappster.models import Account, User, UserData
+from frappster.services import AccountService, TransactionService, UserManager
+from frappster.types import AccessRole, AccountType
+
+HOT_ACCOUNT = 400001
+START_BALANCE = 1000
+
+
+def seed(bank):
+    session = bank.db_manager.open_session()
+    user = User(login_id=1, first_name="Bench", last_name="Mark",
+                address="-", email="-", phone_number="-", password="-",
+                access_role=AccessRole.CUSTOMER)
+    session.add(user)
+    session.flush()
+    session.add(Account(clearings_number=123, account_number=HOT_ACCOUNT,
+                        account_type=AccountType.CHECKINGS,
+                        balance=START_BALANCE, user_id=user.id))
+    session.commit()
+    data = UserData(**user.to_dict())
+    bank.db_manager.close_session()
+    return data
+
+
+def deposit_loop(db_manager, user, ops):
+    auth_service = AuthService(db_manager)
+    auth_service.current_user = user
+    user_manager = UserManager(db_manager, auth_service)
+    account_service = AccountService(db_manager, auth_service)
+    service = TransactionService(db_manager, user_manager, auth_service, account_service)
+    for _ in range(ops):
+        service.make_deposit(HOT_ACCOUNT, 1)
+
+
+def process_worker(db_url, user_dict, ops):
+    db_manager = DatabaseManager(db_url)
+    deposit_loop(db_manager, UserData(**user_dict), ops)
+    db_manager.engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=200, help="deposits per worker")
+    parser.add_argument("--threads", action="store_true",
+                        help="threads sharing one DatabaseManager instead of processes")
+    args = parser.parse_args()
+
+    with BenchBank() as bank:
+        user = seed(bank)
+        start = time.perf_counter()
+        if args.threads:
+            with ThreadPoolExecutor(max_workers=args.workers) as pool:
+                futures = [pool.submit(deposit_loop, bank.db_manager, user, args.ops)
+                           for _ in range(args.workers)]
+                for future in futures:
+                    future.result()
+        else:
+            user_dict = vars(user)
+            processes = [multiprocessing.Process(target=process_worker,
+                                                 args=(bank.db_url, user_dict, args.ops))
+                         for _ in range(args.workers)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+        elapsed = time.perf_counter() - start
+
+        session = bank.db_manager.open_session()
+        account = session.query(Account).filter_by(account_number=HOT_ACCOUNT).one()
+        total = args.workers * args.ops
+        expected = START_BALANCE + total
+        print(f"{'threads' if args.threads else 'processes'}: {args.workers} workers, "
+              f"{total} deposits in {elapsed:.2f}s = {total / elapsed:.0f} ops/s")
+        print(f"balance {account.balance} (expected {expected}), version {account.version} "
+              f"(expected {total + 1})")
+        ok = account.balance == expected and account.version == total + 1
+        bank.db_manager.close_session()
+        print("OK, no lost updates" if ok else "LOST UPDATES")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Deposit latency / throughput with and without the group commit queue.
+
+Worker threads each make blocking make_deposit calls, first straight
+to the database, then through a GroupCommitQueue for every
+(window_ms, max_batch) pair given.
+
+    python -m benchmarks.bench_group_commit [--threads 16] [--ops 50]
+        [--windows 0.5 2 5] [--batches 16 64] [--profile durable]
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.bench_contention import HOT_ACCOUNT, seed
+from benchmarks.common import BenchBank, summarize
+from frappster.write_queue import GroupCommitQueue
+
+
+def run(bank, threads, ops):
+    service = bank.transaction_service
+    latencies = []
+
+    def worker():
+        for _ in range(ops):
+            start = time.perf_counter()
+            service.make_deposit(HOT_ACCOUNT, 1)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for future in [pool.submit(worker) for _ in range(threads)]:
+            future.result()
+    result = summarize(latencies)
+    result['ops_per_s'] = threads * ops / (time.perf_counter() - start)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--ops", type=int, default=50, help="deposits per thread")
+    parser.add_argument("--windows", type=float, nargs="+", default=[0.5, 2, 5])
+    parser.add_argument("--batches", type=int, nargs="+", default=[16, 64])
+    parser.add_argument("--profile", default="durable")
+    args = parser.parse_args()
+
+    print(f"{'mode':>22} {'ops/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    with BenchBank(profile=args.profile) as bank:
+        bank.auth_service.current_user = seed(bank)
+        result = run(bank, args.threads, args.ops)
+        print(f"{'no queue':>22} {result['ops_per_s']:>8.0f} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f}")
+
+        for window in args.windows:
+            for batch in args.batches:
+                with GroupCommitQueue(bank.db_manager, window, batch) as write_queue:
+                    bank.transaction_service.write_queue = write_queue
+                    result = run(bank, args.threads, args.ops)
+                bank.transaction_service.write_queue = None
+                mode = f"window {window}ms x {batch}"
+                print(f"{mode:>22} {result['ops_per_s']:>8.0f} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""First page latency of the keyset paginated history vs. history size.
+
+    python -m benchmarks.bench_history [--sizes 0 10000 100000] [--repeat 200]
+"""
+import argparse
+
+from benchmarks.bench_transfer import SENDER, seed
+from benchmarks.common import BenchBank, summarize, time_calls
+
+
+def run(history_rows, repeat, page_size):
+    with BenchBank() as bank:
+        bank.auth_service.current_user = seed(bank, history_rows)
+        service = bank.transaction_service
+        latencies = time_calls(
+                lambda: service.get_history_page(SENDER, page_size),
+                repeat)
+        return summarize(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--page-size", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'history rows':>12} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for size in args.sizes:
+        result = run(size, args.repeat, args.page_size)
+        print(f"{size:>12} {result['mean_ms']:>9.3f} {result['p50_ms']:>9.3f} {result['p99_ms']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
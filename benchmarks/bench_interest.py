@@ -0,0 +1,67 @@
+"""Interest accrual runtime over a large savings book.
+
+Seeds --accounts savings accounts (plus a slice of checkings ones the
+job has to skip), runs one accrual period and then the same period
+again, which must find nothing left to do.
+
+    python -m benchmarks.bench_interest [--accounts 1000000] [--chunk-size 10000]
+"""
+import argparse
+import time
+
+from sqlalchemy import insert
+
+from benchmarks.common import BenchBank
+from frappster.interest import InterestEngine
+from frappster.models import Account, User, UserData
+from frappster.types import AccessRole, AccountType
+
+FIRST_ACCOUNT = 1_000_000
+SEED_BATCH = 50_000
+
+
+def seed(bank, accounts):
+    session = bank.db_manager.open_session()
+    user = User(login_id=1, first_name="Bench", last_name="Mark",
+                address="-", email="-", phone_number="-", password="-",
+                access_role=AccessRole.EMPLOYEE)
+    session.add(user)
+    session.flush()
+    for start in range(0, accounts, SEED_BATCH):
+        session.execute(insert(Account), [
+            {'clearings_number': 123,
+             'account_number': FIRST_ACCOUNT + i,
+             # Every tenth a checkings account
+             'account_type': AccountType.CHECKINGS if i % 10 == 0 else AccountType.SAVINGS,
+             'balance': 1000 + i % 5000,
+             'user_id': user.id}
+            for i in range(start, min(start + SEED_BATCH, accounts))])
+    session.commit()
+    data = UserData(**user.to_dict())
+    bank.db_manager.close_session()
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=1_000_000)
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    parser.add_argument("--profile", default="fast")
+    args = parser.parse_args()
+
+    with BenchBank(profile=args.profile) as bank:
+        start = time.perf_counter()
+        bank.auth_service.current_user = seed(bank, args.accounts)
+        print(f"seeded {args.accounts} accounts in {time.perf_counter() - start:.1f}s")
+
+        engine = InterestEngine(bank.db_manager, bank.auth_service, args.chunk_size)
+        for run in ("first run", "rerun"):
+            start = time.perf_counter()
+            summary = engine.accrue("2024-06", "0.0025")
+            elapsed = time.perf_counter() - start
+            print(f"{run:>10}: {summary['accounts']} accounts, {summary['total']:.2f} total, "
+                  f"{elapsed:.2f}s, {summary['accounts'] / elapsed:.0f} accounts/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Logins per second for a growing bcrypt pool.
+
+Seeds users hashed at --rounds, then fires --logins logins from as many
+client threads as the pool has workers, once per worker count.
+
+    python -m benchmarks.bench_logins [--rounds 10] [--logins 64] [--workers 1 2 4]
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import BenchBank
+from frappster.auth import AuthService
+from frappster.hashing import PasswordHasher
+from frappster.models import User
+from frappster.types import AccessRole
+
+USERS = 32
+PASSWORD = "bench password"
+
+
+def seed(bank, hasher):
+    hashed = hasher.hash(PASSWORD)
+    session = bank.db_manager.open_session()
+    for login_id in range(1, USERS + 1):
+        session.add(User(login_id=login_id, first_name="Bench", last_name="Mark",
+                         address="-", email="-", phone_number="-",
+                         password=hashed, access_role=AccessRole.CUSTOMER))
+    session.commit()
+    bank.db_manager.close_session()
+
+
+def logins_per_second(bank, hasher, logins, clients):
+    def login(i):
+        AuthService(bank.db_manager, hasher).login_user(i % USERS + 1, PASSWORD)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(login, range(logins)))
+    return logins / (time.perf_counter() - start)
+
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, 2, 4, cores}))
+    args = parser.parse_args()
+
+    print(f"bcrypt cost {args.rounds}, {cores} cores")
+    print(f"{'workers':>8} {'logins/s':>10}")
+    with BenchBank() as bank:
+        for workers in args.workers:
+            hasher = PasswordHasher(rounds=args.rounds, workers=workers)
+            if workers == args.workers[0]:
+                seed(bank, hasher)
+            rate = logins_per_second(bank, hasher, args.logins, workers)
+            hasher.shutdown()
+            print(f"{workers:>8} {rate:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
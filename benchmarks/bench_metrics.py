@@ -0,0 +1,49 @@
+"""Per call overhead of the metrics & the instrumented wrapper.
+
+Times a no-op bare, with just the latency recording around it and
+wrapped in @instrumented (recording plus SQL call tagging).
+
+    python -m benchmarks.bench_metrics [--calls 1000000]
+"""
+import argparse
+import time
+
+from frappster.instrumentation import instrumented
+from frappster.metrics import MetricsRegistry
+
+
+def noop():
+    return None
+
+
+def per_call_ns(func, calls):
+    start = time.perf_counter_ns()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter_ns() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    metrics = MetricsRegistry().method("noop")
+    clock = time.perf_counter_ns
+
+    def recorded():
+        start = clock()
+        try:
+            return noop()
+        finally:
+            metrics.latency.record(clock() - start)
+
+    bare = per_call_ns(noop, args.calls)
+    print(f"{'variant':>13} {'ns/call':>8} {'overhead':>9}")
+    for name, func in (("bare", noop), ("recorded", recorded), ("instrumented", instrumented(noop))):
+        took = per_call_ns(func, args.calls)
+        print(f"{name:>13} {took:>8.0f} {took - bare:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Overhead of the requires_role / requires_permissions decorators.
+
+Times get_user_accounts as decorated, the same call with the decorators
+stripped, and the decorator stack alone around a no-op, next to the old
+list scan permission check for comparison.
+
+    python -m benchmarks.bench_permissions [--calls 20000]
+"""
+import argparse
+import inspect
+import time
+
+from benchmarks.bench_profiles import seed
+from benchmarks.common import BenchBank
+from frappster.errors import PermissionDeniedError
+from frappster.services import AccountService
+from frappster.types import ROLE_PERMISSIONS, AccessRole, Permissions
+from frappster.utils import requires_permissions, requires_role
+
+
+def list_scan_permissions(*required_permissions):
+    """requires_permissions as it was, a list scan per permission per call"""
+    def decorator(func):
+        def wrapper(self, *args, **kwargs):
+            has_permision = False
+            for permission in required_permissions:
+                if permission in ROLE_PERMISSIONS.get(self.auth_service.current_user.access_role, []):
+                    has_permision = True
+            if not has_permision:
+                raise PermissionDeniedError
+            return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Checks:
+    def __init__(self, auth_service) -> None:
+        self.auth_service = auth_service
+
+    @requires_role(AccessRole.CUSTOMER)
+    @requires_permissions(Permissions.MANAGE_ACCOUNTS, Permissions.VIEW_ACCOUNT)
+    def bitmask(self):
+        pass
+
+    @requires_role(AccessRole.CUSTOMER)
+    @list_scan_permissions(Permissions.MANAGE_ACCOUNTS, Permissions.VIEW_ACCOUNT)
+    def list_scan(self):
+        pass
+
+    def bare(self):
+        pass
+
+
+def per_call_us(func, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    with BenchBank() as bank:
+        bank.auth_service.current_user = seed(bank)
+        checks = Checks(bank.auth_service)
+        service = bank.account_service
+        bare_get_user_accounts = inspect.unwrap(AccountService.get_user_accounts)
+
+        results = {
+            'no-op, no decorators': per_call_us(checks.bare, args.calls),
+            'no-op, list scan check': per_call_us(checks.list_scan, args.calls),
+            'no-op, bitmask check': per_call_us(checks.bitmask, args.calls),
+            'get_user_accounts, undecorated': per_call_us(lambda: bare_get_user_accounts(service), args.calls // 10),
+            'get_user_accounts': per_call_us(service.get_user_accounts, args.calls // 10),
+        }
+
+    for name, us in results.items():
+        print(f"{name:>32} {us:>10.2f} us/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Deposit / withdraw / transfer throughput per engine profile.
+
+Each profile gets a fresh database, every operation is its own commit,
+run once from a single thread and once from a thread pool.
+
+    python -m benchmarks.bench_profiles [--ops 500] [--threads 4]
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import BenchBank
+from frappster.database import ENGINE_PROFILES
+from frappster.models import Account, User, UserData
+from frappster.types import AccessRole, AccountType
+
+ACCOUNTS = (300001, 300002)
+
+
+def seed(bank):
+    session = bank.db_manager.open_session()
+    user = User(login_id=1, first_name="Bench", last_name="Mark",
+                address="-", email="-", phone_number="-", password="-",
+                access_role=AccessRole.CUSTOMER)
+    session.add(user)
+    session.flush()
+    for number in ACCOUNTS:
+        session.add(Account(clearings_number=123, account_number=number,
+                            account_type=AccountType.CHECKINGS,
+                            balance=10**9, user_id=user.id))
+    session.commit()
+    data = UserData(**user.to_dict())
+    bank.db_manager.close_session()
+    return data
+
+
+def operations(service):
+    return {
+        'deposit': lambda: service.make_deposit(ACCOUNTS[0], 1),
+        'withdraw': lambda: service.make_withdraw(ACCOUNTS[0], 1),
+        'transfer': lambda: service.initiate_transaction(ACCOUNTS[0], ACCOUNTS[1], 1),
+    }
+
+
+def throughput(func, ops, threads):
+    start = time.perf_counter()
+    if threads == 1:
+        for _ in range(ops):
+            func()
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for future in [pool.submit(func) for _ in range(ops)]:
+                future.result()
+    return ops / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ops", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--profiles", nargs="+", default=list(ENGINE_PROFILES))
+    args = parser.parse_args()
+
+    print(f"{'profile':>8} {'operation':>10} {'1 thread ops/s':>15} {f'{args.threads} threads ops/s':>16}")
+    for profile in args.profiles:
+        with BenchBank(profile=profile) as bank:
+            bank.auth_service.current_user = seed(bank)
+            for name, func in operations(bank.transaction_service).items():
+                single = throughput(func, args.ops, 1)
+                pooled = throughput(func, args.ops, args.threads)
+                print(f"{profile:>8} {name:>10} {single:>15.0f} {pooled:>16.0f}")
+
+
+if __name__ == "__main__":
+    main()
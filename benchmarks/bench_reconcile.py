@@ -0,0 +1,58 @@
+"""Reconciliation runtime over a big ledger.
+
+Generates --accounts accounts and --transactions transactions between
+them with frappster.datagen, knocks --corrupt balances off and times a
+full reconciliation per process count.
+
+    python -m benchmarks.bench_reconcile [--transactions 10000000] [--accounts 100000] [--processes 1 2 4]
+"""
+import argparse
+import os
+import time
+
+from sqlalchemy import update
+
+from benchmarks.common import BenchBank
+from frappster.datagen import DataGenerator
+from frappster.models import Account
+from frappster.reconcile import Reconciler
+
+
+def seed(bank, accounts, transactions, corrupt, seed):
+    generator = DataGenerator(bank.db_manager, seed)
+    created = generator.generate(max(1, accounts // 2), accounts, transactions)
+    with bank.db_manager.unit_of_work(write=True) as session:
+        for account_number in generator.rng.sample(created['account_numbers'], corrupt):
+            session.execute(update(Account.__table__)
+                            .where(Account.__table__.c.account_number == account_number)
+                            .values(balance=Account.__table__.c.balance + 1))
+        # The first generated user is an employee
+        return bank.db_manager.get_user_data(created['login_ids'][0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--transactions", type=int, default=10_000_000)
+    parser.add_argument("--accounts", type=int, default=100_000)
+    parser.add_argument("--corrupt", type=int, default=10)
+    parser.add_argument("--processes", type=int, nargs="+",
+                        default=sorted({1, 2, os.cpu_count() or 1}))
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with BenchBank(profile="bench") as bank:
+        start = time.perf_counter()
+        bank.auth_service.current_user = seed(bank, args.accounts, args.transactions,
+                                              args.corrupt, args.seed)
+        print(f"seeded {args.transactions} transactions in {time.perf_counter() - start:.1f}s")
+
+        print(f"{'processes':>9} {'seconds':>8} {'discrepancies':>14}")
+        for processes in args.processes:
+            reconciler = Reconciler(bank.db_manager, bank.auth_service, processes)
+            start = time.perf_counter()
+            summary = reconciler.run()
+            print(f"{processes:>9} {time.perf_counter() - start:>8.2f} {summary['discrepancies']:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Cold start of the cli, from exec to the first prompt.
+
+Starts a fresh interpreter --repeat times that builds a BankingApp on an
+up to date database, and times until it could show the main menu and
+until the database is open (the login screen waits for that). A bare
+interpreter start is timed too, for reference. One more start runs
+under -X importtime and the --top slowest imports are listed.
+
+    python -m benchmarks.bench_startup [--repeat 10] [--top 15]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.common import BenchBank, summarize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child, prints a line at the first prompt & once the
+# database is open so the parent can time them
+CHILD = """
+import sys
+from frappster.ui.app import BankingApp
+app = BankingApp(sys.argv[1])
+print("prompt", flush=True)
+app.wait_for_services()
+print("services", flush=True)
+"""
+
+
+def start_once(db_url):
+    """ms until the first prompt & until the database is open"""
+    start = time.perf_counter()
+    child = subprocess.Popen([sys.executable, "-c", CHILD, db_url], cwd=ROOT,
+                             stdout=subprocess.PIPE, text=True)
+    marks = {}
+    for line in child.stdout:
+        marks[line.strip()] = (time.perf_counter() - start) * 1000
+    if child.wait() != 0:
+        raise RuntimeError(f"startup failed with exit code {child.returncode}")
+    return marks['prompt'], marks['services']
+
+
+def bare_start():
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def slowest_imports(db_url, top):
+    """(cumulative ms, module) of the top level imports, slowest first"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILD, db_url],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # the header
+        imports.append((int(cumulative) / 1000, name.rstrip()))
+    imports.sort(reverse=True)
+    return imports[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    with BenchBank() as bank:
+        # Both sides of the database are set up, like any start but the first
+        bank.db_manager.engine.dispose()
+        start_once(bank.db_url)
+
+        timings = [start_once(bank.db_url) for _ in range(args.repeat)]
+        prompt = summarize([prompt_ms for prompt_ms, _ in timings])
+        services = summarize([services_ms for _, services_ms in timings])
+        bare = summarize([bare_start() for _ in range(args.repeat)])
+        imports = slowest_imports(bank.db_url, args.top)
+
+    print(f"{'':>20} {'p50 ms':>9} {'max ms':>9}")
+    for name, summary in (("python -c pass", bare),
+                          ("first prompt", prompt),
+                          ("database open", services)):
+        print(f"{name:>20} {summary['p50_ms']:>9.1f} {summary['max_ms']:>9.1f}")
+    print("\nslowest imports (cumulative, under -X importtime)")
+    for cumulative_ms, name in imports:
+        print(f"{cumulative_ms:>9.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
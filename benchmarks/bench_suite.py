@@ -0,0 +1,182 @@
+"""Latency & throughput of every service hot path on a generated bank.
+
+Generates --users users, --accounts accounts and --transactions
+transactions with frappster.datagen, then times each call --repeat
+times as a customer owning a hot account (an employee for
+get_all_users). Results are written as JSON with --output. Given a
+--baseline from an earlier run, every p50/p99 that got more than
+--threshold slower is flagged and the exit code is 1.
+
+    python -m benchmarks.bench_suite [--transactions 100000] [--repeat 100] [--output run.json] [--baseline base.json]
+"""
+import argparse
+import contextlib
+import json
+import platform
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import insert, select
+
+from benchmarks.common import BenchBank, summarize, time_calls
+from frappster.auth import AuthService
+from frappster.datagen import DataGenerator
+from frappster.hashing import get_hasher
+from frappster.models import Account, Transaction, User
+from frappster.types import TransactionType
+
+PASSWORD = "bench password"
+# Deposited to the benchmarked account so withdrawals & transfers never
+# drain it, however small the generated bank
+FUNDING = Decimal(1_000_000)
+# Below this a slowdown is timer noise, whatever the ratio
+MIN_DELTA_MS = 0.05
+COMPARED = ('p50_ms', 'p99_ms')
+
+
+def seed(bank, users, accounts, transactions, seed):
+    created = DataGenerator(bank.db_manager, seed, password=PASSWORD).generate(
+            users, accounts, transactions)
+    # The first accounts are the hot ones, with the longest histories
+    account, other = created['account_numbers'][:2]
+    with bank.db_manager.unit_of_work(write=True) as session:
+        owner = session.execute(select(User.login_id)
+                                .join(Account, Account.user_id == User.id)
+                                .where(Account.account_number == account)).scalar_one()
+        session.execute(insert(Transaction.__table__).values(recipients_account_number=account,
+                                                             type=TransactionType.DEPOSIT,
+                                                             amount=FUNDING))
+        bank.db_manager.apply_balance_deltas({account: FUNDING})
+    # The first generated user is an employee
+    return {'employee': created['login_ids'][0], 'customer': owner,
+            'account': account, 'other': other}
+
+
+def as_user(bank, login_id):
+    with bank.db_manager.unit_of_work():
+        bank.auth_service.current_user = bank.db_manager.get_user_data(login_id)
+
+
+def run_suite(bank, ids, repeat):
+    def login():
+        AuthService(bank.db_manager).login_user(ids['customer'], PASSWORD)
+
+    accounts = bank.account_service
+    transactions = bank.transaction_service
+    account, other = ids['account'], ids['other']
+    calls = [
+        ('login_user', 'customer', login),
+        ('get_user_accounts', 'customer', accounts.get_user_accounts),
+        ('make_deposit', 'customer', lambda: transactions.make_deposit(account, 10)),
+        ('make_withdraw', 'customer', lambda: transactions.make_withdraw(account, 10)),
+        ('initiate_transaction', 'customer',
+         lambda: transactions.initiate_transaction(account, other, 1)),
+        ('get_history', 'customer', lambda: transactions.get_history(account)),
+        ('get_all_users', 'employee', bank.user_manager.get_all_users),
+    ]
+
+    results = {}
+    for name, role, call in calls:
+        as_user(bank, ids[role])
+        try:
+            call()  # warm up caches & the pool
+            results[name] = summarize(time_calls(call, repeat))
+        except Exception as e:
+            # Reported & left out of the comparison, the rest still runs
+            results[name] = {'error': repr(e)}
+            print(f"{name:>22} failed: {e!r}", file=sys.stderr)
+            continue
+        print(f"{name:>22} {results[name]['p50_ms']:>9.3f} {results[name]['p99_ms']:>9.3f} "
+              f"{results[name]['ops_per_s']:>9.1f}", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Benchmarks & metrics more than threshold (0.2 is 20%) slower
+    than in baseline"""
+    regressions = []
+    for name, current in results.items():
+        before = baseline['results'].get(name)
+        if before is None or 'error' in before or 'error' in current:
+            continue
+        for metric in COMPARED:
+            delta = current[metric] - before[metric]
+            if delta > MIN_DELTA_MS and current[metric] > before[metric] * (1 + threshold):
+                regressions.append({'benchmark': name,
+                                    'metric': metric,
+                                    'baseline': before[metric],
+                                    'current': current[metric],
+                                    'ratio': current[metric] / before[metric]})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--accounts", type=int, default=2000)
+    parser.add_argument("--transactions", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--profile", default="durable", help="engine profile of the bench db")
+    parser.add_argument("--output", default=None, help="file to write the results JSON to")
+    parser.add_argument("--baseline", default=None, help="results JSON of an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="slowdown that counts as a regression, 0.25 is 25%%")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+
+    # Startup messages go to stderr, stdout may be the results
+    with contextlib.redirect_stdout(sys.stderr):
+        bank = BenchBank(profile=args.profile)
+    with bank:
+        start = time.perf_counter()
+        ids = seed(bank, args.users, args.accounts, args.transactions, args.seed)
+        print(f"seeded in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+        print(f"{'benchmark':>22} {'p50 ms':>9} {'p99 ms':>9} {'ops/s':>9}", file=sys.stderr)
+        results = run_suite(bank, ids, args.repeat)
+
+    report = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'users': args.users,
+            'accounts': args.accounts,
+            'transactions': args.transactions,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'profile': args.profile,
+            'bcrypt_rounds': get_hasher().rounds,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'machine': platform.machine(),
+        },
+        'results': results,
+    }
+    if baseline is not None:
+        if baseline['meta'].get('bcrypt_rounds') != report['meta']['bcrypt_rounds']:
+            print("warning: baseline used another bcrypt cost, login_user won't compare",
+                  file=sys.stderr)
+        report['regressions'] = compare(results, baseline, args.threshold)
+        for regression in report['regressions']:
+            print(f"REGRESSION {regression['benchmark']} {regression['metric']}: "
+                  f"{regression['baseline']:.3f} -> {regression['current']:.3f} ms "
+                  f"({regression['ratio']:.2f}x)", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+    if report.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
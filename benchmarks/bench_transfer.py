@@ -0,0 +1,72 @@
+"""Transfer latency vs. account history size.
+
+initiate_transaction only touches the two account rows, so latency
+should stay flat no matter how many ledger rows the accounts have.
+
+    python -m benchmarks.bench_transfer [--sizes 0 10000 100000] [--repeat 200]
+"""
+import argparse
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from benchmarks.common import BenchBank, summarize, time_calls
+from frappster.models import Account, Transaction, User, UserData
+from frappster.types import AccessRole, AccountType, TransactionType
+
+SENDER = 100001
+RECIPIENT = 100002
+
+
+def seed(bank, history_rows):
+    session = bank.db_manager.open_session()
+    user = User(login_id=1, first_name="Bench", last_name="Mark",
+                address="-", email="-", phone_number="-", password="-",
+                access_role=AccessRole.CUSTOMER)
+    session.add(user)
+    session.flush()
+    for number in (SENDER, RECIPIENT):
+        session.add(Account(clearings_number=123, account_number=number,
+                            account_type=AccountType.CHECKINGS,
+                            balance=10**9, user_id=user.id))
+    session.flush()
+
+    chunk = 10_000
+    for start in range(0, history_rows, chunk):
+        rows = [{'senders_account_number': SENDER,
+                 'recipients_account_number': RECIPIENT,
+                 'type': TransactionType.TRANSFER,
+                 'amount': 1,
+                 'date': datetime.now()}
+                for _ in range(min(chunk, history_rows - start))]
+        session.execute(insert(Transaction), rows)
+    session.commit()
+    data = UserData(**user.to_dict())
+    bank.db_manager.close_session()
+    return data
+
+
+def run(history_rows, repeat):
+    with BenchBank() as bank:
+        bank.auth_service.current_user = seed(bank, history_rows)
+        service = bank.transaction_service
+        latencies = time_calls(
+                lambda: service.initiate_transaction(SENDER, RECIPIENT, 1),
+                repeat)
+        return summarize(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'history rows':>12} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for size in args.sizes:
+        result = run(size, args.repeat)
+        print(f"{size:>12} {result['mean_ms']:>9.3f} {result['p50_ms']:>9.3f} {result['p99_ms']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import os
+import statistics
+import tempfile
+import time
+
+from frappster.auth import AuthService
+from frappster.database import DatabaseManager
+from frappster.services import AccountService, TransactionService, UserManager
+
+
+class BenchBank:
+    """Throw away database plus the services wired the way BankingApp
+    wires them. Use as a context manager so the temp dir gets removed.
+    """
+    def __init__(self, **db_kwargs) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_url = f"sqlite:///{os.path.join(self.tmp_dir.name, 'bench.db')}"
+        self.db_manager = DatabaseManager(self.db_url, **db_kwargs)
+        self.auth_service = AuthService(self.db_manager)
+        self.user_manager = UserManager(self.db_manager, self.auth_service)
+        self.account_service = AccountService(self.db_manager, self.auth_service)
+        self.transaction_service = TransactionService(self.db_manager,
+                                                      self.user_manager,
+                                                      self.auth_service,
+                                                      self.account_service)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.db_manager.engine.dispose()
+        self.tmp_dir.cleanup()
+
+
+def time_calls(func, repeat):
+    """Calls func repeat times, returns latencies in milliseconds"""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(latencies):
+    ordered = sorted(latencies)
+    return {
+        'count': len(ordered),
+        'mean_ms': statistics.fmean(ordered),
+        'p50_ms': ordered[len(ordered) // 2],
+        'p90_ms': percentile(ordered, 0.90),
+        'p99_ms': percentile(ordered, 0.99),
+        'max_ms': ordered[-1],
+        # Back to back calls from one thread
+        'ops_per_s': len(ordered) / (sum(ordered) / 1000) if sum(ordered) else 0.0,
+    }
@@ -0,0 +1,129 @@
+import hashlib
+import hmac
+import secrets
+from threading import Lock
+
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+
+from frappster.errors import NumberSpaceExhaustedError
+from frappster.models import NumberSequence
+
+FEISTEL_ROUNDS = 4
+
+
+def luhn_digit(number: int) -> int:
+    """Check digit that makes number * 10 + digit pass the Luhn check"""
+    total = 0
+    for position, digit in enumerate(reversed(str(number))):
+        if position % 2 == 0:
+            digit = int(digit) * 2
+            total += digit - 9 if digit > 9 else digit
+        else:
+            total += int(digit)
+    return (10 - total % 10) % 10
+
+
+def is_luhn_valid(number: int) -> bool:
+    return luhn_digit(number // 10) == number % 10
+
+
+def permute(index: int, size: int, key: bytes) -> int:
+    """Keyed bijection of range(size) onto itself.
+
+    A small Feistel network over the nearest even number of bits, walking
+    the cycle until the value lands back inside size. The bit domain is
+    less than 4 * size, so that's under 4 rounds on average.
+    """
+    half_bits = (max(size - 1, 1).bit_length() + 1) // 2
+    mask = (1 << half_bits) - 1
+    value = index
+    while True:
+        left, right = value >> half_bits, value & mask
+        for round_number in range(FEISTEL_ROUNDS):
+            digest = hmac.new(key, f"{round_number}:{right}".encode(), hashlib.sha256).digest()
+            left, right = right, left ^ (int.from_bytes(digest[:8], 'big') & mask)
+        value = (left << half_bits) | right
+        if value < size:
+            return value
+
+
+class NumberAllocator:
+    """Hands out unique numbers of a fixed length, like login IDs and
+    account numbers, with no retries however full the space gets.
+
+    Every process reserves block_size sequence indexes at a time with a
+    single UPDATE ... RETURNING on number_sequences, then serves them
+    from memory. An index maps to a payload of digits - 1 digits
+    (optionally permuted so numbers aren't guessable) and a Luhn check
+    digit is appended. Numbers a process reserved but never used are
+    simply skipped, they are never handed out twice.
+
+    Reservations commit on their own connection, so call next() before
+    opening a write unit of work, not inside one.
+    """
+    def __init__(self,
+                 db_manager,
+                 name: str,
+                 digits: int = 7,
+                 block_size: int = 100,
+                 permuted: bool = True) -> None:
+        self.db_manager = db_manager
+        self.name = name
+        self.block_size = block_size
+        self.permuted = permuted
+        # Payloads have no leading zero, so numbers are always digits long
+        self.low = 10 ** (digits - 2)
+        self.capacity = 9 * self.low
+        self._next = 0
+        self._end = 0
+        self._key = None
+        self._lock = Lock()
+
+    def next(self) -> int:
+        return self.take(1)[0]
+
+    def take(self, count: int) -> list:
+        """count numbers, reserving as few new blocks as needed"""
+        with self._lock:
+            indexes = []
+            while len(indexes) < count:
+                if self._next == self._end:
+                    self._reserve(max(self.block_size, count - len(indexes)))
+                taken = min(count - len(indexes), self._end - self._next)
+                indexes.extend(range(self._next, self._next + taken))
+                self._next += taken
+            return [self.number(index) for index in indexes]
+
+    def number(self, index: int) -> int:
+        if self.permuted:
+            index = permute(index, self.capacity, self._key)
+        payload = self.low + index
+        return payload * 10 + luhn_digit(payload)
+
+    def _reserve(self, size):
+        reserve = (update(NumberSequence)
+                   .where(NumberSequence.name == self.name)
+                   .values(next_value=NumberSequence.next_value + size)
+                   .returning(NumberSequence.next_value, NumberSequence.key))
+        with self.db_manager.engine.begin() as connection:
+            row = connection.execute(reserve).first()
+            if row is None:
+                row = self._create_sequence(connection, reserve)
+
+        end, key = row
+        if end > self.capacity:
+            raise NumberSpaceExhaustedError
+        self._next, self._end = end - size, end
+        self._key = key.encode()
+
+    def _create_sequence(self, connection, reserve):
+        # First use of this name, another process may be doing the same
+        try:
+            with connection.begin_nested():
+                connection.execute(insert(NumberSequence).values(name=self.name,
+                                                                 next_value=0,
+                                                                 key=secrets.token_hex(16)))
+        except IntegrityError:
+            pass
+        return connection.execute(reserve).first()
@@ -1,14 +1,11 @@
 from datetime import datetime, timedelta
 
-from sqlalchemy.exc import SQLAlchemyError
-
 from frappster.database import DatabaseManager
+from frappster.hashing import PasswordHasher, get_hasher
+from frappster.instrumentation import instrumented
 from frappster.models import User, UserData
-from frappster.types import ROLE_PERMISSIONS, AccessRole, Permissions
-from frappster.utils import (hash_password,
-                             verify_password)
-from frappster.errors import (DatabaseError,
-                              GeneralError,
+from frappster.types import ROLE_PERMISSION_MASKS, AccessRole, Permissions
+from frappster.errors import (GeneralError,
                               InvalidPasswordError,
                               InvalidPasswordOrIDError,
                               LoginTimeoutError,
@@ -23,9 +20,12 @@ class AuthService:
     """Handles user authenication &
     authorization for roll based access
     """
-    def __init__(self, db_manager:DatabaseManager) -> None:
+    def __init__(self, db_manager:DatabaseManager,
+                 hasher: PasswordHasher | None = None) -> None:
         self.current_user: UserData | None = None
         self.db_manager = db_manager
+        # Shared bcrypt pool unless told otherwise
+        self.hasher = hasher if hasher is not None else get_hasher()
         self.max_login_attempts = 3
         self.max_login_timeout_seconds = 30
 
@@ -34,8 +34,8 @@ class AuthService:
             raise UserNotLoggedInError
         return self.current_user
 
+    @instrumented
     def update_own_password(self, old_password:str, new_password:str):
-        self.db_manager.open_session()
         user = self.current_user
         if user is None:
             raise UserNotLoggedInError
@@ -43,31 +43,23 @@ class AuthService:
         if not self.has_permission(Permissions.UPDATE_OWN_USER):
             raise PermissionDeniedError
 
-        try:
+        with self.db_manager.unit_of_work(write=True):
             
-            if not verify_password(old_password, user.password):
+            if not self.hasher.verify(old_password, user.password):
                 raise InvalidPasswordError
 
-            user.password = hash_password(new_password)
-            self.db_manager.commit()
-
-        except SQLAlchemyError as e:
-            self.db_manager.rollback()
-            raise DatabaseError(f"Database error occurred: {e}")
-
-        else:
-            return True
+            user.password = self.hasher.hash(new_password)
 
-        finally:
-            self.db_manager.close_session()
+        return True
     
+    @instrumented
     def update_password(self, user_id: int, new_password:str):
         if not self.has_permission(Permissions.MANAGE_USERS):
             raise PermissionDeniedError
 
-        self.db_manager.open_session()
-        
-        try:
+        # Hashed before taking the write lock
+        hashed_password = self.hasher.hash(new_password)
+        with self.db_manager.unit_of_work(write=True):
             fetched_user = self.db_manager.get_by_login_id(user_id)
             if not isinstance(fetched_user, User):
                 raise TypeError("Fetched record is not type of User")
@@ -75,81 +67,93 @@ class AuthService:
             if fetched_user is None:
                 raise UserNotFoundError
             
-            fetched_user.password = hash_password(new_password)
-            self.db_manager.commit()
-
-        except SQLAlchemyError as e:
-            self.db_manager.rollback()
-            raise DatabaseError(f"Database error occurred: {e}")
+            fetched_user.password = hashed_password
+            self.db_manager.invalidate_user(fetched_user.login_id)
 
-        else:
-            return True
-
-        finally:
-            self.db_manager.close_session()
+        return True
 
+    @instrumented
     def login_user(self, user_id:int, password:str):
         if self.current_user is not None:
             raise GeneralError("Oh no user already logged in, but trying to login ")
 
         time_now = datetime.now()
-        self.db_manager.open_session()
         try:
-            user = self.db_manager.get_by_login_id(user_id)
-            if user is None:
-                # Generic error for login sequence
-                # print("User is None")
-                raise InvalidPasswordOrIDError
-
-            if not isinstance(user, User):
-                # Critical program error, this should be logged in error
-                # logs!
-                raise TypeError(f"Fetched record is not type of User, but of {type(user)}")
-
-
-            # 1) Last login None -> First time login
-            # 2) If login_timeout -> Raise LoginTimeOutError
-            # 3) If TooManyLoginAttempts -> Set loginTimeout to max_time
-            # Check for too many login attempts first
-            if user.login_attempts == self.max_login_attempts:
-                user.login_attempts += 1
-                self.db_manager.commit()
-                raise TooManyLoginAttemptsError
-
-            # Check if the current time is before the login timeout
-            if user.login_timeout and time_now < user.login_timeout:
-                user.login_attempts += 1
-                self.db_manager.commit()
-                raise LoginTimeoutError
-
-            if not verify_password(password, user.password):
-                user.login_attempts += 1
-                if user.login_attempts >= self.max_login_attempts:
-                    # Set the login timeout on hitting the maximum failed attempts
-                    user.login_timeout = time_now + timedelta(seconds=self.max_login_timeout_seconds)
-                self.db_manager.commit()
-                raise InvalidPasswordOrIDError("Invalid user ID or password.")
-
+            # bcrypt runs between two short transactions, holding the
+            # write lock through it would serialize every login
+            with self.db_manager.unit_of_work():
+                user = self.db_manager.get_by_login_id(user_id)
+                stored_password = user.password
+                locked_out = (user.login_attempts == self.max_login_attempts
+                              or bool(user.login_timeout and time_now < user.login_timeout))
+
+            password_ok = not locked_out and self.hasher.verify(password, stored_password)
+            new_password = None
+            if password_ok and self.hasher.needs_rehash(stored_password):
+                # Stored with an outdated cost, upgrade while we know the password
+                new_password = self.hasher.hash(password)
+
+            with self.db_manager.unit_of_work(write=True):
+                user = self.db_manager.get_by_login_id(user_id)
+                if user is None:
+                    # Generic error for login sequence
+                    # print("User is None")
+                    raise InvalidPasswordOrIDError
+
+                if not isinstance(user, User):
+                    # Critical program error, this should be logged in error
+                    # logs!
+                    raise TypeError(f"Fetched record is not type of User, but of {type(user)}")
+
+                if user.password != stored_password:
+                    # Changed while we were hashing, check against the new one
+                    password_ok = self.hasher.verify(password, user.password)
+                    new_password = None
+
+                # 1) Last login None -> First time login
+                # 2) If login_timeout -> Raise LoginTimeOutError
+                # 3) If TooManyLoginAttempts -> Set loginTimeout to max_time
+                # Failed attempts are committed before raising, the unit
+                # of work would roll them back otherwise
+                # Check for too many login attempts first
+                if user.login_attempts == self.max_login_attempts:
+                    user.login_attempts += 1
+                    self.db_manager.commit()
+                    raise TooManyLoginAttemptsError
+
+                # Check if the current time is before the login timeout
+                if user.login_timeout and time_now < user.login_timeout:
+                    user.login_attempts += 1
+                    self.db_manager.commit()
+                    raise LoginTimeoutError
+
+                if not password_ok:
+                    user.login_attempts += 1
+                    if user.login_attempts >= self.max_login_attempts:
+                        # Set the login timeout on hitting the maximum failed attempts
+                        user.login_timeout = time_now + timedelta(seconds=self.max_login_timeout_seconds)
+                    self.db_manager.commit()
+                    raise InvalidPasswordOrIDError("Invalid user ID or password.")
+
+                # Successful login
+                if new_password is not None:
+                    user.password = new_password
+                user.login_attempts = 0
+                user.login_timeout = None
+                user.last_login = time_now
+                user_data = UserData(**user.to_dict())
+                # Login bookkeeping isn't part of the snapshot, only
+                # the fresh profile data is worth caching
+                self.db_manager.cache_user(user_data)
 
         except UserNotFoundError as e:
             # Log error? not show details
             raise InvalidPasswordOrIDError
 
-        except SQLAlchemyError as e:
-            self.db_manager.rollback()
-            raise DatabaseError(f"Database error occurred: {e}")
-
         else:
-            # Successful login
-            user.login_attempts = 0
-            user.login_timeout = None
-            user.last_login = time_now
-            self.current_user = UserData(**user.to_dict())
-            self.db_manager.commit()
-
-        finally:
-            self.db_manager.close_session()
+            self.current_user = user_data
 
+    @instrumented
     def logout_user(self, user_id: int | None = None):
         if user_id is None:
             # normal user logout
@@ -177,10 +181,14 @@ class AuthService:
         return False
 
     def has_permission(self, permission:Permissions) -> bool:
+        return self.has_any_permission(1 << permission.value)
+
+    def has_any_permission(self, mask:int) -> bool:
+        """mask from types.permission_mask, true if the user has
+        atleast one of the permissions in it"""
         user = self.current_user
         if user is not None:
-            if permission in ROLE_PERMISSIONS.get(user.access_role, []):
-                return True
+            return bool(ROLE_PERMISSION_MASKS.get(user.access_role, 0) & mask)
 
         return False
 
@@ -0,0 +1,117 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class LRUCache:
+    """Small thread safe least recently used cache.
+
+    Holds at most maxsize entries, the least recently used one is
+    evicted first. With ttl (seconds) entries also expire that long
+    after they were set. Hits, misses, evictions & expirations are
+    counted, see stats().
+    """
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+    def __len__(self):
+        return len(self._data)
+
+
+class AccountCache:
+    """Accounts of one logged in user, kept in memory for a session.
+
+    TransactionService writes the balances it just committed straight
+    into it (apply), refresh_accounts catches up on changes made
+    elsewhere with a delta query on updated_at. Every entry carries the
+    account version so an older balance never overwrites a newer one.
+    """
+    def __init__(self) -> None:
+        self._accounts = {}
+        self._lock = Lock()
+        # Highest updated_at seen, as stored. None until the first load
+        self.watermark = None
+
+    def merge(self, rows):
+        """Takes (AccountData, updated_at) rows from a (delta) query"""
+        with self._lock:
+            for account, updated_at in rows:
+                cached = self._accounts.get(account.account_number)
+                if cached is None or account.version >= cached.version:
+                    self._accounts[account.account_number] = account
+                if self.watermark is None or updated_at > self.watermark:
+                    self.watermark = updated_at
+
+    def apply(self, account_number, balance, version):
+        """Balance written by a committed transaction. Accounts that
+        aren't cached, like the recipient of a transfer, are skipped.
+        """
+        with self._lock:
+            account = self._accounts.get(int(account_number))
+            if account is not None and version > account.version:
+                account.balance = balance
+                account.version = version
+
+    def accounts(self) -> list:
+        with self._lock:
+            return sorted(self._accounts.values(), key=lambda account: account.id)
+
+    def clear(self):
+        with self._lock:
+            self._accounts.clear()
+            self.watermark = None
+
+    def __contains__(self, account_number):
+        return int(account_number) in self._accounts
+
+    def __len__(self):
+        return len(self._accounts)
@@ -1,14 +1,121 @@
+import os
 from abc import ABC, abstractmethod
-from typing import List, Optional, Type, Union
+from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal
+from threading import Lock
+from typing import Iterator, List, Optional, Type, Union
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import joinedload, sessionmaker
+from sqlalchemy import (Numeric, String, case, create_engine, event,
+                        func, insert, literal, make_url, select, tuple_, type_coerce,
+                        union_all, update)
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.orm import (load_only, raiseload, scoped_session,
+                            selectinload, sessionmaker)
 from sqlalchemy.orm.session import Session
-from frappster.errors import AccountNotFoundError, UserNotFoundError
+from frappster.errors import (AccountNotFoundError,
+                              ConcurrentUpdateError,
+                              DatabaseError,
+                              InsufficientFundsError,
+                              UserNotFoundError)
 
-from frappster.models import Account, BaseModel, Transaction, User
-from frappster.types import AccessRole
-from frappster.utils import hash_password
+from frappster.allocator import NumberAllocator
+from frappster.cache import LRUCache
+from frappster.instrumentation import QueryInstrumentation
+from frappster.migrations import SCHEMA_VERSION, get_schema_version, migrate
+from frappster.models import Account, BaseModel, Transaction, User, UserData
+from frappster.tracing import span
+from frappster.types import TransactionType
+
+# Engine tuning per deployment, picked with DatabaseManager(profile=...)
+# or the FRAPPSTER_DB_PROFILE env var. pragmas are set on every new
+# sqlite connection, pool sizes apply to file databases.
+#   durable: WAL so readers don't block the writer, fsync on every commit
+#   fast:    WAL + synchronous=NORMAL, a crash can lose the last commits
+#            but never corrupts, bigger cache & mmap
+#   bench:   no fsync at all, only for throw away benchmark databases
+ENGINE_PROFILES = {
+    'durable': {
+        'pragmas': {'journal_mode': "WAL",
+                    'synchronous': "FULL",
+                    'busy_timeout': 5000,
+                    'cache_size': -16000,
+                    'mmap_size': 0,
+                    },
+        'pool_size': 5,
+        'max_overflow': 10,
+    },
+    'fast': {
+        'pragmas': {'journal_mode': "WAL",
+                    'synchronous': "NORMAL",
+                    'busy_timeout': 5000,
+                    'cache_size': -64000,
+                    'mmap_size': 256 * 1024 * 1024,
+                    'temp_store': "MEMORY",
+                    },
+        'pool_size': 10,
+        'max_overflow': 20,
+    },
+    'bench': {
+        'pragmas': {'journal_mode': "WAL",
+                    'synchronous': "OFF",
+                    'busy_timeout': 10000,
+                    'cache_size': -256000,
+                    'mmap_size': 1024 * 1024 * 1024,
+                    'temp_store': "MEMORY",
+                    },
+        'pool_size': 20,
+        'max_overflow': 20,
+    },
+}
+
+DEFAULT_ENGINE_PROFILE = 'durable'
+
+def _sqlite_on_connect(pragmas):
+    def on_connect(dbapi_connection, connection_record):
+        # Stop pysqlite from issuing its own (deferred) BEGIN,
+        # _sqlite_on_begin emits it instead
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma, value in pragmas.items():
+            cursor.execute(f"PRAGMA {pragma}={value}")
+        cursor.close()
+    return on_connect
+
+def _sqlite_on_begin(conn):
+    conn.exec_driver_sql(conn.get_execution_options().get('sqlite_begin', "BEGIN"))
+
+def _date_bound(value):
+    """A start/end bound as the text Transaction.date is stored as.
+
+    Rows stamped by CURRENT_TIMESTAMP are 'YYYY-MM-DD HH:MM:SS' (UTC),
+    rows from python datetimes have a .ffffff fraction too. The bound
+    only gets one when it has one, so comparing the raw text puts rows
+    of either kind at exactly the bound on the right side of it, and
+    the (account, date, id) indexes still serve the range.
+    """
+    if isinstance(value, datetime):
+        timespec = "microseconds" if value.microsecond else "seconds"
+        return value.isoformat(" ", timespec)
+    return str(value)
+
+def _in_date_range(stmt, start=None, end=None):
+    date_key = type_coerce(Transaction.date, String)
+    if start is not None:
+        stmt = stmt.where(date_key >= _date_bound(start))
+    if end is not None:
+        stmt = stmt.where(date_key < _date_bound(end))
+    return stmt
+
+def _is_conflict(error):
+    """Lost a race for a row (stale version) or for the sqlite write lock"""
+    if isinstance(error, StaleDataError):
+        return True
+    if isinstance(error, OperationalError):
+        message = str(error.orig).lower()
+        return "locked" in message or "busy" in message
+    return False
 
 class AbstractDatabaseManager(ABC):
     @abstractmethod
@@ -23,6 +130,12 @@ class AbstractDatabaseManager(ABC):
     def close_session(self):
         pass
 
+    @abstractmethod
+    def unit_of_work(self, write: bool = False) -> Iterator[Session]:
+        """Context managed session, commits on success,
+        rolls back on any error & always closes"""
+        pass
+
     @abstractmethod
     def commit(self):
         pass
@@ -72,46 +185,136 @@ class AbstractDatabaseManager(ABC):
         pass
 
 class DatabaseManager(AbstractDatabaseManager):
-    def __init__(self, db_url="sqlite:///test.db", echo=False):
-        self.engine = create_engine(db_url, echo=echo)
-        BaseModel.metadata.create_all(self.engine) 
-        self.Session = sessionmaker(bind=self.engine)
-        self.create_super_admin()
-
-    def create_super_admin(self):
-        self.open_session()
-        admin_count = self.session.query(User).filter_by(access_role=AccessRole.ADMIN).count()
-
-        if admin_count == 0:
-            super_admin = User(
-                login_id=42069,  
-                first_name="Anorak",
-                last_name="Watts",
-                email="superadmin@cli-banksystem.se",
-                phone_number="4324134232",
-                address="FERTISILE 32 st",
-                password=hash_password("secure"),
-                access_role=AccessRole.ADMIN
-            )
-            self.session.add(super_admin)
+    # Named loader strategies, each caller asks only for what it needs.
+    # Relationships that a profile doesn't load raise instead of
+    # silently lazy loading one query at a time.
+    LOAD_PROFILES = {
+        # User row alone, enough to check a password or update fields
+        'auth': (raiseload('*'),),
+        # User plus its accounts, in a second query instead of a join
+        'user_with_accounts': (selectinload(User.accounts).raiseload('*'),
+                               raiseload('*')),
+        # Just what deposits & withdrawals read and write
+        'balance_only': (load_only(Account.id,
+                                   Account.account_number,
+                                   Account.user_id,
+                                   Account.balance,
+                                   Account.version),
+                         raiseload('*')),
+        # Account row alone, history is fetched with get_history_page
+        'account_with_history_page': (raiseload('*'),),
+    }
+
+    def __init__(self, db_url="sqlite:///test.db", echo=False, profile=None,
+                 user_cache_size=1024, user_cache_ttl=60.0, slow_query_ms=None):
+        if profile is None:
+            profile = os.environ.get("FRAPPSTER_DB_PROFILE", DEFAULT_ENGINE_PROFILE)
+        if profile not in ENGINE_PROFILES:
+            raise ValueError(f"Unknown engine profile: {profile}")
+        self.profile = profile
+        settings = ENGINE_PROFILES[profile]
+
+        url = make_url(db_url)
+        is_sqlite = url.get_backend_name() == "sqlite"
+        engine_kwargs = {}
+        if not is_sqlite or url.database not in (None, "", ":memory:"):
+            engine_kwargs['pool_size'] = settings['pool_size']
+            engine_kwargs['max_overflow'] = settings['max_overflow']
+
+        self.engine = create_engine(url, echo=echo, **engine_kwargs)
+        if is_sqlite:
+            event.listen(self.engine, "connect", _sqlite_on_connect(settings['pragmas']))
+            event.listen(self.engine, "begin", _sqlite_on_begin)
+        # Up to date databases skip create_all & the migrations, a cold
+        # start of the cli is then one query here
+        with self.engine.connect() as connection:
+            schema_version = get_schema_version(connection)
+        if schema_version < SCHEMA_VERSION:
+            BaseModel.metadata.create_all(self.engine)
+            migrate(self.engine)
+        # One session per thread, so concurrent service calls never
+        # share (or close) each others session
+        self.Session = scoped_session(sessionmaker(bind=self.engine))
+        # Queries, rows & time per instrumented service call, slow
+        # query & N+1 warnings on the frappster.instrumentation logger
+        self.instrumentation = QueryInstrumentation(self.engine,
+                                                    self.Session.session_factory,
+                                                    slow_query_ms)
+        # UserData snapshots by login_id, see get_user_data
+        self.user_cache = LRUCache(user_cache_size, user_cache_ttl)
+        self._allocators = {}
+        self._allocators_lock = Lock()
+
+    @property
+    def session(self) -> Session:
+        """The calling threads current session"""
+        return self.Session()
+
+    @contextmanager
+    def unit_of_work(self, write=False):
+        """Runs the block in the calling threads session & transaction.
+
+        Commits when the block finishes, rolls back on any exception and
+        turns SQLAlchemy errors into DatabaseError (ConcurrentUpdateError
+        when it lost a race, see utils.retry_on_conflict), then closes the
+        session. write=True takes the sqlite write lock up front (BEGIN
+        IMMEDIATE), so read-then-write blocks can't deadlock each other.
+        A unit of work opened inside another one joins the outer one.
+        """
+        if self.Session.registry.has() and self.session.in_transaction():
             try:
-                self.commit()
-                print("Super admin account created.")
-            except Exception as e:
-                print(f"Error creating super admin: {e}")
-                self.rollback()
-            finally:
-                self.close_session()
+                yield self.session
+            except SQLAlchemyError as e:
+                if _is_conflict(e):
+                    raise ConcurrentUpdateError from e
+                raise DatabaseError(f"Database error occurred: {e}") from e
+            return
+
+        session = self.open_session()
+        try:
+            if write:
+                session.connection(execution_options={'sqlite_begin': "BEGIN IMMEDIATE"})
+            yield session
+            with span("COMMIT", "sql"):
+                session.commit()
+            callbacks = session.info.pop('after_commit', [])
+        except SQLAlchemyError as e:
+            session.rollback()
+            if _is_conflict(e):
+                raise ConcurrentUpdateError from e
+            raise DatabaseError(f"Database error occurred: {e}") from e
+        except BaseException:
+            session.rollback()
+            raise
+        finally:
+            self.close_session()
+
+        for callback in callbacks:
+            callback()
+
+    def number_allocator(self, name) -> NumberAllocator:
+        """The NumberAllocator for name ('login_id', 'account_number'),
+        shared by everything using this manager so they share blocks"""
+        with self._allocators_lock:
+            if name not in self._allocators:
+                self._allocators[name] = NumberAllocator(self, name)
+            return self._allocators[name]
+
+    def after_commit(self, callback):
+        """Calls callback once the current unit of work has committed,
+        right away when there is none. Dropped if it rolls back.
+        For caches that must only ever see durable writes.
+        """
+        if self.Session.registry.has() and self.session.in_transaction():
+            self.session.info.setdefault('after_commit', []).append(callback)
         else:
-            print("Super admin account already exists.")
+            callback()
 
     def open_session(self):
-        self.session = self.Session()
-        return self.session
+        return self.Session()
 
     def close_session(self):
-        if self.session is not None:
-            self.session.close()
+        self.Session.remove()
 
     def commit(self):
         self.session.commit()
@@ -128,23 +331,233 @@ class DatabaseManager(AbstractDatabaseManager):
     def get_by_id(self, model, model_id):
         return self.session.query(model).get(model_id)
 
-    def get_by_login_id(self, login_id):
-        user = self.session.query(User).options(joinedload('*')).filter_by(login_id=login_id).first()
+    def get_by_login_id(self, login_id, profile='auth'):
+        user = self.session.query(User).options(*self.LOAD_PROFILES[profile]).filter_by(login_id=login_id).first()
         if user is None:
             raise UserNotFoundError
         return user
 
-    def get_by_account_number(self, account_number):
-        account = self.session.query(Account).options(joinedload('*')).filter(Account.account_number == account_number).first()
+    def get_user_data(self, login_id) -> UserData:
+        """UserData snapshot of a user, read through the user cache.
+        Never use it for login decisions, the snapshot holds no password
+        or login attempts, login_user reads those from the row itself.
+        """
+        user_data = self.user_cache.get(str(login_id))
+        if user_data is None:
+            user = self.get_by_login_id(login_id)
+            user_data = UserData(**user.to_dict())
+            self.cache_user(user_data)
+        return user_data
+
+    def cache_user(self, user_data: UserData):
+        # Only once committed, the snapshot may hold this transactions writes
+        self.after_commit(lambda: self.user_cache.set(str(user_data.login_id), user_data))
+
+    def invalidate_user(self, login_id):
+        """Drops a cached snapshot, call it from anything writing to a user.
+        Dropped again after commit, in case a reader cached the old row
+        in between.
+        """
+        self.user_cache.delete(str(login_id))
+        self.after_commit(lambda: self.user_cache.delete(str(login_id)))
+
+    def get_accounts_by_user_id(self, user_id, profile='account_with_history_page'):
+        return self.session.query(Account).options(*self.LOAD_PROFILES[profile]).filter(Account.user_id == user_id).order_by(Account.id).all()
+
+    def get_account_changes(self, user_id, since=None):
+        """(Account, updated_at as stored) rows of a user, only those
+        updated at or after since when given. since is a stored updated_at
+        from an earlier call, compared as the raw string like the history
+        cursor.
+        """
+        updated_key = type_coerce(Account.updated_at, String)
+        query = self.session.query(Account, updated_key).options(raiseload('*')).filter(Account.user_id == user_id)
+        if since is not None:
+            query = query.filter(updated_key >= since)
+        return query.order_by(Account.id).all()
+
+    def get_by_account_number(self, account_number, profile='balance_only'):
+        account = self.session.query(Account).options(*self.LOAD_PROFILES[profile]).filter(Account.account_number == account_number).first()
         if account is None:
             raise AccountNotFoundError
         return account
 
-    def get_transactions_by_account_number(self, account_number):
-        account = self.session.query(Account).options(joinedload('*')).filter(Account.account_number == account_number).first()
-        if account is None:
+    def get_account_owner(self, account_number):
+        """Fetches only (account_number, user_id) of an account.
+        No relationships are loaded, used on the money moving hot paths.
+        """
+        row = self.session.execute(
+                select(Account.account_number, Account.user_id)
+                .where(Account.account_number == account_number)
+                ).first()
+        if row is None:
+            raise AccountNotFoundError
+        return row
+
+    def transfer_funds(self, senders_account_number, recipients_account_number, amount):
+        """Moves amount between two accounts inside the current session.
+
+        The debit is a guarded UPDATE ... WHERE balance >= :amount so the
+        funds check & the write are one statement, then the credit and a
+        single ledger insert follow. Caller commits or rolls back.
+        Returns the (balance, version) both accounts were left with.
+        """
+        debited = self.session.execute(
+                update(Account)
+                .where(Account.account_number == senders_account_number,
+                       Account.balance >= amount)
+                .values(balance=Account.balance - amount,
+                        version=Account.version + 1)
+                .returning(Account.balance, Account.version)
+                .execution_options(synchronize_session=False)
+                ).first()
+        if debited is None:
+            raise InsufficientFundsError
+
+        credited = self.session.execute(
+                update(Account)
+                .where(Account.account_number == recipients_account_number)
+                .values(balance=Account.balance + amount,
+                        version=Account.version + 1)
+                .returning(Account.balance, Account.version)
+                .execution_options(synchronize_session=False)
+                ).first()
+        if credited is None:
             raise AccountNotFoundError
-        transactions = self.session.query(Transaction).options(joinedload('*')).filter(Transaction.senders_account_number == account_number).all()
+
+        self.session.execute(
+                insert(Transaction).values(
+                    senders_account_number=senders_account_number,
+                    recipients_account_number=recipients_account_number,
+                    amount=amount,
+                    type=TransactionType.TRANSFER)
+                )
+        return debited, credited
+
+    def lock_accounts(self, account_numbers, chunk_size=500):
+        """Reads (account_number, user_id, balance) of many accounts at
+        once, in account number order so concurrent batches always lock
+        rows in the same order. Returns {account_number: row}.
+        """
+        numbers = sorted(set(account_numbers))
+        accounts = {}
+        for start in range(0, len(numbers), chunk_size):
+            rows = self.session.execute(
+                    select(Account.account_number, Account.user_id, Account.balance)
+                    .where(Account.account_number.in_(numbers[start:start + chunk_size]))
+                    .order_by(Account.account_number)
+                    .with_for_update()
+                    )
+            for row in rows:
+                accounts[row.account_number] = row
+        return accounts
+
+    def apply_balance_deltas(self, deltas, chunk_size=500):
+        """Adds {account_number: delta} to the balances, one UPDATE per
+        chunk_size accounts with the deltas in a CASE. Returns the
+        (account_number, balance, version) every account was left with,
+        in account number order."""
+        accounts = Account.__table__
+        numbers = sorted(deltas)
+        changed = []
+        # sqlite has no RETURNING for executemany, a CASE keeps it one
+        # statement per chunk all the same
+        for start in range(0, len(numbers), chunk_size):
+            chunk = numbers[start:start + chunk_size]
+            delta = case({number: literal(deltas[number], Numeric()) for number in chunk},
+                         value=accounts.c.account_number)
+            changed += self.session.execute(
+                    update(accounts)
+                    .where(accounts.c.account_number.in_(chunk))
+                    .values(balance=accounts.c.balance + delta,
+                            version=accounts.c.version + 1)
+                    .returning(accounts.c.account_number,
+                               accounts.c.balance,
+                               accounts.c.version)
+                    ).all()
+        return sorted(changed)
+
+    def insert_ledger_rows(self, rows):
+        """Inserts many transaction rows (dicts of column values)
+        with a single executemany"""
+        if rows:
+            self.session.execute(insert(Transaction.__table__), rows)
+
+    def get_history_page(self, account_number, limit=None, cursor=None,
+                         start=None, end=None):
+        """Keyset paginated history of an account, newest first.
+
+        Sent & received sides are each an ordered, limited select that
+        UNION ALL merges, so a page costs the same no matter how long
+        the history is. cursor is the (date_key, id) of the last row of
+        the previous page, start/end are an inclusive/exclusive date range
+        in UTC, the time CURRENT_TIMESTAMP stamps rows with. Returns rows with a date_key column to build the next cursor from.
+        """
+        # Raw stored date string, compared as is so rows written by
+        # CURRENT_TIMESTAMP & by python datetimes order the same way
+        date_key = type_coerce(Transaction.date, String)
+
+        def one_side(column):
+            stmt = select(Transaction.id,
+                          Transaction.senders_account_number,
+                          Transaction.recipients_account_number,
+                          Transaction.type,
+                          Transaction.amount,
+                          Transaction.date,
+                          date_key.label('date_key')
+                          ).where(column == account_number)
+            stmt = _in_date_range(stmt, start, end)
+            if cursor is not None:
+                stmt = stmt.where(tuple_(date_key, Transaction.id) < tuple_(*cursor))
+            stmt = stmt.order_by(Transaction.date.desc(), Transaction.id.desc())
+            if limit is not None:
+                stmt = stmt.limit(limit)
+            return select(stmt.subquery())
+
+        history = union_all(one_side(Transaction.senders_account_number),
+                            one_side(Transaction.recipients_account_number)
+                            ).subquery()
+        stmt = select(history).order_by(history.c.date_key.desc(),
+                                        history.c.id.desc())
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        return self.session.execute(stmt).all()
+
+    def stream_statement(self, account_number, start=None, end=None, chunk_size=1000):
+        """Iterates an accounts transactions oldest first, chunk_size rows
+        fetched at a time so memory stays flat however long the history.
+        Both sides come ordered off their (account, date, id) index and
+        sqlite merges them, no sort of the whole history. start/end are
+        UTC, like get_history_page.
+        """
+        def one_side(column):
+            stmt = select(Transaction.id,
+                          Transaction.senders_account_number,
+                          Transaction.recipients_account_number,
+                          Transaction.type,
+                          Transaction.amount,
+                          Transaction.date
+                          ).where(column == account_number)
+            return _in_date_range(stmt, start, end)
+
+        stmt = union_all(one_side(Transaction.senders_account_number),
+                         one_side(Transaction.recipients_account_number)
+                         ).order_by('date', 'id')
+        return self.session.execute(stmt.execution_options(yield_per=chunk_size))
+
+    def get_net_movement(self, account_number, since=None):
+        """Received minus sent by an account, from since (UTC) on when given"""
+        def total(column):
+            stmt = select(func.coalesce(func.sum(Transaction.amount), 0)).where(column == account_number)
+            stmt = _in_date_range(stmt, since)
+            return Decimal(str(self.session.execute(stmt).scalar()))
+
+        return (total(Transaction.recipients_account_number)
+                - total(Transaction.senders_account_number))
+
+    def get_transactions_by_account_number(self, account_number):
+        account = self.get_account_owner(account_number)
+        transactions = self.session.query(Transaction).filter(Transaction.senders_account_number == account.account_number).all()
         return transactions
 
     def get_all(self, model):
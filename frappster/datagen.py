@@ -0,0 +1,216 @@
+import hashlib
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, func, insert, select, update
+
+from frappster.database import DatabaseManager
+from frappster.models import Account, NumberSequence, Transaction, User
+from frappster.types import AccessRole, AccountType, TransactionType
+from frappster.utils import hash_password
+
+FIRST_NAMES = ["Alice", "Bob", "Carla", "David", "Elin", "Farid", "Greta", "Hugo",
+               "Ines", "Jonas", "Karin", "Leo", "Maja", "Nils", "Olga", "Per",
+               "Rut", "Sven", "Tilde", "Ulf", "Vera", "William", "Yasmin", "Zoran"]
+LAST_NAMES = ["Andersson", "Berg", "Carlsson", "Dahl", "Ek", "Forsberg", "Gustafsson",
+              "Holm", "Isaksson", "Johansson", "Karlsson", "Lind", "Magnusson",
+              "Nilsson", "Olsson", "Persson", "Lundqvist", "Svensson", "Wallin"]
+STREETS = ["Storgatan", "Kungsgatan", "Drottninggatan", "Elm Street", "Parkvagen",
+           "Skolgatan", "Sjovagen", "Bruksgatan"]
+
+# (type, weight), how accounts & ledger rows are mixed
+ACCOUNT_TYPES = [(AccountType.CHECKINGS, 6), (AccountType.SAVINGS, 3), (AccountType.BUSINESS, 1)]
+TRANSACTION_TYPES = [(TransactionType.TRANSFER, 80), (TransactionType.DEPOSIT, 12),
+                     (TransactionType.WITHDRAW, 8)]
+# One employee per this many users, everyone else is a customer
+USERS_PER_EMPLOYEE = 200
+
+
+class DataGenerator:
+    """Fills a database with synthetic users, accounts & transactions
+    for load tests and benchmarks.
+
+    Everything is written with bulk inserts batch_size rows at a time,
+    so memory only holds the balances. A fraction hot_accounts of the
+    accounts takes part in hot_share of all transactions, which gives
+    them the long histories busy accounts have in production. Every
+    account is funded by an opening DEPOSIT and balances always match
+    the ledger, nobody ever sends or withdraws more than they have.
+
+    The same seed on a fresh database gives the same rows, down to the
+    login IDs and account numbers. Only the password hash, one for all
+    users, is salted anew.
+    """
+    def __init__(self,
+                 db_manager: DatabaseManager,
+                 seed: int = 0,
+                 hot_accounts: float = 0.01,
+                 hot_share: float = 0.5,
+                 password: str = "password",
+                 start: datetime = datetime(2020, 1, 1),
+                 days: int = 3 * 365,
+                 batch_size: int = 50_000) -> None:
+        self.db_manager = db_manager
+        self.seed = seed
+        self.hot_accounts = hot_accounts
+        self.hot_share = hot_share
+        self.password = password
+        self.start = start
+        self.days = days
+        self.batch_size = batch_size
+        self.rng = random.Random(seed)
+
+    def generate(self, users: int, accounts: int, transactions: int,
+                 on_progress=None) -> dict:
+        """Creates users, then accounts owned by random users, then
+        transactions between those accounts on top of one opening
+        deposit per account. on_progress(table, rows) is called after
+        every committed batch. Returns the login IDs & account numbers
+        that were created.
+        """
+        if accounts and not users:
+            raise ValueError("accounts need at least one user to own them")
+        if transactions and not accounts:
+            raise ValueError("transactions need at least one account")
+
+        self._seed_sequences()
+        login_ids = self.db_manager.number_allocator('login_id').take(users)
+        account_numbers = self.db_manager.number_allocator('account_number').take(accounts)
+        user_ids = self._insert_users(login_ids, on_progress)
+        self._insert_accounts(account_numbers, user_ids, on_progress)
+        balances = self._insert_transactions(account_numbers, transactions, on_progress)
+        self._set_balances(account_numbers, balances)
+        return {'login_ids': login_ids, 'account_numbers': account_numbers}
+
+    def _seed_sequences(self):
+        # Number sequences keyed off the seed, so the permuted numbers
+        # repeat. Sequences already in use keep their key.
+        with self.db_manager.unit_of_work(write=True) as session:
+            existing = set(session.execute(select(NumberSequence.name)).scalars())
+            for name in ('login_id', 'account_number'):
+                if name not in existing:
+                    key = hashlib.sha256(f"{self.seed}:{name}".encode()).hexdigest()[:32]
+                    session.add(NumberSequence(name=name, next_value=0, key=key))
+
+    def _insert_users(self, login_ids, on_progress):
+        password = hash_password(self.password)
+        with self.db_manager.unit_of_work() as session:
+            before = session.execute(select(func.coalesce(func.max(User.id), 0))).scalar()
+
+        rng = self.rng
+        for start in range(0, len(login_ids), self.batch_size):
+            rows = []
+            for number, login_id in enumerate(login_ids[start:start + self.batch_size], start):
+                first_name = rng.choice(FIRST_NAMES)
+                last_name = rng.choice(LAST_NAMES)
+                rows.append({
+                    'login_id': login_id,
+                    'first_name': first_name,
+                    'middle_name': None,
+                    'last_name': last_name,
+                    'address': f"{rng.choice(STREETS)} {rng.randint(1, 150)}",
+                    'email': f"{first_name}.{last_name}{number}@example.com".lower(),
+                    'phone_number': f"07{rng.randint(0, 99_999_999):08d}",
+                    'password': password,
+                    'access_role': (AccessRole.EMPLOYEE if number % USERS_PER_EMPLOYEE == 0
+                                    else AccessRole.CUSTOMER),
+                })
+            with self.db_manager.unit_of_work(write=True) as session:
+                session.execute(insert(User.__table__), rows)
+            if on_progress is not None:
+                on_progress('users', start + len(rows))
+
+        with self.db_manager.unit_of_work() as session:
+            return session.execute(select(User.id)
+                                   .where(User.id > before)
+                                   .order_by(User.id)).scalars().all()
+
+    def _insert_accounts(self, account_numbers, user_ids, on_progress):
+        rng = self.rng
+        types, weights = zip(*ACCOUNT_TYPES)
+        for start in range(0, len(account_numbers), self.batch_size):
+            batch = account_numbers[start:start + self.batch_size]
+            rows = [{'clearings_number': 123,
+                     'account_number': account_number,
+                     'account_type': account_type,
+                     'balance': 0,
+                     'user_id': rng.choice(user_ids)}
+                    for account_number, account_type
+                    in zip(batch, rng.choices(types, weights, k=len(batch)))]
+            with self.db_manager.unit_of_work(write=True) as session:
+                session.execute(insert(Account.__table__), rows)
+            if on_progress is not None:
+                on_progress('accounts', start + len(rows))
+
+    def _insert_transactions(self, account_numbers, transactions, on_progress):
+        """Writes the ledger and returns every accounts balance in cents"""
+        rng = self.rng
+        accounts = len(account_numbers)
+        hot = max(1, int(accounts * self.hot_accounts)) if accounts else 0
+        balances = [round(rng.lognormvariate(9, 1.5)) for _ in range(accounts)]
+
+        def pick():
+            if rng.random() < self.hot_share:
+                return rng.randrange(hot)
+            return rng.randrange(accounts)
+
+        def rows():
+            for index, cents in enumerate(balances):
+                yield None, account_numbers[index], TransactionType.DEPOSIT, cents, self.start
+
+            step = timedelta(days=self.days) / max(transactions, 1)
+            types, weights = zip(*TRANSACTION_TYPES)
+            kinds = iter(())
+            for number in range(transactions):
+                if number % self.batch_size == 0:
+                    kinds = iter(rng.choices(types, weights, k=self.batch_size))
+                kind = next(kinds)
+                date = self.start + step * (number + 1)
+                cents = max(1, round(rng.lognormvariate(7, 1.2)))
+                sender = pick()
+                if kind is TransactionType.DEPOSIT or balances[sender] < cents:
+                    recipient = pick()
+                    balances[recipient] += cents
+                    yield None, account_numbers[recipient], TransactionType.DEPOSIT, cents, date
+                elif kind is TransactionType.WITHDRAW or accounts == 1:
+                    balances[sender] -= cents
+                    yield account_numbers[sender], None, TransactionType.WITHDRAW, cents, date
+                else:
+                    recipient = pick()
+                    while recipient == sender:
+                        recipient = pick()
+                    balances[sender] -= cents
+                    balances[recipient] += cents
+                    yield account_numbers[sender], account_numbers[recipient], kind, cents, date
+
+        written = 0
+        batch = []
+        for sender, recipient, kind, cents, date in rows():
+            batch.append({'senders_account_number': sender,
+                          'recipients_account_number': recipient,
+                          'type': kind,
+                          'amount': cents / 100,
+                          'date': date})
+            if len(batch) == self.batch_size:
+                written = self._write_transactions(batch, written, on_progress)
+                batch = []
+        if batch:
+            self._write_transactions(batch, written, on_progress)
+        return balances
+
+    def _write_transactions(self, batch, written, on_progress):
+        with self.db_manager.unit_of_work(write=True) as session:
+            session.execute(insert(Transaction.__table__), batch)
+        written += len(batch)
+        if on_progress is not None:
+            on_progress('transactions', written)
+        return written
+
+    def _set_balances(self, account_numbers, balances):
+        table = Account.__table__
+        with self.db_manager.unit_of_work(write=True) as session:
+            session.execute(update(table)
+                            .where(table.c.account_number == bindparam('number'))
+                            .values(balance=bindparam('balance')),
+                            [{'number': number, 'balance': cents / 100}
+                             for number, cents in zip(account_numbers, balances)])
@@ -10,6 +10,26 @@ class AccountNotFoundError(Exception):
     def __str__(self):
         return "The specified account could not be found. Please check the account details."
 
+class ConcurrentUpdateError(Exception):
+    def __str__(self):
+        return "The account was changed at the same time by someone else. Please try again."
+
+class IdempotencyKeyReusedError(Exception):
+    def __str__(self):
+        return "This request key was already used for a different request."
+
+class InvalidRowError(Exception):
+    def __init__(self, reason: str) -> None:
+        super().__init__(reason)
+        self.reason = reason
+
+    def __str__(self):
+        return f"Invalid row: {self.reason}"
+
+class NumberSpaceExhaustedError(Exception):
+    def __str__(self):
+        return "No free numbers left to hand out."
+
 class GeneralError(Exception):
     def __str__(self):
         return "An unexpected error occurred. Please try again later."
@@ -0,0 +1,128 @@
+import math
+import os
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from threading import Lock
+
+import bcrypt
+
+from frappster.tracing import span
+
+# Calibration never goes below bcrypt's recommended floor or above a
+# cost that makes a login take seconds. FRAPPSTER_BCRYPT_ROUNDS skips
+# calibration and is taken as is, tests use it to run at cost 4.
+MIN_ROUNDS = 10
+MAX_ROUNDS = 16
+DEFAULT_TARGET_MS = 250.0
+
+
+def _hash(password: str, rounds: int) -> str:
+    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds))
+    return hashed.decode('utf-8')
+
+
+def _verify(password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'),
+                          hashed_password.encode('utf-8'))
+
+
+def hash_rounds(hashed_password: str) -> int:
+    """Cost factor a hash was made with, $2b$<rounds>$..."""
+    return int(hashed_password.split('$')[2])
+
+
+def calibrate_rounds(target_ms: float = DEFAULT_TARGET_MS) -> int:
+    """Highest cost whose hash takes about target_ms on this machine.
+    Each extra round doubles the work, so one timing at a cheap cost
+    is enough to extrapolate from.
+    """
+    probe_rounds = 8
+    elapsed = min(_timed_hash(probe_rounds) for _ in range(3))
+    rounds = probe_rounds + round(math.log2(target_ms / 1000 / elapsed))
+    return max(MIN_ROUNDS, min(MAX_ROUNDS, rounds))
+
+
+def _timed_hash(rounds):
+    start = time.perf_counter()
+    _hash("calibration", rounds)
+    return time.perf_counter() - start
+
+
+class PasswordHasher:
+    """bcrypt hashing & verification on a worker pool.
+
+    bcrypt releases the GIL, so a thread pool runs as many hashes at
+    once as there are cores. Any Executor can be passed instead, like
+    a ProcessPoolExecutor. Without rounds the cost is calibrated to
+    take about target_ms per hash. Hashes made with a lower cost than
+    the current one need a rehash, see needs_rehash.
+    """
+    def __init__(self,
+                 rounds: int | None = None,
+                 target_ms: float = DEFAULT_TARGET_MS,
+                 workers: int | None = None,
+                 executor: Executor | None = None) -> None:
+        if rounds is None:
+            rounds = calibrate_rounds(target_ms)
+        self.rounds = rounds
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count(),
+                                          thread_name_prefix="frappster-bcrypt")
+        self.executor = executor
+
+    def submit_hash(self, password: str) -> Future:
+        return self.executor.submit(_hash, password, self.rounds)
+
+    def submit_verify(self, password: str, hashed_password: str) -> Future:
+        return self.executor.submit(_verify, password, hashed_password)
+
+    def hash(self, password: str) -> str:
+        with span("bcrypt hash", "bcrypt", rounds=self.rounds):
+            return self.submit_hash(password).result()
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        with span("bcrypt verify", "bcrypt"):
+            return self.submit_verify(password, hashed_password).result()
+
+    def hash_many(self, passwords) -> list:
+        """Hashes a batch in parallel, in order. Chunked so a process
+        pool isn't flooded with one tiny task per password."""
+        passwords = list(passwords)
+        workers = getattr(self.executor, '_max_workers', None) or 1
+        chunksize = max(1, len(passwords) // (workers * 4))
+        with span("bcrypt hash_many", "bcrypt", rounds=self.rounds, passwords=len(passwords)):
+            return list(self.executor.map(_hash, passwords,
+                                          [self.rounds] * len(passwords),
+                                          chunksize=chunksize))
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        try:
+            return hash_rounds(hashed_password) < self.rounds
+        except (IndexError, ValueError):
+            # Not a bcrypt hash, verify would never have passed
+            return False
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+_default_hasher = None
+_default_lock = Lock()
+
+
+def get_hasher() -> PasswordHasher:
+    """Process wide hasher, created on first use"""
+    global _default_hasher
+    with _default_lock:
+        if _default_hasher is None:
+            rounds = os.environ.get("FRAPPSTER_BCRYPT_ROUNDS")
+            _default_hasher = PasswordHasher(int(rounds) if rounds else None)
+        return _default_hasher
+
+
+def set_hasher(hasher: PasswordHasher | None):
+    """Swaps the process wide hasher, None makes the next get_hasher
+    build a fresh one"""
+    global _default_hasher
+    with _default_lock:
+        _default_hasher = hasher
@@ -0,0 +1,124 @@
+import hashlib
+import json
+from datetime import datetime, timedelta
+from threading import Lock
+
+from sqlalchemy import delete, insert, select
+
+from frappster.cache import LRUCache
+from frappster.errors import IdempotencyKeyReusedError
+from frappster.models import IdempotencyKey
+
+
+class IdempotencyStore:
+    """Remembers the result of money moving requests by a client
+    chosen key, so a timed out request can be retried without posting
+    twice.
+
+    Keys are scoped per user and bound to the request they were first
+    used with. Replays are answered from an in process LRU or a plain
+    read, only a first time request takes the write lock. Keys older
+    than retention are purged every purge_every new keys.
+    """
+    def __init__(self,
+                 db_manager,
+                 retention: timedelta = timedelta(hours=24),
+                 cache_size: int = 1024,
+                 purge_every: int = 1000) -> None:
+        self.db_manager = db_manager
+        self.retention = retention
+        self.purge_every = purge_every
+        self.cache = LRUCache(cache_size)
+        self._recorded_since_purge = 0
+        self._purge_lock = Lock()
+
+    @staticmethod
+    def fingerprint(operation, *arguments) -> str:
+        request = json.dumps([operation, *[str(argument) for argument in arguments]])
+        return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+    def run(self, user_id, key, fingerprint, write):
+        """Returns the stored result of key if there is one, otherwise
+        calls write() in a write unit of work and stores what it returns
+        in the same transaction.
+        """
+        if key is None:
+            return write()
+
+        replay = self.lookup(user_id, key, fingerprint)
+        if replay is not None:
+            return replay
+
+        with self.db_manager.unit_of_work(write=True):
+            # Check again under the write lock, a concurrent retry
+            # with the same key may have just committed
+            replay = self._load(user_id, key, fingerprint)
+            if replay is None:
+                result = write()
+                # An expired key that wasn't purged yet is free to reuse
+                self.db_manager.session.execute(
+                        delete(IdempotencyKey)
+                        .where(IdempotencyKey.user_id == user_id,
+                               IdempotencyKey.key == key))
+                self.db_manager.session.execute(
+                        insert(IdempotencyKey).values(user_id=user_id,
+                                                      key=key,
+                                                      fingerprint=fingerprint,
+                                                      result=json.dumps(result, default=str)))
+
+        if replay is not None:
+            return replay
+
+        # Joined into a bigger unit of work (a group commit), the
+        # result only counts once that one has committed
+        entry = (fingerprint, result, datetime.now())
+        self.db_manager.after_commit(lambda: self.cache.set((user_id, key), entry))
+        self.db_manager.after_commit(self._maybe_purge)
+        return result
+
+    def lookup(self, user_id, key, fingerprint):
+        cached = self.cache.get((user_id, key))
+        if cached is not None:
+            stored_fingerprint, result, created_at = cached
+            if created_at >= datetime.now() - self.retention:
+                return self._checked(stored_fingerprint, fingerprint, result)
+            self.cache.delete((user_id, key))
+
+        with self.db_manager.unit_of_work():
+            return self._load(user_id, key, fingerprint)
+
+    def purge_expired(self) -> int:
+        """Deletes keys older than the retention window, returns how many"""
+        cutoff = datetime.now() - self.retention
+        with self.db_manager.unit_of_work(write=True) as session:
+            deleted = session.execute(delete(IdempotencyKey)
+                                      .where(IdempotencyKey.created_at < cutoff))
+            return deleted.rowcount
+
+    def _load(self, user_id, key, fingerprint):
+        row = self.db_manager.session.execute(
+                select(IdempotencyKey.fingerprint,
+                       IdempotencyKey.result,
+                       IdempotencyKey.created_at)
+                .where(IdempotencyKey.user_id == user_id,
+                       IdempotencyKey.key == key,
+                       IdempotencyKey.created_at >= datetime.now() - self.retention)
+                ).first()
+        if row is None:
+            return None
+        result = json.loads(row.result)
+        self.cache.set((user_id, key), (row.fingerprint, result, row.created_at))
+        return self._checked(row.fingerprint, fingerprint, result)
+
+    def _checked(self, stored_fingerprint, fingerprint, result):
+        if stored_fingerprint != fingerprint:
+            raise IdempotencyKeyReusedError
+        return result
+
+    def _maybe_purge(self):
+        with self._purge_lock:
+            self._recorded_since_purge += 1
+            if self._recorded_since_purge < self.purge_every:
+                return
+            self._recorded_since_purge = 0
+        self.purge_expired()
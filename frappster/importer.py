@@ -0,0 +1,180 @@
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from sqlalchemy import insert
+
+from frappster.auth import AuthService
+from frappster.database import DatabaseManager
+from frappster.errors import InvalidRowError
+from frappster.hashing import PasswordHasher, get_hasher
+from frappster.models import User
+from frappster.types import AccessRole, Permissions
+from frappster.utils import requires_permissions, requires_role
+
+# Column: (required, max length), lengths as in models.User
+USER_FIELDS = {
+    'first_name': (True, 30),
+    'middle_name': (False, 30),
+    'last_name': (True, 30),
+    'address': (True, 100),
+    'email': (True, 100),
+    'phone_number': (True, 30),
+    'password': (True, None),
+}
+
+
+class ImportReport:
+    """Running totals of an import. next_offset is the first row not
+    yet committed, pass it as start to resume after a crash.
+    last_batch holds (offset, login_id) of the users the last batch
+    created."""
+    def __init__(self, start: int = 0) -> None:
+        self.imported = 0
+        self.failed = 0
+        self.next_offset = start
+        self.last_batch = []
+
+    def to_dict(self):
+        return {
+            'imported': self.imported,
+            'failed': self.failed,
+            'next_offset': self.next_offset,
+        }
+
+
+def read_rows(path):
+    """Streams (offset, row dict) pairs from a .csv (with header) or
+    .jsonl file, offset counts data rows from 0."""
+    if path.endswith((".jsonl", ".ndjson")):
+        with open(path, encoding='utf-8') as file:
+            offset = 0
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    row = InvalidRowError(f"not json ({e.msg})")
+                yield offset, row
+                offset += 1
+    elif path.endswith(".csv"):
+        with open(path, newline='', encoding='utf-8') as file:
+            yield from enumerate(csv.DictReader(file))
+    else:
+        raise ValueError(f"Don't know how to read {path}, expected .csv or .jsonl")
+
+
+class UserImporter:
+    """Bulk creates users from a file, for onboarding whole customer
+    bases at once.
+
+    Rows are read as a stream and handled batch_size at a time, so
+    memory stays flat however big the file is. Passwords of a batch are
+    hashed in parallel on a process pool, then the batch is inserted
+    in one transaction with login_ids reserved in one go. Bad rows
+    are reported to on_error and skipped, they never fail a batch.
+    """
+    def __init__(self,
+                 db_manager: DatabaseManager,
+                 auth_service: AuthService,
+                 batch_size: int = 500,
+                 processes: int | None = None,
+                 hasher: PasswordHasher | None = None) -> None:
+        self.db_manager = db_manager
+        self.auth_service = auth_service
+        self.batch_size = batch_size
+        self.processes = processes or os.cpu_count()
+        self.hasher = hasher
+
+    @requires_role(AccessRole.EMPLOYEE)
+    @requires_permissions(Permissions.MANAGE_USERS)
+    def import_file(self, path: str, start: int = 0,
+                    on_batch=None, on_error=None) -> ImportReport:
+        """Imports the rows of path from offset start on.
+
+        on_batch(report) is called after every committed batch and
+        on_error(offset, error) for every skipped row.
+        """
+        report = ImportReport(start)
+        hasher = self.hasher
+        if hasher is None:
+            # Same cost as the shared hasher, but spread over processes
+            hasher = PasswordHasher(rounds=get_hasher().rounds,
+                                    executor=ProcessPoolExecutor(self.processes))
+        try:
+            rows = islice(read_rows(path), start, None)
+            while True:
+                batch = list(islice(rows, self.batch_size))
+                if not batch:
+                    break
+                self._import_batch(batch, hasher, report, on_error)
+                report.next_offset = batch[-1][0] + 1
+                if on_batch is not None:
+                    on_batch(report)
+        finally:
+            if self.hasher is None:
+                hasher.shutdown()
+        return report
+
+    def _import_batch(self, batch, hasher, report, on_error):
+        users = []
+        offsets = []
+        for offset, row in batch:
+            try:
+                users.append(self.validate(row))
+                offsets.append(offset)
+            except InvalidRowError as e:
+                report.failed += 1
+                if on_error is not None:
+                    on_error(offset, e)
+
+        report.last_batch = []
+        if not users:
+            return
+
+        passwords = hasher.hash_many(user['password'] for user in users)
+        # One reservation for the whole batch
+        login_ids = self.db_manager.number_allocator('login_id').take(len(users))
+        for user, password, login_id in zip(users, passwords, login_ids):
+            user['password'] = password
+            user['login_id'] = login_id
+        with self.db_manager.unit_of_work(write=True) as session:
+            session.execute(insert(User), users)
+
+        report.imported += len(users)
+        report.last_batch = list(zip(offsets, login_ids))
+
+    def validate(self, row) -> dict:
+        if isinstance(row, InvalidRowError):
+            raise row
+        if not isinstance(row, dict):
+            raise InvalidRowError("expected an object")
+
+        user = {}
+        for field, (required, max_length) in USER_FIELDS.items():
+            value = row.get(field)
+            value = "" if value is None else str(value)
+            if field != 'password':
+                value = value.strip()
+            if not value:
+                if required:
+                    raise InvalidRowError(f"{field} is missing")
+                value = None
+            elif max_length is not None and len(value) > max_length:
+                raise InvalidRowError(f"{field} is longer than {max_length}")
+            user[field] = value
+
+        if '@' not in user['email']:
+            raise InvalidRowError("email is not an email address")
+
+        role = str(row.get('access_role') or AccessRole.CUSTOMER.name).strip().upper()
+        if role not in AccessRole.__members__:
+            raise InvalidRowError(f"unknown access_role {role}")
+        user['access_role'] = AccessRole[role]
+        # Only admins can create admin users, like UserManager.create_user
+        if user['access_role'] == AccessRole.ADMIN and not self.auth_service.is_admin():
+            raise InvalidRowError("only admins can import admins")
+        return user
@@ -0,0 +1,196 @@
+import logging
+import os
+import re
+import time
+from collections import deque
+from contextvars import ContextVar
+from functools import wraps
+from threading import Lock
+
+from sqlalchemy import event
+
+from frappster.metrics import REGISTRY
+from frappster.tracing import is_tracing, record_span, span
+
+logger = logging.getLogger(__name__)
+
+# Overridable with FRAPPSTER_SLOW_QUERY_MS & FRAPPSTER_N_PLUS_ONE
+DEFAULT_SLOW_QUERY_MS = 100.0
+# Same statement this many times within one call looks like N+1
+DEFAULT_N_PLUS_ONE = 5
+# Transaction control, not queries anybody wrote
+_NOT_QUERIES = ("BEGIN", "SAVEPOINT", "RELEASE", "ROLLBACK")
+
+_TABLE = re.compile(r"\b(?:FROM|INTO)\s+(\w+)", re.IGNORECASE)
+
+_current_call: ContextVar["CallStats | None"] = ContextVar("frappster_current_call", default=None)
+
+
+class CallStats:
+    """Queries issued by one service call. rows counts rows returned
+    by ORM selects and rows changed by writes, duration_ms is time
+    spent in the database, not in the call."""
+    # Made on every service call, kept cheap
+    __slots__ = ('name', 'queries', 'rows', 'duration_ms', 'statements', 'observers')
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.queries = 0
+        self.rows = 0
+        self.duration_ms = 0.0
+        self.statements = {}
+        self.observers = []
+
+    def repeated(self, threshold: int) -> list:
+        """(statement, times) of every statement run threshold times or more"""
+        return sorted(((statement, times) for statement, times in self.statements.items()
+                       if times >= threshold), key=lambda repeat: -repeat[1])
+
+
+def statement_name(statement: str) -> str:
+    """Short name of a statement, like "SELECT accounts" """
+    words = statement.split(None, 2)
+    if not words:
+        return ""
+    verb = words[0].upper()
+    if verb == "UPDATE" and len(words) > 1:
+        return f"UPDATE {words[1]}"
+    match = _TABLE.search(statement)
+    return verb if match is None else f"{verb} {match.group(1)}"
+
+
+def current_call() -> CallStats | None:
+    return _current_call.get()
+
+
+def instrumented(func):
+    """Tags every query func issues with its qualified name, like
+    "TransactionService.get_history", and records every call's latency
+    & error class in metrics.REGISTRY. Queries of calls made from inside
+    another instrumented call are counted as part of the outer one.
+    """
+    name = func.__qualname__
+    metrics = REGISTRY.method(name)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter_ns()
+        stats = None
+        if _current_call.get() is None:
+            stats = CallStats(name)
+            token = _current_call.set(stats)
+        try:
+            if is_tracing():
+                with span(name, "service"):
+                    return func(*args, **kwargs)
+            return func(*args, **kwargs)
+        except Exception as e:
+            metrics.failed(e)
+            raise
+        finally:
+            metrics.latency.record(time.perf_counter_ns() - start)
+            if stats is not None:
+                _current_call.reset(token)
+                for observer in stats.observers:
+                    observer.finish(stats)
+    return wrapper
+
+
+class QueryInstrumentation:
+    """Per call query counts, rows & database time from engine events.
+
+    Queries run inside an instrumented call are added to its CallStats
+    and totalled per call name when it returns, see summary(). Any
+    query slower than slow_query_ms is logged, and so is any call that
+    ran the same statement n_plus_one times or more, the usual sign of
+    a relationship lazy loading once per row.
+    """
+    def __init__(self,
+                 engine,
+                 session_factory=None,
+                 slow_query_ms: float | None = None,
+                 n_plus_one: int | None = None,
+                 keep_slow: int = 100) -> None:
+        if slow_query_ms is None:
+            slow_query_ms = float(os.environ.get("FRAPPSTER_SLOW_QUERY_MS", DEFAULT_SLOW_QUERY_MS))
+        if n_plus_one is None:
+            n_plus_one = int(os.environ.get("FRAPPSTER_N_PLUS_ONE", DEFAULT_N_PLUS_ONE))
+        self.slow_query_ms = slow_query_ms
+        self.n_plus_one = n_plus_one
+        # (ms, call name, statement) of the latest slow queries
+        self.slow_queries = deque(maxlen=keep_slow)
+        self._calls = {}
+        self._lock = Lock()
+
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        if session_factory is not None:
+            event.listen(session_factory, "do_orm_execute", self._count_orm_rows)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter_ns())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = conn.info['query_start'].pop()
+        elapsed = time.perf_counter_ns() - start
+        elapsed_ms = elapsed / 1e6
+        if is_tracing():
+            record_span(statement_name(statement), "sql", start, elapsed, statement=statement)
+        if statement.startswith(_NOT_QUERIES):
+            return
+
+        stats = _current_call.get()
+        name = "-" if stats is None else stats.name
+        if elapsed_ms >= self.slow_query_ms:
+            self.slow_queries.append((elapsed_ms, name, statement))
+            logger.warning("slow query, %.1f ms in %s: %s", elapsed_ms, name, statement)
+        if stats is None:
+            return
+
+        if self not in stats.observers:
+            stats.observers.append(self)
+        stats.queries += 1
+        stats.duration_ms += elapsed_ms
+        stats.statements[statement] = stats.statements.get(statement, 0) + 1
+        if cursor.rowcount > 0:
+            stats.rows += cursor.rowcount
+        elif context is not None and context.isinsert:
+            # INSERT ... RETURNING reports no rowcount until fetched
+            stats.rows += len(parameters) if executemany else 1
+
+    def _count_orm_rows(self, orm_execute_state):
+        stats = _current_call.get()
+        if stats is None or not orm_execute_state.is_select:
+            return None
+        options = orm_execute_state.execution_options
+        if options.get('yield_per') or options.get('stream_results'):
+            # Streamed on purpose, buffering it to count would defeat that
+            return None
+        frozen = orm_execute_state.invoke_statement().freeze()
+        stats.rows += len(frozen.data)
+        return frozen()
+
+    def finish(self, stats: CallStats):
+        repeated = stats.repeated(self.n_plus_one)
+        for statement, times in repeated:
+            logger.warning("possible N+1 in %s, ran %d times: %s", stats.name, times, statement)
+
+        with self._lock:
+            totals = self._calls.setdefault(stats.name, {'calls': 0, 'queries': 0, 'rows': 0,
+                                                         'db_ms': 0.0, 'n_plus_one': 0})
+            totals['calls'] += 1
+            totals['queries'] += stats.queries
+            totals['rows'] += stats.rows
+            totals['db_ms'] += stats.duration_ms
+            totals['n_plus_one'] += bool(repeated)
+
+    def summary(self) -> dict:
+        """Totals per call name: calls, queries, rows, db_ms and how
+        many calls looked like N+1"""
+        with self._lock:
+            return {name: dict(totals) for name, totals in self._calls.items()}
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+        self.slow_queries.clear()
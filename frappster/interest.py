@@ -0,0 +1,93 @@
+from decimal import Decimal
+
+from sqlalchemy import func, insert, literal, select, update
+
+from frappster.auth import AuthService
+from frappster.database import DatabaseManager
+from frappster.models import Account, InterestAccrual, Transaction
+from frappster.types import AccessRole, AccountType, Permissions, TransactionType
+from frappster.utils import requires_permissions, requires_role
+
+
+class InterestEngine:
+    """Credits interest to every account of a type in set based passes.
+
+    Accounts are walked in id ranges of chunk_size, each range is three
+    statements in one transaction: record the accruals, add them to the
+    balances, write DEPOSIT ledger rows. An account gets at most one
+    accrual per period, so rerunning a period after a crash only picks
+    up the ranges that never committed.
+    """
+    def __init__(self,
+                 db_manager: DatabaseManager,
+                 auth_service: AuthService,
+                 chunk_size: int = 10000) -> None:
+        self.db_manager = db_manager
+        self.auth_service = auth_service
+        self.chunk_size = chunk_size
+
+    @requires_role(AccessRole.EMPLOYEE)
+    @requires_permissions(Permissions.MANAGE_ACCOUNTS)
+    def accrue(self,
+               period: str,
+               rate,
+               account_type: AccountType = AccountType.SAVINGS,
+               on_chunk=None) -> dict:
+        """Accrues balance * rate (rounded to cents) for period, a label
+        like "2024-06". on_chunk(summary) is called after each committed
+        range. Returns how many accounts got how much in total this run.
+        """
+        rate = Decimal(str(rate))
+        summary = {'period': period, 'accounts': 0, 'total': Decimal(0)}
+
+        with self.db_manager.unit_of_work() as session:
+            # Two statements, sqlite only answers a lone min or max off the index
+            low = session.execute(select(func.min(Account.id))).scalar()
+            high = session.execute(select(func.max(Account.id))).scalar()
+        if low is None:
+            return summary
+
+        for start in range(low, high + 1, self.chunk_size):
+            accounts, total = self._accrue_range(period, rate, account_type,
+                                                 start, start + self.chunk_size)
+            summary['accounts'] += accounts
+            summary['total'] += total
+            if on_chunk is not None:
+                on_chunk(summary)
+        return summary
+
+    def _accrue_range(self, period, rate, account_type, start, end):
+        with self.db_manager.unit_of_work(write=True) as session:
+            # Holding the write lock, so rows past this id are ours
+            before = session.execute(select(func.coalesce(func.max(InterestAccrual.id), 0))).scalar()
+
+            amount = func.round(Account.balance * rate, 2)
+            accrued = (select(InterestAccrual.id)
+                       .where(InterestAccrual.period == period,
+                              InterestAccrual.account_number == Account.account_number)
+                       .exists())
+            session.execute(insert(InterestAccrual).from_select(
+                    ['period', 'account_number', 'amount'],
+                    select(literal(period), Account.account_number, amount)
+                    .where(Account.id >= start,
+                           Account.id < end,
+                           Account.account_type == account_type,
+                           amount > 0,
+                           ~accrued)))
+
+            fresh = (select(InterestAccrual.account_number, InterestAccrual.amount)
+                     .where(InterestAccrual.id > before)
+                     .subquery())
+            session.execute(update(Account)
+                            .where(Account.account_number == fresh.c.account_number)
+                            .values(balance=Account.balance + fresh.c.amount,
+                                    version=Account.version + 1)
+                            .execution_options(synchronize_session=False))
+            session.execute(insert(Transaction).from_select(
+                    ['recipients_account_number', 'type', 'amount'],
+                    select(fresh.c.account_number,
+                           literal(TransactionType.DEPOSIT, Transaction.type.type),
+                           fresh.c.amount)))
+
+            accounts, total = session.execute(select(func.count(), func.coalesce(func.sum(fresh.c.amount), 0))).one()
+        return accounts, Decimal(str(total))
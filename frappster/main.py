@@ -2,10 +2,258 @@
 # from frappster.models import User
 # from frappster.services import AuthService, UserManager
 # from frappster.types import AccessRole
-from frappster.ui.app import BankingApp
+import argparse
+import contextlib
+import getpass
+import json
+import logging
+import sys
+from datetime import datetime
+from decimal import Decimal
 
-def main():
-    app = BankingApp()
+from frappster.types import AccountType
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="frappster",
+                                     description="Frappster Bank CLI")
+    parser.add_argument("--db", default="sqlite:///test.db", help="database url")
+    parser.add_argument("--log-file", default="frappster.log",
+                        help="where the ui logs slow queries & N+1 warnings")
+    parser.add_argument("--metrics-file", default=None,
+                        help="rewrite Prometheus text metrics to this file every 15s")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve Prometheus metrics on localhost:PORT/metrics")
+    parser.add_argument("--trace-file", default=None,
+                        help="write a span per ui action, service call, bcrypt call & query here")
+    parser.add_argument("--trace-format", choices=["jsonl", "chrome"], default=None,
+                        help="chrome opens in chrome://tracing or Perfetto, "
+                             "default is chrome for .json files, jsonl otherwise")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("ui", help="interactive banking app (default)")
+
+    import_users = commands.add_parser("import-users",
+                                       help="bulk create users from a .csv or .jsonl file")
+    import_users.add_argument("path")
+    import_users.add_argument("--login-id", type=int, required=True,
+                              help="employee or admin running the import")
+    import_users.add_argument("--start", type=int, default=0,
+                              help="row offset to resume from")
+    import_users.add_argument("--batch-size", type=int, default=500)
+    import_users.add_argument("--processes", type=int, default=None,
+                              help="bcrypt worker processes, defaults to cpu count")
+
+    statement = commands.add_parser("statement",
+                                    help="export an accounts transactions as csv or jsonl")
+    statement.add_argument("account_number", type=int)
+    statement.add_argument("--login-id", type=int, required=True,
+                           help="owner of the account")
+    statement.add_argument("--start", type=datetime.fromisoformat, default=None,
+                           help="first day/time to include, ISO format, UTC like the stored times")
+    statement.add_argument("--end", type=datetime.fromisoformat, default=None,
+                           help="day/time to stop before, ISO format, UTC")
+    statement.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    statement.add_argument("--output", default=None,
+                           help="file to write to, stdout if not given")
+
+    interest = commands.add_parser("accrue-interest",
+                                   help="credit one period of interest to savings accounts")
+    interest.add_argument("period", help='label of the accrual period, like "2024-06"')
+    interest.add_argument("rate", type=Decimal, help="rate for the period, 0.0025 is 0.25%%")
+    interest.add_argument("--login-id", type=int, required=True,
+                          help="employee or admin running the job")
+    interest.add_argument("--account-type", choices=[t.name for t in AccountType],
+                          default=AccountType.SAVINGS.name)
+    interest.add_argument("--chunk-size", type=int, default=10000)
+
+    reconcile = commands.add_parser("reconcile",
+                                    help="check account balances against the ledger")
+    reconcile.add_argument("--login-id", type=int, required=True,
+                           help="employee or admin running the check")
+    reconcile.add_argument("--low", type=int, default=None, help="first account number")
+    reconcile.add_argument("--high", type=int, default=None, help="last account number")
+    reconcile.add_argument("--processes", type=int, default=1)
+
+    generate = commands.add_parser("generate",
+                                   help="fill a database with synthetic users, accounts & transactions")
+    generate.add_argument("--users", type=int, default=1000)
+    generate.add_argument("--accounts", type=int, default=2000)
+    generate.add_argument("--transactions", type=int, default=100_000)
+    generate.add_argument("--seed", type=int, default=0,
+                          help="same seed on a fresh database, same data")
+    generate.add_argument("--hot-accounts", type=float, default=0.01,
+                          help="fraction of accounts that are hot")
+    generate.add_argument("--hot-share", type=float, default=0.5,
+                          help="fraction of transactions touching a hot account")
+    generate.add_argument("--password", default="password",
+                          help="password of every generated user")
+    generate.add_argument("--batch-size", type=int, default=50_000)
+    return parser
+
+
+def open_database(db_url):
+    from frappster.database import DatabaseManager
+
+    # Startup messages go to stderr, stdout may be the exported data
+    with contextlib.redirect_stdout(sys.stderr):
+        return DatabaseManager(db_url)
+
+
+def login(db_manager, login_id):
+    from frappster.auth import AuthService
+
+    auth_service = AuthService(db_manager)
+    auth_service.login_user(login_id, getpass.getpass("Password: "))
+    return auth_service
+
+
+def import_users(args):
+    from frappster.importer import UserImporter
+
+    db_manager = open_database(args.db)
+    importer = UserImporter(db_manager,
+                            login(db_manager, args.login_id),
+                            batch_size=args.batch_size,
+                            processes=args.processes)
+
+    def on_batch(report):
+        for offset, login_id in report.last_batch:
+            print(json.dumps({'offset': offset, 'login_id': login_id}))
+        print(f"imported {report.imported}, failed {report.failed}, "
+              f"next offset {report.next_offset}", file=sys.stderr)
+
+    def on_error(offset, error):
+        print(json.dumps({'offset': offset, 'error': error.reason}))
+
+    report = importer.import_file(args.path, args.start, on_batch, on_error)
+    print(json.dumps(report.to_dict()), file=sys.stderr)
+
+
+def export_statement(args):
+    from frappster.services import AccountService, TransactionService, UserManager
+
+    db_manager = open_database(args.db)
+    auth_service = login(db_manager, args.login_id)
+    user_manager = UserManager(db_manager, auth_service)
+    account_service = AccountService(db_manager, auth_service)
+    transaction_service = TransactionService(db_manager, user_manager,
+                                             auth_service, account_service)
+
+    if args.output is None:
+        written = transaction_service.export_statement(args.account_number, args.start,
+                                                       args.end, args.format)
+    else:
+        with open(args.output, "w", newline="", encoding="utf-8") as out:
+            written = transaction_service.export_statement(args.account_number, args.start,
+                                                           args.end, args.format, out)
+    print(f"{written} transactions exported", file=sys.stderr)
+
+
+def accrue_interest(args):
+    from frappster.interest import InterestEngine
+
+    db_manager = open_database(args.db)
+    engine = InterestEngine(db_manager, login(db_manager, args.login_id), args.chunk_size)
+
+    def on_chunk(summary):
+        print(f"{summary['accounts']} accounts, {summary['total']:.2f} so far", file=sys.stderr)
+
+    summary = engine.accrue(args.period, args.rate, AccountType[args.account_type], on_chunk)
+    print(json.dumps(summary, default=str))
+
+
+def reconcile(args):
+    from frappster.reconcile import Reconciler
+
+    db_manager = open_database(args.db)
+    reconciler = Reconciler(db_manager, login(db_manager, args.login_id), args.processes)
+
+    def on_discrepancy(account_number, balance, ledger):
+        print(json.dumps({'account_number': account_number,
+                          'balance': str(balance), 'ledger': str(ledger)}))
+
+    summary = reconciler.run(args.low, args.high, on_discrepancy)
+    print(json.dumps(summary), file=sys.stderr)
+    if summary['discrepancies']:
+        sys.exit(1)
+
+
+def generate(args):
+    from frappster.datagen import DataGenerator
+
+    generator = DataGenerator(open_database(args.db),
+                              seed=args.seed,
+                              hot_accounts=args.hot_accounts,
+                              hot_share=args.hot_share,
+                              password=args.password,
+                              batch_size=args.batch_size)
+
+    def on_progress(table, rows):
+        print(f"{table}: {rows}", file=sys.stderr)
+
+    created = generator.generate(args.users, args.accounts, args.transactions, on_progress)
+    # Some login IDs to log in with, the first user is an employee
+    print(json.dumps({'users': len(created['login_ids']),
+                      'accounts': len(created['account_numbers']),
+                      'first_login_ids': created['login_ids'][:5]}))
+
+
+def start_metrics(args):
+    """Exports the metrics as asked, returns a function stopping it"""
+    from frappster.metrics import REGISTRY
+
+    stops = []
+    if args.metrics_file is not None:
+        stop_writing = REGISTRY.write_periodically(args.metrics_file)
+        stops.append(stop_writing.set)
+        # Last numbers of the run
+        stops.append(lambda: REGISTRY.write_textfile(args.metrics_file))
+    if args.metrics_port is not None:
+        stops.append(REGISTRY.serve(args.metrics_port).shutdown)
+
+    def stop():
+        for stop_export in stops:
+            stop_export()
+    return stop
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    stop_metrics = start_metrics(args)
+    if args.trace_file is not None:
+        from frappster.tracing import start_tracing
+        start_tracing(args.trace_file, args.trace_format)
+    try:
+        run_command(args)
+    finally:
+        if args.trace_file is not None:
+            from frappster.tracing import stop_tracing
+            stop_tracing()
+        stop_metrics()
+
+
+def run_command(args):
+    if args.command == "import-users":
+        import_users(args)
+        return
+    if args.command == "statement":
+        export_statement(args)
+        return
+    if args.command == "accrue-interest":
+        accrue_interest(args)
+        return
+    if args.command == "reconcile":
+        reconcile(args)
+        return
+    if args.command == "generate":
+        generate(args)
+        return
+
+    from frappster.ui.app import BankingApp
+    # Warnings would draw over the ui, they go to a file instead
+    logging.basicConfig(filename=args.log_file, level=logging.WARNING,
+                        format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    app = BankingApp(args.db)
     app.run()
     # db_manager = DatabaseManager()
     # auth_service = AuthService(db_manager)
@@ -0,0 +1,238 @@
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histograms keep the top SUB_BUCKET_BITS bits of every value, so a
+# bucket is never more than 1/32 (~3%) wider than its lower bound
+SUB_BUCKET_BITS = 6
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+HALF_BUCKETS = SUB_BUCKETS // 2
+# 2**42 ns is over an hour, anything slower is counted in the last bucket
+MAX_SHIFT = 42 - SUB_BUCKET_BITS
+BUCKET_COUNT = SUB_BUCKETS + MAX_SHIFT * HALF_BUCKETS
+
+# le boundaries in seconds the text export folds the buckets into
+EXPORT_BOUNDS = [scale * 10 ** exponent
+                 for exponent in range(-5, 1)
+                 for scale in (1, 2.5, 5)] + [10.0]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def bucket_index(value: int) -> int:
+    # SUB_BUCKETS + (shift - 1) * HALF_BUCKETS + top - HALF_BUCKETS,
+    # which is the same as below and as value itself for shift 0
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    if shift <= 0:
+        return value
+    if shift > MAX_SHIFT:
+        return BUCKET_COUNT - 1
+    return (shift << (SUB_BUCKET_BITS - 1)) + (value >> shift)
+
+
+def bucket_upper(index: int) -> int:
+    """Smallest value that no longer fits bucket index"""
+    if index < SUB_BUCKETS:
+        return index + 1
+    shift, offset = divmod(index - SUB_BUCKETS, HALF_BUCKETS)
+    shift += 1
+    return (HALF_BUCKETS + offset + 1) << shift
+
+
+class Histogram:
+    """HDR style histogram of nanosecond latencies.
+
+    Buckets are linear within every power of two, so recording is a
+    couple of integer ops and percentiles stay within ~3% at any scale.
+    Every thread records into its own shard of counts, so recording
+    takes no lock, reads add the shards up.
+    """
+    def __init__(self) -> None:
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def _new_shard(self):
+        # Bucket counts, then the total of all recorded values
+        shard = [0] * (BUCKET_COUNT + 1)
+        with self._lock:
+            self._shards.append(shard)
+        self._local.shard = shard
+        return shard
+
+    def record(self, value: int):
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._new_shard()
+        # bucket_index inlined, this runs on every service call
+        shift = value.bit_length() - SUB_BUCKET_BITS
+        if shift <= 0:
+            shard[value] += 1
+        elif shift <= MAX_SHIFT:
+            shard[(shift << (SUB_BUCKET_BITS - 1)) + (value >> shift)] += 1
+        else:
+            shard[BUCKET_COUNT - 1] += 1
+        shard[BUCKET_COUNT] += value
+
+    def snapshot(self) -> list:
+        """Bucket counts summed over all threads, then the total"""
+        with self._lock:
+            shards = list(self._shards)
+        return [sum(column) for column in zip(*shards)] or [0] * (BUCKET_COUNT + 1)
+
+    @property
+    def count(self) -> int:
+        return sum(self.snapshot()[:BUCKET_COUNT])
+
+    @property
+    def total(self) -> int:
+        return self.snapshot()[BUCKET_COUNT]
+
+    def percentile(self, fraction: float) -> int:
+        """Upper bound of the bucket holding the fraction'th value, in ns"""
+        counts = self.snapshot()[:BUCKET_COUNT]
+        count = sum(counts)
+        if not count:
+            return 0
+        rank = max(1, round(fraction * count))
+        seen = 0
+        for index, bucket in enumerate(counts):
+            seen += bucket
+            if seen >= rank:
+                return bucket_upper(index)
+        return bucket_upper(BUCKET_COUNT - 1)
+
+    def cumulative(self, bounds_ns, counts=None) -> list:
+        """Counts of values below each bound, for le buckets. A bucket
+        straddling a bound counts towards the next one."""
+        if counts is None:
+            counts = self.snapshot()[:BUCKET_COUNT]
+        result = []
+        seen = 0
+        index = 0
+        for bound in bounds_ns:
+            while index < BUCKET_COUNT and bucket_upper(index) <= bound:
+                seen += counts[index]
+                index += 1
+            result.append(seen)
+        return result
+
+
+class CallMetrics:
+    """Latency of every call to one method and its failures by error"""
+    def __init__(self, method: str) -> None:
+        self.method = method
+        self.latency = Histogram()
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def failed(self, error: BaseException):
+        name = type(error).__name__
+        with self._lock:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+
+class MetricsRegistry:
+    """Every CallMetrics of the process, rendered as Prometheus text"""
+    def __init__(self, prefix: str = "frappster") -> None:
+        self.prefix = prefix
+        self._methods = {}
+        self._lock = threading.Lock()
+
+    def method(self, name: str) -> CallMetrics:
+        with self._lock:
+            if name not in self._methods:
+                self._methods[name] = CallMetrics(name)
+            return self._methods[name]
+
+    def render(self) -> str:
+        with self._lock:
+            methods = sorted(self._methods.values(), key=lambda metrics: metrics.method)
+        latency = f"{self.prefix}_call_duration_seconds"
+        calls = f"{self.prefix}_calls_total"
+        errors = f"{self.prefix}_call_errors_total"
+        bounds_ns = [int(bound * 1e9) for bound in EXPORT_BOUNDS]
+
+        lines = [f"# HELP {latency} Service call latency.",
+                 f"# TYPE {latency} histogram"]
+        for metrics in methods:
+            snapshot = metrics.latency.snapshot()
+            counts, total = snapshot[:BUCKET_COUNT], snapshot[BUCKET_COUNT]
+            count = sum(counts)
+            label = f'method="{metrics.method}"'
+            for bound, below in zip(EXPORT_BOUNDS, metrics.latency.cumulative(bounds_ns, counts)):
+                lines.append(f'{latency}_bucket{{{label},le="{bound:g}"}} {below}')
+            lines.append(f'{latency}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f"{latency}_sum{{{label}}} {total / 1e9:.9f}")
+            lines.append(f"{latency}_count{{{label}}} {count}")
+
+        lines += [f"# HELP {calls} Service calls by outcome.",
+                  f"# TYPE {calls} counter"]
+        for metrics in methods:
+            failures = sum(metrics.errors.values())
+            label = f'method="{metrics.method}"'
+            lines.append(f'{calls}{{{label},outcome="ok"}} {metrics.latency.count - failures}')
+            lines.append(f'{calls}{{{label},outcome="error"}} {failures}')
+
+        lines += [f"# HELP {errors} Failed service calls by error class.",
+                  f"# TYPE {errors} counter"]
+        for metrics in methods:
+            for error, count in sorted(metrics.errors.items()):
+                lines.append(f'{errors}{{method="{metrics.method}",error="{error}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str):
+        """Writes render() to path atomically, for node_exporter's
+        textfile collector or anything else tailing the file"""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                file.write(self.render())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def write_periodically(self, path: str, interval: float = 15.0) -> threading.Event:
+        """Rewrites path every interval seconds on a daemon thread
+        until the returned event is set"""
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                self.write_textfile(path)
+
+        threading.Thread(target=run, name="frappster-metrics-file", daemon=True).start()
+        return stop
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Scrape endpoint at http://host:port/metrics on a daemon
+        thread, shutdown() the returned server to stop it"""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="frappster-metrics-http",
+                         daemon=True).start()
+        return server
+
+
+# Shared by every instrumented service method
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,103 @@
+"""Schema migrations for existing databases.
+
+create_all only creates tables that are missing, so anything added to a
+table that already exists (indexes, columns) is a numbered step here.
+Every step must be safe to run on a database create_all just made.
+DatabaseManager skips create_all & migrate when the recorded version is
+SCHEMA_VERSION, so one time setup like the super admin is a step too.
+
+Apply to a database in place:
+    py -m frappster.migrations sqlite:///test.db
+"""
+import sys
+
+from sqlalchemy import create_engine, func, insert, inspect, select
+
+from frappster.models import BaseModel, SchemaVersion, User
+from frappster.types import AccessRole
+from frappster.utils import hash_password
+
+
+def _create_missing_indexes(connection):
+    for table in BaseModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def _add_account_version_column(connection):
+    columns = {column['name'] for column in inspect(connection).get_columns('accounts')}
+    if 'version' not in columns:
+        connection.exec_driver_sql(
+                "ALTER TABLE accounts ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+
+def _create_missing_tables(connection):
+    BaseModel.metadata.create_all(connection)
+
+
+def _create_super_admin(connection):
+    admins = connection.execute(select(func.count())
+                                .select_from(User)
+                                .where(User.access_role == AccessRole.ADMIN)).scalar()
+    if admins:
+        return
+    connection.execute(insert(User).values(login_id=42069,
+                                           first_name="Anorak",
+                                           last_name="Watts",
+                                           email="superadmin@cli-banksystem.se",
+                                           phone_number="4324134232",
+                                           address="FERTISILE 32 st",
+                                           password=hash_password("secure"),
+                                           access_role=AccessRole.ADMIN))
+    print("Super admin account created.")
+
+
+# (version, description, step) in the order they have to be applied
+MIGRATIONS = [
+    (1, "transaction history & account owner indexes", _create_missing_indexes),
+    (2, "account version column for optimistic locking", _add_account_version_column),
+    (3, "idempotency keys & number sequences tables", _create_missing_tables),
+    (4, "interest accruals table", _create_missing_tables),
+    (5, "super admin account", _create_super_admin),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(connection) -> int:
+    """Latest applied migration, 0 for a new database"""
+    if not inspect(connection).has_table(SchemaVersion.__tablename__):
+        return 0
+    version = connection.execute(select(func.max(SchemaVersion.version))).scalar()
+    return version or 0
+
+
+def migrate(engine):
+    """Applies all pending migrations, each in its own transaction.
+    Returns the versions that got applied.
+    """
+    SchemaVersion.__table__.create(engine, checkfirst=True)
+    applied = []
+    for version, description, step in MIGRATIONS:
+        with engine.begin() as connection:
+            if get_schema_version(connection) >= version:
+                continue
+            step(connection)
+            connection.execute(insert(SchemaVersion).values(version=version,
+                                                            description=description))
+        applied.append(version)
+    return applied
+
+
+def main():
+    db_url = sys.argv[1] if len(sys.argv) > 1 else "sqlite:///test.db"
+    engine = create_engine(db_url)
+    applied = migrate(engine)
+    if applied:
+        print(f"Applied migrations: {applied}")
+    else:
+        print(f"Schema already at version {SCHEMA_VERSION}")
+
+
+if __name__ == "__main__":
+    main()
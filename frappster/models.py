@@ -5,9 +5,12 @@ from datetime import datetime
 
 from sqlalchemy import DateTime, Numeric
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
+from sqlalchemy import UniqueConstraint
 from sqlalchemy import Integer
 from sqlalchemy import Enum as SQLEnum
 from sqlalchemy import String
+from sqlalchemy import Text
 from sqlalchemy import func
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import Mapped
@@ -90,14 +93,29 @@ class UserData:
         self.phone_number = phone_number
         self.access_role = access_role
 
+class SchemaVersion(BaseModel):
+    """One row per applied migration, see frappster.migrations"""
+    __tablename__ = 'schema_version'
+
+    version: Mapped[int] = mapped_column(Integer, primary_key=True)
+    description: Mapped[str] = mapped_column(String(100))
+    applied_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
+
 class Account(BaseModel):
     __tablename__ = 'accounts'
+    __table_args__ = (
+        Index('ix_accounts_user_id', 'user_id'),
+    )
     
     id: Mapped[int] = mapped_column(primary_key=True)
     clearings_number: Mapped[int] = mapped_column(Integer, nullable=False)
     account_number: Mapped[int] = mapped_column(Integer, unique=True, nullable=False)
     account_type: Mapped[AccountType] = mapped_column(SQLEnum(AccountType), nullable=False)
     balance: Mapped[Decimal] = mapped_column(Numeric, default=0.0)
+    # Bumped on every balance change, ORM updates compare-and-swap on it
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0,
+                                         server_default="0")
+    __mapper_args__ = {"version_id_col": version}
     user_id: Mapped[int] = mapped_column(Integer, 
                                         ForeignKey('users.id'))
     created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
@@ -127,6 +145,7 @@ class Account(BaseModel):
             'account_number': self.account_number,
             'account_type': self.account_type,
             'balance': self.balance,
+            'version': self.version,
         }
         return data
 
@@ -138,6 +157,7 @@ class AccountData:
                  account_number: int,
                  account_type: AccountType,
                  balance: int,
+                 version: int = 0,
                  ) -> None:
         self.id = id
         self.user_id = user_id
@@ -145,11 +165,20 @@ class AccountData:
         self.account_number = account_number
         self.account_type = account_type
         self.balance = balance
+        self.version = version
 
 
 class Transaction(BaseModel):
     __tablename__ = 'transactions'
     # __allow_unmapped__ = True
+    # History pages & relationship loads filter on one side and
+    # order by (date, id), these let both be an index range scan
+    __table_args__ = (
+        Index('ix_transactions_sender_date',
+              'senders_account_number', 'date', 'id'),
+        Index('ix_transactions_recipient_date',
+              'recipients_account_number', 'date', 'id'),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     senders_account_number: Mapped[Optional[int]] = mapped_column(Integer,
@@ -181,6 +210,24 @@ class Transaction(BaseModel):
         back_populates='received_transactions'
     )
 
+    @staticmethod
+    def row_to_dict(row):
+        """Same shape as to_dict but from a plain selected row,
+        without touching the account relationships.
+        """
+        sender = "-" if row.senders_account_number is None else row.senders_account_number
+        recipient = "-" if row.recipients_account_number is None else row.recipients_account_number
+
+        data = {
+            'id': row.id,
+            'sender_number': sender,
+            'recipient_number': recipient,
+            'type': row.type.name,
+            'amount': round(row.amount, 2),
+            'date': row.date.isoformat()
+        }
+        return data
+
     def to_dict(self):
         sender = "-" if self.sender_account is None else self.sender_account.account_number
         recipient = "-" if self.recipient_account is None else self.recipient_account.account_number
@@ -194,3 +241,53 @@ class Transaction(BaseModel):
             'date': self.date.isoformat()  
         }
         return data
+
+
+class IdempotencyKey(BaseModel):
+    """Result of a money moving request, stored under the
+    client chosen key so a retried request can be replayed.
+    """
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'key', name='uq_idempotency_keys_user_key'),
+        Index('ix_idempotency_keys_created_at', 'created_at'),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'), nullable=False)
+    key: Mapped[str] = mapped_column(String(100), nullable=False)
+    # Hash of the operation & its arguments, a key can't be reused for another request
+    fingerprint: Mapped[str] = mapped_column(String(64), nullable=False)
+    result: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+
+
+class NumberSequence(BaseModel):
+    """Reservation state of a NumberAllocator, one row per kind of
+    number. next_value is the first sequence index nobody reserved yet.
+    """
+    __tablename__ = 'number_sequences'
+
+    name: Mapped[str] = mapped_column(String(30), primary_key=True)
+    next_value: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # Secret the sequence is permuted with, see allocator.permute
+    key: Mapped[str] = mapped_column(String(64), nullable=False)
+
+
+class InterestAccrual(BaseModel):
+    """Interest credited to an account for one accrual period.
+    At most one per account and period, that is what makes the
+    interest job safe to rerun.
+    """
+    __tablename__ = 'interest_accruals'
+    __table_args__ = (
+        UniqueConstraint('period', 'account_number', name='uq_interest_accruals_period_account'),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    period: Mapped[str] = mapped_column(String(20), nullable=False)
+    account_number: Mapped[int] = mapped_column(Integer,
+                                                ForeignKey('accounts.account_number'),
+                                                nullable=False)
+    amount: Mapped[Decimal] = mapped_column(Numeric, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
@@ -0,0 +1,138 @@
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+from sqlalchemy import create_engine, func, literal, select, union_all
+
+from frappster.auth import AuthService
+from frappster.database import DatabaseManager
+from frappster.models import Account, Transaction
+from frappster.types import AccessRole, Permissions
+from frappster.utils import requires_permissions, requires_role
+
+# Balances are floats in sqlite, anything under half a cent is rounding
+TOLERANCE = Decimal("0.005")
+
+
+def discrepancy_queries(low, high):
+    """Accounts in [low, high] whose balance is off from received minus
+    sent in the ledger.
+
+    The first query sums both sides of the ledger per account in one
+    GROUP BY over a plain scan of transactions and looks every total's
+    account up by its number. The second catches accounts that hold
+    money but have no ledger rows at all, off the ledger indexes.
+    """
+    def side(column, amount):
+        # column + 0 keeps sqlite off the (account, date, id) index, a
+        # straight table scan is ~3x faster than walking the index and
+        # looking up the amount of every row
+        account_number = column + 0
+        return (select(account_number.label('account_number'), amount.label('amount'))
+                .where(account_number.between(low, high)))
+
+    movements = union_all(side(Transaction.recipients_account_number, Transaction.amount),
+                          side(Transaction.senders_account_number, -Transaction.amount)).subquery()
+    ledger = (select(movements.c.account_number, func.sum(movements.c.amount).label('total'))
+              .group_by(movements.c.account_number)
+              .subquery())
+    with_ledger = (select(Account.account_number, Account.balance, ledger.c.total)
+                   .select_from(ledger)
+                   .join(Account, Account.account_number == ledger.c.account_number)
+                   .where(func.abs(Account.balance - ledger.c.total) >= TOLERANCE))
+
+    def no_rows(column):
+        return ~select(Transaction.id).where(column == Account.account_number).exists()
+
+    without_ledger = (select(Account.account_number, Account.balance, literal(0))
+                      .where(Account.account_number.between(low, high),
+                             func.abs(Account.balance) >= TOLERANCE,
+                             no_rows(Transaction.recipients_account_number),
+                             no_rows(Transaction.senders_account_number)))
+    return with_ledger, without_ledger
+
+
+def reconcile_range(connectable, low, high):
+    """(account_number, balance, ledger) of every mismatch in the range,
+    by account number"""
+    rows = [row for query in discrepancy_queries(low, high)
+            for row in connectable.execute(query).all()]
+    return sorted((number, Decimal(str(balance)).quantize(Decimal("0.01")),
+                   Decimal(str(ledger)).quantize(Decimal("0.01")))
+                  for number, balance, ledger in rows)
+
+
+def _reconcile_range_in_process(db_url, low, high):
+    # Own engine per worker process, nothing to share across a fork
+    engine = create_engine(db_url)
+    try:
+        with engine.connect() as connection:
+            return reconcile_range(connection, low, high)
+    finally:
+        engine.dispose()
+
+
+class Reconciler:
+    """Checks every Account.balance against the net of its ledger rows.
+
+    The ledger is summed per account by a single GROUP BY, so the work
+    is done by sqlite and not row by row in python. With
+    processes > 1 the account number space is cut into one range per
+    worker process, each grouping & comparing its own range on its own
+    connection.
+    """
+    def __init__(self,
+                 db_manager: DatabaseManager,
+                 auth_service: AuthService,
+                 processes: int = 1) -> None:
+        self.db_manager = db_manager
+        self.auth_service = auth_service
+        self.processes = processes
+
+    @requires_role(AccessRole.EMPLOYEE)
+    @requires_permissions(Permissions.MANAGE_ACCOUNTS)
+    def run(self, low: int | None = None, high: int | None = None,
+            on_discrepancy=None) -> dict:
+        """Reconciles accounts numbered low..high (all by default).
+        on_discrepancy(account_number, balance, ledger) is called for
+        every mismatch. Returns the number of accounts checked & off.
+        """
+        with self.db_manager.unit_of_work() as session:
+            if low is None:
+                low = session.execute(select(func.min(Account.account_number))).scalar()
+            if high is None:
+                high = session.execute(select(func.max(Account.account_number))).scalar()
+            checked = 0
+            if low is not None and high is not None:
+                checked = session.execute(select(func.count())
+                                          .where(Account.account_number.between(low, high))).scalar()
+
+        summary = {'checked': checked, 'discrepancies': 0}
+        if not checked:
+            return summary
+
+        for mismatches in self._run_ranges(self.split(low, high)):
+            for mismatch in mismatches:
+                summary['discrepancies'] += 1
+                if on_discrepancy is not None:
+                    on_discrepancy(*mismatch)
+        return summary
+
+    def split(self, low, high):
+        """low..high cut into one range per process"""
+        parts = max(1, self.processes)
+        step = max(1, -(-(high - low + 1) // parts))
+        return [(start, min(start + step - 1, high)) for start in range(low, high + 1, step)]
+
+    def _run_ranges(self, ranges):
+        if self.processes <= 1:
+            with self.db_manager.unit_of_work() as session:
+                for low, high in ranges:
+                    yield reconcile_range(session, low, high)
+            return
+
+        db_url = self.db_manager.engine.url.render_as_string(hide_password=False)
+        with ProcessPoolExecutor(self.processes) as pool:
+            futures = [pool.submit(_reconcile_range_in_process, db_url, low, high)
+                       for low, high in ranges]
+            for future in futures:
+                yield future.result()
@@ -1,18 +1,25 @@
+import csv
+import json
+import sys
+from concurrent.futures import Future
+from decimal import Decimal
 from typing import List
-from sqlalchemy.exc import SQLAlchemyError
 from frappster.auth import  AuthService
+from frappster.cache import AccountCache
 
 from frappster.models import Account, AccountData, Transaction, User, UserData
 from frappster.database import  DatabaseManager
+from frappster.idempotency import IdempotencyStore
+from frappster.instrumentation import instrumented
+from frappster.write_queue import GroupCommitQueue
 from frappster.types import AccessRole, Permissions, TransactionType
-from frappster.utils import (gen_randomrange,
-                             hash_password,
-                             is_valid_amount,
+from frappster.utils import (is_valid_amount,
                              requires_permissions,
-                             requires_role)
+                             requires_role,
+                             retry_on_conflict)
 from frappster.errors import (AccountNotFoundError,
-                              DatabaseError,
                               GeneralError,
+                              InsufficientFundsError,
                               PermissionDeniedError, 
                               UserNotFoundError,
                               )
@@ -31,6 +38,7 @@ class UserManager:
         self.auth_service = auth_service
         
 
+    @instrumented
     @requires_role(AccessRole.EMPLOYEE)
     @requires_permissions(Permissions.MANAGE_USERS)
     def create_user(self, **kwargs) -> int:
@@ -39,29 +47,30 @@ class UserManager:
             if not self.auth_service.is_admin():
                 raise PermissionDeniedError
 
-        self.db_manager.open_session()
-        try:
+        # Hashed on the bcrypt pool before taking the write lock
+        hashed_password = None
+        if 'password' in kwargs:
+            hashed_password = self.auth_service.hasher.hash(kwargs['password'])
+
+        # Reserved outside the write lock, see NumberAllocator
+        login_id = self.db_manager.number_allocator('login_id').next()
+
+        with self.db_manager.unit_of_work(write=True) as session:
             new_user = User(**kwargs)
 
-            new_user.login_id = gen_randomrange(4)
+            new_user.login_id = login_id
             
-            if 'password' in kwargs:
-                new_user.password = hash_password(kwargs['password'])
+            if hashed_password is not None:
+                new_user.password = hashed_password
 
             self.db_manager.create(new_user)
-            self.db_manager.commit()
-
-
-        except SQLAlchemyError as e:
-            self.db_manager.rollback()
-            raise DatabaseError(f"Database error occurred: {e}")
+            session.flush()
+            user_id = new_user.id
+            self.db_manager.invalidate_user(new_user.login_id)
 
-        else:
-            return new_user.id
-            
-        finally:
-            self.db_manager.close_session()
+        return user_id
 
+    @instrumented
     @requires_role(AccessRole.EMPLOYEE)
     @requires_permissions(Permissions.MANAGE_USERS, Permissions.UPDATE_USER)
     def update_user(self, user_data: dict, login_id:int):
@@ -69,23 +78,16 @@ class UserManager:
         if not self.auth_service.is_admin() and user_data['access_role'] == AccessRole.ADMIN:
             raise PermissionDeniedError
 
-        self.db_manager.open_session()
-        try:
-
+        with self.db_manager.unit_of_work(write=True):
             user = self.db_manager.get_by_login_id(login_id)
             user.from_dict(**user_data) 
-            self.db_manager.commit()
-           
-        except SQLAlchemyError as e:
-            self.db_manager.rollback()
-            raise DatabaseError(f"Database error occurred: {e}")
+            # Both keys, user_data may have changed the login_id
+            self.db_manager.invalidate_user(login_id)
+            self.db_manager.invalidate_user(user.login_id)
 
-        else:
-            return {'msg': "Succefully updated user"}
-
-        finally:
-            self.db_manager.close_session()
+        return {'msg': "Succefully updated user"}
 
+    @instrumented
     @requires_role(AccessRole.ADMIN)
     @requires_permissions([Permissions.MANAGE_USERS, Permissions.DELETE_USER])
     def delete_user(self, user: User):
@@ -98,30 +100,23 @@ class UserManager:
             
         pass
 
+    @instrumented
     @requires_role(AccessRole.EMPLOYEE)
     @requires_permissions(Permissions.MANAGE_USERS, Permissions.VIEW_USER)
     def get_user(self, login_id:int):
-
-        self.db_manager.open_session()
-        try:
-            user = self.db_manager.get_by_login_id(login_id)
+        with self.db_manager.unit_of_work():
+            user = self.db_manager.get_user_data(login_id)
             if user is None:
                 raise UserNotFoundError
-            if not isinstance(user, User):
+            if not isinstance(user, UserData):
                 raise UserNotFoundError
-            return UserData(**user.to_dict())
-
-        except SQLAlchemyError as e:
-            self.db_manager.rollback()
-            raise DatabaseError(f"Database error occurred: {e}")
-        finally:
-            self.db_manager.close_session()
+            return user
 
+    @instrumented
     @requires_role(AccessRole.EMPLOYEE)
     @requires_permissions(Permissions.MANAGE_USERS, Permissions.VIEW_USER)
     def get_all_users(self) -> List[UserData]:
-        self.db_manager.open_session()
-        try:
+        with self.db_manager.unit_of_work():
             users = self.db_manager.get_all(User)
             all_users: List[UserData] = []
 
@@ -130,13 +125,6 @@ class UserManager:
                all_users.append(user) 
             return all_users
 
-        except SQLAlchemyError as e:
-            self.db_manager.rollback()
-            raise DatabaseError(f"Database error occurred: {e}")
-
-        finally:
-            self.db_manager.close_session()
-
 
 class AccountService:
     """Handles user account related tasks"""
@@ -147,11 +135,12 @@ class AccountService:
         self.db_manager = db_manager
         self.auth_service = auth_service
 
+    @instrumented
     @requires_role(AccessRole.EMPLOYEE)
     @requires_permissions(Permissions.MANAGE_ACCOUNTS, Permissions.CREATE_ACCOUNT)
     def create_account(self, **kwargs):
-        self.db_manager.open_session()
-        try:
+        account_number = self.db_manager.number_allocator('account_number').next()
+        with self.db_manager.unit_of_work(write=True):
             login_id = kwargs['user_id']
             user = self.db_manager.get_by_login_id(login_id)
             if 'balance' in kwargs:
@@ -159,54 +148,62 @@ class AccountService:
                 kwargs['balance'] = amount
 
             new_account = Account(**kwargs)
-            new_account.account_number = gen_randomrange(6)
+            new_account.account_number = account_number
             new_account.clearings_number = 123
             new_account.user_id = user.id
+            users_login_id = user.login_id
 
             self.db_manager.create(new_account)
-            self.db_manager.commit()
-
-        except SQLAlchemyError as e:
-            self.db_manager.rollback()
-            raise DatabaseError
-
-        else:
-            return {'msg': f"Created account for user ID: {user.login_id}"}
-
-        finally:
-            self.db_manager.close_session()
-
+            if 'balance' in kwargs:
+                # Opening balance goes through the ledger too,
+                # so balances always reconcile against it
+                opening = Transaction()
+                opening.recipients_account_number = account_number
+                opening.amount = kwargs['balance']
+                opening.type = TransactionType.DEPOSIT
+                self.db_manager.create(opening)
+            self.db_manager.invalidate_user(user.login_id)
+
+        return {'msg': f"Created account for user ID: {users_login_id}"}
+
+    @instrumented
     @requires_role(AccessRole.EMPLOYEE)
     @requires_permissions(Permissions.MANAGE_ACCOUNTS, Permissions.CLOSE_ACCOUNT)
     def close_account(self):
         raise NotImplementedError
 
+    @instrumented
     @requires_role(AccessRole.CUSTOMER)
     @requires_permissions(Permissions.MANAGE_ACCOUNTS, Permissions.VIEW_ACCOUNT)
     def get_user_accounts(self, user:User | None = None):
         c_user = self.auth_service.get_logged_in_user()
-        self.db_manager.open_session()
-        
-        try:
-            user = self.db_manager.get_by_login_id(c_user.login_id)
-            if user is None:
-                raise UserNotFoundError
-
+        with self.db_manager.unit_of_work():
+            # The logged in UserData already knows its id,
+            # no need to fetch the user again
             accounts:List[AccountData] = []
-            for account in user.accounts:
+            for account in self.db_manager.get_accounts_by_user_id(c_user.id):
                 accounts.append(AccountData(**account.to_dict()))
 
             return accounts
 
-        except SQLAlchemyError as e:
-            self.db_manager.rollback()
-            raise DatabaseError
-
-        finally:
-            self.db_manager.close_session()
-
-    def get_account(self, account_number):
-            account = self.db_manager.get_by_account_number(account_number)
+    @instrumented
+    @requires_role(AccessRole.CUSTOMER)
+    @requires_permissions(Permissions.MANAGE_ACCOUNTS, Permissions.VIEW_ACCOUNT)
+    def refresh_accounts(self, cache: AccountCache) -> List[AccountData]:
+        """Brings a session AccountCache up to date and returns its accounts.
+        First call loads them all, later ones only fetch accounts updated
+        since the last refresh.
+        """
+        c_user = self.auth_service.get_logged_in_user()
+        with self.db_manager.unit_of_work():
+            rows = self.db_manager.get_account_changes(c_user.id, cache.watermark)
+            cache.merge((AccountData(**account.to_dict()), updated_at)
+                        for account, updated_at in rows)
+        return cache.accounts()
+
+    @instrumented
+    def get_account(self, account_number, profile='account_with_history_page'):
+            account = self.db_manager.get_by_account_number(account_number, profile)
             if account is None:
                 raise AccountNotFoundError
             if not isinstance(account, Account):
@@ -219,159 +216,367 @@ class TransactionService:
                  db_manager:DatabaseManager,
                  user_manager: UserManager,
                  auth_service: AuthService,
-                 account_service: AccountService
+                 account_service: AccountService,
+                 idempotency_store: IdempotencyStore | None = None,
+                 write_queue: GroupCommitQueue | None = None,
+                 account_cache: AccountCache | None = None
                  ) -> None:
         self.db_manager = db_manager
         self.account_service = account_service
         self.auth_service = auth_service
         self.user_manager = user_manager
+        if idempotency_store is None:
+            idempotency_store = IdempotencyStore(db_manager)
+        self.idempotency_store = idempotency_store
+        # Opt in group commit for deposits, withdrawals & transfers
+        self.write_queue = write_queue
+        # Session account cache that committed balances are written into
+        self.account_cache = account_cache
+
+    @instrumented
+    @requires_role(AccessRole.CUSTOMER)
+    @retry_on_conflict()
+    def make_deposit(self, account_number:int, amount, idempotency_key: str | None = None):
+        """idempotency_key: optional client chosen key, retrying with the
+        same key returns the first result instead of depositing again"""
+        return self._execute(self._deposit(account_number, amount, idempotency_key)).result()
 
+    @instrumented
     @requires_role(AccessRole.CUSTOMER)
-    def make_deposit(self, account_number:int, amount):
+    def submit_deposit(self, account_number:int, amount, idempotency_key: str | None = None) -> Future:
+        """make_deposit, but returns a Future resolved once the deposit
+        is committed. Group commits it when there is a write_queue."""
+        return self._execute(self._deposit(account_number, amount, idempotency_key))
+
+    def _deposit(self, account_number, amount, idempotency_key):
         # 1) check if its users accounts
         # 2) Then check if amount is float
         # 3) Sheesh
-        try:
-            self.db_manager.open_session()
-            current_user = self.user_manager.auth_service.get_logged_in_user()
-            account = self.db_manager.get_by_account_number(account_number)
-            if account.user_id != current_user.id:
-                # Log("sender account is not current users account")
-                raise PermissionDeniedError
+        current_user = self.user_manager.auth_service.get_logged_in_user()
+
+        def deposit():
+            with self.db_manager.unit_of_work(write=True):
+                account = self.db_manager.get_by_account_number(account_number)
+                if account.user_id != current_user.id:
+                    # Log("sender account is not current users account")
+                    raise PermissionDeniedError
 
-            amount = is_valid_amount(amount, account.balance)
+                valid_amount = is_valid_amount(amount, account.balance)
 
-            account.balance += amount
-            new_transaction = Transaction()
-            new_transaction.recipients_account_number = account_number
-            new_transaction.amount = amount
-            new_transaction.type = TransactionType.DEPOSIT
+                account.balance += valid_amount
+                self.db_manager.session.flush()
+                self._remember_balance(account.account_number, account.balance, account.version)
+                new_transaction = Transaction()
+                new_transaction.recipients_account_number = account_number
+                new_transaction.amount = valid_amount
+                new_transaction.type = TransactionType.DEPOSIT
 
-            self.db_manager.create(new_transaction)
-            self.db_manager.commit()
-        except SQLAlchemyError as e:
-            self.db_manager.rollback()
-            # Log db error
-            raise DatabaseError(e)
+                self.db_manager.create(new_transaction)
 
-        else:
             return {'msg': "Successfull deposit"}
 
-        finally: 
-            self.db_manager.close_session()
+        fingerprint = self._fingerprint(idempotency_key, 'deposit', amount, account_number)
+        return lambda: self.idempotency_store.run(current_user.id, idempotency_key,
+                                                  fingerprint, deposit)
 
+    @instrumented
     @requires_role(AccessRole.CUSTOMER)
-    def make_withdraw(self, account_number:int , amount):
+    @retry_on_conflict()
+    def make_withdraw(self, account_number:int , amount, idempotency_key: str | None = None):
+        """idempotency_key: see make_deposit"""
+        return self._execute(self._withdraw(account_number, amount, idempotency_key)).result()
+
+    @instrumented
+    @requires_role(AccessRole.CUSTOMER)
+    def submit_withdraw(self, account_number:int, amount, idempotency_key: str | None = None) -> Future:
+        """make_withdraw returning a Future, see submit_deposit"""
+        return self._execute(self._withdraw(account_number, amount, idempotency_key))
+
+    def _withdraw(self, account_number, amount, idempotency_key):
         # 1) check if its users accounts
         # 2) Then check if amount is float
         # 3) Check if sufficent funds
-        try:
-            self.db_manager.open_session()
-            current_user = self.user_manager.auth_service.get_logged_in_user()
-            account = self.db_manager.get_by_account_number(account_number)
-            if account.user_id != current_user.id:
-                # Log("sender account is not current users account")
-                # raise GeneralError
-                raise PermissionDeniedError
+        current_user = self.user_manager.auth_service.get_logged_in_user()
 
-            amount = is_valid_amount(amount, account.balance)
+        def withdraw():
+            with self.db_manager.unit_of_work(write=True):
+                account = self.db_manager.get_by_account_number(account_number)
+                if account.user_id != current_user.id:
+                    # Log("sender account is not current users account")
+                    # raise GeneralError
+                    raise PermissionDeniedError
 
-            account.balance -= amount
-            new_transaction = Transaction()
-            new_transaction.senders_account_number = account_number
-            new_transaction.amount = amount
-            new_transaction.type = TransactionType.WITHDRAW
+                valid_amount = is_valid_amount(amount, account.balance)
 
-            self.db_manager.create(new_transaction)
-            self.db_manager.commit()
-        except SQLAlchemyError as e:
-            self.db_manager.rollback()
-            raise DatabaseError(e)
+                account.balance -= valid_amount
+                self.db_manager.session.flush()
+                self._remember_balance(account.account_number, account.balance, account.version)
+                new_transaction = Transaction()
+                new_transaction.senders_account_number = account_number
+                new_transaction.amount = valid_amount
+                new_transaction.type = TransactionType.WITHDRAW
+
+                self.db_manager.create(new_transaction)
 
-        else:
             return {'msg': f"Succefull withdraw"}
 
-        finally: 
-            self.db_manager.close_session()
+        fingerprint = self._fingerprint(idempotency_key, 'withdraw', amount, account_number)
+        return lambda: self.idempotency_store.run(current_user.id, idempotency_key,
+                                                  fingerprint, withdraw)
 
+    @instrumented
     @requires_role(AccessRole.CUSTOMER)
     @requires_permissions(Permissions.MANAGE_ACCOUNTS, Permissions.INITIATE_OWN_TRANSACTION)
+    @retry_on_conflict()
     def initiate_transaction(self,
                            senders_account_number: int,
                            recievers_account_number:int,
-                           amount):
+                           amount,
+                           idempotency_key: str | None = None):
+        """idempotency_key: see make_deposit"""
+        return self._execute(self._transfer(senders_account_number,
+                                            recievers_account_number,
+                                            amount,
+                                            idempotency_key)).result()
+
+    @instrumented
+    @requires_role(AccessRole.CUSTOMER)
+    @requires_permissions(Permissions.MANAGE_ACCOUNTS, Permissions.INITIATE_OWN_TRANSACTION)
+    def submit_transaction(self,
+                           senders_account_number: int,
+                           recievers_account_number:int,
+                           amount,
+                           idempotency_key: str | None = None) -> Future:
+        """initiate_transaction returning a Future, see submit_deposit"""
+        return self._execute(self._transfer(senders_account_number,
+                                            recievers_account_number,
+                                            amount,
+                                            idempotency_key))
+
+    def _transfer(self, senders_account_number, recievers_account_number, amount, idempotency_key):
         # 1) check if sender is current user
         # 2) Check if sender amount is valid
         # 3) check if amount is sufficent 
         # 4) Check if reciever is valid
         # Send it
+        current_user = self.user_manager.auth_service.get_logged_in_user()
+
+        def transfer():
+            with self.db_manager.unit_of_work(write=True):
+                sender = self.db_manager.get_account_owner(senders_account_number)
+                if sender.user_id != current_user.id:
+                    # Log("sender account is not current users account")
+                    # raise GeneralError
+                    raise PermissionDeniedError
+
+                reciever = self.db_manager.get_account_owner(recievers_account_number)
+                if reciever.account_number == sender.account_number:
+                    # IDK too lazy to build a new one or make own messages
+                    # all the time...
+                    raise GeneralError
+
+                valid_amount = is_valid_amount(amount) # gonna raise errors 
+
+                # Funds are checked by the guarded UPDATE itself
+                debited, credited = self.db_manager.transfer_funds(sender.account_number,
+                                                                   reciever.account_number,
+                                                                   valid_amount)
+                self._remember_balance(sender.account_number, *debited)
+                self._remember_balance(reciever.account_number, *credited)
+
+            return {"msg": f"Sent to account: {reciever.account_number}" }
+
+        fingerprint = self._fingerprint(idempotency_key, 'transfer', amount,
+                                        senders_account_number, recievers_account_number)
+        return lambda: self.idempotency_store.run(current_user.id, idempotency_key,
+                                                  fingerprint, transfer)
+
+    @staticmethod
+    def _fingerprint(idempotency_key, operation, amount, *account_numbers):
+        """Fingerprint of a keyed request, the same however a retry spells
+        its amount (5, "5.0", Decimal("5.00")) or account numbers"""
+        if idempotency_key is None:
+            return None
+        return IdempotencyStore.fingerprint(operation,
+                                            *[int(number) for number in account_numbers],
+                                            is_valid_amount(amount).normalize())
+
+    def _remember_balance(self, account_number, balance, version):
+        cache = self.account_cache
+        if cache is not None:
+            self.db_manager.after_commit(lambda: cache.apply(account_number, balance, version))
+
+    def _execute(self, operation) -> Future:
+        """Runs a money moving operation through the write queue,
+        or right away when there is none"""
+        if self.write_queue is not None:
+            return self.write_queue.submit(operation)
+
+        future = Future()
         try:
-            self.db_manager.open_session()
-            current_user = self.user_manager.auth_service.get_logged_in_user()
-            senders_account = self.account_service.get_account(senders_account_number)
-            if senders_account.user_id != current_user.id:
-                # Log("sender account is not current users account")
-                # raise GeneralError
-                raise PermissionDeniedError
-
-            recievers_account = self.account_service.get_account(recievers_account_number)
-            if recievers_account == senders_account:
-                # IDK too lazy to build a new one or make own messages
-                # all the time...
-                raise GeneralError
-
-            amount = is_valid_amount(amount, senders_account.balance) # gonna raise errors 
-                
-            senders_account.balance -= amount
-            recievers_account.balance += amount
-
-            new_transaction = Transaction()
-            new_transaction.amount = amount
-            new_transaction.senders_account_number = senders_account.account_number
-            new_transaction.recipients_account_number = recievers_account.account_number
-            new_transaction.type = TransactionType.TRANSFER 
-
-            self.db_manager.create(new_transaction)
-            self.db_manager.commit()
-        except SQLAlchemyError as e:
-            self.db_manager.rollback()
-            raise DatabaseError(e)
-
-        else:
-            return {"msg": f"Sent to account: {recievers_account.account_number}" }
-
-        finally:
-            self.db_manager.close_session()
+            future.set_result(operation())
+        except Exception as e:
+            future.set_exception(e)
+        return future
 
+    @instrumented
+    @requires_role(AccessRole.CUSTOMER)
+    @requires_permissions(Permissions.MANAGE_ACCOUNTS, Permissions.INITIATE_OWN_TRANSACTION)
+    @retry_on_conflict()
+    def execute_batch(self, transfers):
+        """Runs many transfers in one transaction, for payroll &
+        settlement jobs.
+
+        transfers is a list of (senders_account_number,
+        recievers_account_number, amount). Each line gets the same checks
+        as initiate_transaction, applied in order against the running
+        balances, and a failing line doesn't stop the others. Returns one
+        dict per line, {'line', 'ok', 'msg'} or {'line', 'ok', 'error'}.
+        """
+        current_user = self.user_manager.auth_service.get_logged_in_user()
+        results = []
+        lines = []
+        for line, (senders_account_number, recievers_account_number, amount) in enumerate(transfers):
+            try:
+                amount = is_valid_amount(amount)
+                lines.append((line,
+                              int(senders_account_number),
+                              int(recievers_account_number),
+                              amount))
+            except ValueError:
+                results.append({'line': line, 'ok': False, 'error': str(AccountNotFoundError())})
+            except Exception as e:
+                results.append({'line': line, 'ok': False, 'error': str(e)})
+
+        with self.db_manager.unit_of_work(write=True):
+            touched = [number for _, sender, reciever, _ in lines for number in (sender, reciever)]
+            accounts = self.db_manager.lock_accounts(touched)
+            balances = {number: Decimal(str(row.balance)) for number, row in accounts.items()}
+            deltas = {}
+            ledger = []
+
+            for line, sender, reciever, amount in lines:
+                try:
+                    if sender not in accounts or reciever not in accounts:
+                        raise AccountNotFoundError
+                    if accounts[sender].user_id != current_user.id:
+                        raise PermissionDeniedError
+                    if sender == reciever:
+                        raise GeneralError
+                    if balances[sender] < amount:
+                        raise InsufficientFundsError
+                except Exception as e:
+                    results.append({'line': line, 'ok': False, 'error': str(e)})
+                    continue
+
+                balances[sender] -= amount
+                balances[reciever] += amount
+                deltas[sender] = deltas.get(sender, 0) - amount
+                deltas[reciever] = deltas.get(reciever, 0) + amount
+                ledger.append({'senders_account_number': sender,
+                               'recipients_account_number': reciever,
+                               'amount': amount,
+                               'type': TransactionType.TRANSFER})
+                results.append({'line': line, 'ok': True, 'msg': f"Sent to account: {reciever}"})
+
+            for number, balance, version in self.db_manager.apply_balance_deltas(deltas):
+                self._remember_balance(number, balance, version)
+            self.db_manager.insert_ledger_rows(ledger)
+
+        results.sort(key=lambda result: result['line'])
+        return results
+
+    @instrumented
     def get_history(self, account_number):
-        try:
-            self.db_manager.open_session()
-            current_user = self.user_manager.auth_service.get_logged_in_user()
-            account = self.account_service.get_account(account_number)
+        """Whole history of an account, newest first"""
+        return self.get_history_page(account_number, limit=None)['transactions']
+
+    @instrumented
+    def get_history_page(self,
+                         account_number,
+                         limit: int | None = 20,
+                         cursor=None,
+                         start=None,
+                         end=None):
+        """One page of an accounts history, newest first.
+        Pass the returned next_cursor back in to get the following page,
+        it is None when there is nothing more to show. start (inclusive)
+        and end (exclusive) are UTC, like the stored times.
+        """
+        current_user = self.user_manager.auth_service.get_logged_in_user()
+        with self.db_manager.unit_of_work():
+            account = self.db_manager.get_account_owner(account_number)
             if account.user_id != current_user.id:
                 # Log("sender account is not current users account")
                 # raise GeneralError
                 raise PermissionDeniedError
-            transactions = []
-            for transaction in account.sent_transactions:
-                transaction = transaction.to_dict()
-                transactions.append(transaction)
-
-            for transaction in account.received_transactions:
-                transactions.append(transaction.to_dict())
-
-            self.db_manager.commit()
-        except SQLAlchemyError as e:
-            self.db_manager.rollback()
-            raise DatabaseError(e)
-
-        else:
-            # return {"msg": f"Sent to account: {recievers_account.account_number}" }
-            return transactions
-
-        finally:
-            self.db_manager.close_session()
-
-
-
 
+            # Fetch one extra row to know if there is a next page
+            rows = self.db_manager.get_history_page(account.account_number,
+                                                    None if limit is None else limit + 1,
+                                                    cursor,
+                                                    start,
+                                                    end)
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1].date_key, rows[-1].id)
+
+        transactions = [Transaction.row_to_dict(row) for row in rows]
+        return {'transactions': transactions, 'next_cursor': next_cursor}
+
+    STATEMENT_FIELDS = ['id', 'date', 'type', 'sender_number',
+                        'recipient_number', 'amount', 'balance']
+
+    @instrumented
+    def export_statement(self,
+                         account_number,
+                         start=None,
+                         end=None,
+                         fmt: str = "csv",
+                         out=None) -> int:
+        """Writes an accounts transactions between start (inclusive) and
+        end (exclusive), both UTC like the stored times, oldest first, to out (stdout by default) as csv
+        or jsonl. amount is signed from the accounts side and balance is
+        the running balance after each row. Rows are streamed, nothing is
+        held in memory. Returns the number of rows written.
+        """
+        if fmt not in ("csv", "jsonl"):
+            raise ValueError(f"Unknown statement format: {fmt}")
+        if out is None:
+            out = sys.stdout
+
+        current_user = self.user_manager.auth_service.get_logged_in_user()
+        # One read transaction, so the opening balance & rows are one snapshot
+        with self.db_manager.unit_of_work():
+            account = self.db_manager.get_account_owner(account_number)
+            if account.user_id != current_user.id:
+                raise PermissionDeniedError
+            account_number = account.account_number
+
+            # Current balance minus everything since start is the balance
+            # the statement opens with
+            balance = Decimal(str(self.db_manager.get_by_account_number(account_number).balance))
+            balance -= self.db_manager.get_net_movement(account_number, start)
+
+            if fmt == "csv":
+                writer = csv.writer(out)
+                writer.writerow(self.STATEMENT_FIELDS)
+
+            written = 0
+            for row in self.db_manager.stream_statement(account_number, start, end):
+                amount = Decimal(str(row.amount))
+                if row.senders_account_number == account_number:
+                    amount = -amount
+                balance += amount
+
+                line = Transaction.row_to_dict(row)
+                line['amount'] = round(amount, 2)
+                line['balance'] = round(balance, 2)
+                if fmt == "csv":
+                    writer.writerow([line[field] for field in self.STATEMENT_FIELDS])
+                else:
+                    out.write(json.dumps({field: line[field] for field in self.STATEMENT_FIELDS},
+                                         default=str) + "\n")
+                written += 1
+        return written
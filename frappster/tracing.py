@@ -0,0 +1,156 @@
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+_current_span: ContextVar["Span | None"] = ContextVar("frappster_current_span", default=None)
+_span_ids = itertools.count(1)
+_tracer = None
+
+
+class Span:
+    """One timed step, its parent is whatever span was open when it
+    started, in this thread or the one that submitted the work"""
+    __slots__ = ('name', 'category', 'attrs', 'span_id', 'parent_id', 'trace_id',
+                 'start_ns', 'duration_ns', 'thread_id', 'error')
+
+    def __init__(self, name, category, attrs, parent) -> None:
+        self.name = name
+        self.category = category
+        self.attrs = attrs
+        self.span_id = next(_span_ids)
+        self.parent_id = None if parent is None else parent.span_id
+        self.trace_id = self.span_id if parent is None else parent.trace_id
+        self.start_ns = time.perf_counter_ns()
+        self.duration_ns = 0
+        self.thread_id = threading.get_ident()
+        self.error = None
+
+
+class Tracer:
+    """Writes every finished span to path as it ends.
+
+    fmt "jsonl" is one span object per line. fmt "chrome" is the trace
+    event format chrome://tracing and Perfetto open, spans show nested
+    per thread on a shared timeline. Without fmt it's picked from the
+    extension, .json means chrome.
+    """
+    def __init__(self, path: str, fmt: str | None = None) -> None:
+        if fmt is None:
+            fmt = "chrome" if path.endswith(".json") else "jsonl"
+        if fmt not in ("jsonl", "chrome"):
+            raise ValueError(f"Unknown trace format: {fmt}")
+        self.fmt = fmt
+        self.path = path
+        # perf_counter is what spans are timed with, this puts them on
+        # the wall clock
+        self._epoch_ns = time.time_ns() - time.perf_counter_ns()
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._file = open(path, "w", encoding="utf-8")
+        if fmt == "chrome":
+            # The array may be left open, viewers accept that if we crash
+            self._file.write("[\n")
+
+    def write(self, span: Span):
+        start_us = (span.start_ns + self._epoch_ns) / 1000
+        if self.fmt == "chrome":
+            args = dict(span.attrs, span_id=span.span_id, parent_id=span.parent_id,
+                        trace_id=span.trace_id)
+            if span.error is not None:
+                args['error'] = span.error
+            record = {'name': span.name, 'cat': span.category, 'ph': "X",
+                      'ts': start_us, 'dur': span.duration_ns / 1000,
+                      'pid': self._pid, 'tid': span.thread_id, 'args': args}
+            line = json.dumps(record, default=str) + ",\n"
+        else:
+            record = {'trace_id': span.trace_id, 'span_id': span.span_id,
+                      'parent_id': span.parent_id, 'name': span.name,
+                      'category': span.category, 'start_us': start_us,
+                      'duration_ms': span.duration_ns / 1e6,
+                      'thread': span.thread_id, 'attrs': span.attrs, 'error': span.error}
+            line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            if self.fmt == "chrome":
+                # A last event without the trailing comma closes the array
+                self._file.write(json.dumps({'name': "trace end", 'ph': "i", 's': "g",
+                                             'ts': (time.perf_counter_ns() + self._epoch_ns) / 1000,
+                                             'pid': self._pid, 'tid': threading.get_ident()}))
+                self._file.write("\n]\n")
+            self._file.close()
+
+
+def start_tracing(path: str, fmt: str | None = None) -> Tracer:
+    """Traces everything from now on into path, see Tracer"""
+    global _tracer
+    stop_tracing()
+    _tracer = Tracer(path, fmt)
+    return _tracer
+
+
+def stop_tracing():
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.close()
+
+
+def is_tracing() -> bool:
+    return _tracer is not None
+
+
+@contextmanager
+def span(name: str, category: str = "app", **attrs):
+    """Times the block as a child of the current span. Costs next to
+    nothing while tracing is off."""
+    tracer = _tracer
+    if tracer is None:
+        yield None
+        return
+    current = Span(name, category, attrs, _current_span.get())
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.duration_ns = time.perf_counter_ns() - current.start_ns
+        _current_span.reset(token)
+        tracer.write(current)
+
+
+def record_span(name: str, category: str, start_ns: int, duration_ns: int, **attrs):
+    """Adds a step timed elsewhere (perf_counter_ns) as a finished
+    child of the current span, like a SQL statement from engine events"""
+    tracer = _tracer
+    if tracer is None:
+        return
+    finished = Span(name, category, attrs, _current_span.get())
+    finished.start_ns = start_ns
+    finished.duration_ns = duration_ns
+    tracer.write(finished)
+
+
+def traced(name: str | None = None, category: str = "app"):
+    """Decorator version of span, named after the function by default"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with span(span_name, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -73,6 +73,14 @@ ROLE_PERMISSIONS = {
                           Permissions.VIEW_USER
                           ],
 }
- 
 
+def permission_mask(permissions) -> int:
+    """Folds permissions into one int, a bit per permission"""
+    mask = 0
+    for permission in permissions:
+        mask |= 1 << permission.value
+    return mask
 
+# ROLE_PERMISSIONS compiled once, a permission check is then a single AND
+ROLE_PERMISSION_MASKS = {role: permission_mask(permissions)
+                         for role, permissions in ROLE_PERMISSIONS.items()}
@@ -1,32 +1,53 @@
+import threading
 import time
 
+# Only what the main menu needs is imported up front, rich widgets are
+# imported where they're drawn & the services by _open_services
 from rich.console import Console
-from rich.panel import Panel
-from rich.progress import track
-from rich.table import Table, box
-from rich.text import Text
 from prompt_toolkit import prompt
 from prompt_toolkit.completion import WordCompleter
 
-from frappster.database import DatabaseManager
-from frappster.auth import AuthService
-from frappster.services import UserManager, AccountService, TransactionService
+from frappster.cache import AccountCache
+from frappster.tracing import span
 from frappster.types import AccessRole, AccountType
 from frappster.errors import (AccountNotFoundError,
                               InvalidCommandError,
                               PermissionDeniedError)
 
 class BankingApp:
-    def __init__(self):
-        self.db_manager = DatabaseManager()
-        self.auth_service = AuthService(self.db_manager)
-        self.user_manager = UserManager(self.db_manager, self.auth_service)
-        self.account_service = AccountService(self.db_manager, self.auth_service)
-        self.transaction_service = TransactionService(self.db_manager, 
-                                                      self.user_manager,
-                                                      self.auth_service,
-                                                      self.account_service)
+    def __init__(self, db_url="sqlite:///test.db"):
+        self.db_url = db_url
         self.console = Console()
+        # SQLAlchemy & the database take most of the startup, they load
+        # while the main menu waits for input, see wait_for_services
+        self._services_error = None
+        self._services_thread = threading.Thread(target=self._open_services,
+                                                 name="frappster-startup")
+        self._services_thread.start()
+
+    def _open_services(self):
+        try:
+            from frappster.auth import AuthService
+            from frappster.database import DatabaseManager
+            from frappster.services import AccountService, TransactionService, UserManager
+
+            self.db_manager = DatabaseManager(self.db_url)
+            self.auth_service = AuthService(self.db_manager)
+            self.user_manager = UserManager(self.db_manager, self.auth_service)
+            self.account_service = AccountService(self.db_manager, self.auth_service)
+            self.transaction_service = TransactionService(self.db_manager,
+                                                          self.user_manager,
+                                                          self.auth_service,
+                                                          self.account_service)
+        except Exception as e:
+            self._services_error = e
+
+    def wait_for_services(self):
+        """Blocks until the database is open, raises whatever opening it
+        failed with"""
+        self._services_thread.join()
+        if self._services_error is not None:
+            raise self._services_error
 
     def main_menu(self):
         self.console.print("[bold cyan]Welcome to Frappster Bank CLI[/bold cyan]")
@@ -53,25 +74,36 @@ class BankingApp:
         user_id = prompt("Enter Login ID: ",
                                       is_password=False)
         password = prompt("Enter password: ", is_password=True)
-        
+        self.wait_for_services()
+
         try:
-            self.auth_service.login_user(user_id, password)
+            with span("Login", "ui"):
+                self.auth_service.login_user(user_id, password)
         except Exception as e:
             self.show_error(e)
             self.main_menu()
 
         else:
             self.user = self.auth_service.get_logged_in_user()
-            self.accounts = self.account_service.get_user_accounts()
-            self.account_options = [str(account.account_number) for account in self.accounts]
+            # Kept up to date by the transaction service, see refresh_accounts
+            self.account_cache = AccountCache()
+            self.transaction_service.account_cache = self.account_cache
+            with span("Load Accounts", "ui"):
+                self.refresh_accounts()
             self.show_user_profile()
             self.account_dashboard()
 
+    def refresh_accounts(self):
+        self.accounts = self.account_service.refresh_accounts(self.account_cache)
+        self.account_options = [str(account.account_number) for account in self.accounts]
+
     def show_error(self, msg):
         self.console.print(f"[red]{msg}")
         time.sleep(0.5)
 
     def simulate_work(self, msg="Validating..."):
+        from rich.progress import track
+
         for _ in track(range(10), description=msg):
             time.sleep(0.1)
 
@@ -103,7 +135,9 @@ class BankingApp:
             elif choice == "Wire Transfer":
                 self.wire_transfer()
             elif choice == "Logout":
-                self.auth_service.logout_user()
+                with span("Logout", "ui"):
+                    self.auth_service.logout_user()
+                self.transaction_service.account_cache = None
                 self.main_menu()
             else:
                 raise InvalidCommandError
@@ -113,6 +147,9 @@ class BankingApp:
             self.account_dashboard()
 
     def show_user_profile(self):
+        from rich.panel import Panel
+        from rich.text import Text
+
         profile_text = Text()
         profile_text.append(f"Login ID: {self.user.login_id}\n", style="bold")
         profile_text.append(f"Name: {self.user.first_name} {self.user.middle_name} {self.user.last_name}\n")
@@ -126,7 +163,11 @@ class BankingApp:
         self.console.print(panel)
 
     def view_accounts(self):
-        accounts = self.account_service.get_user_accounts()
+        from rich.table import Table
+
+        with span("View Accounts", "ui"):
+            self.refresh_accounts()
+        accounts = self.accounts
         try:
             if not accounts:
                 raise AccountNotFoundError
@@ -158,16 +199,39 @@ class BankingApp:
             self.show_error(e)
             self.account_dashboard()
 
-    def view_account_transactions(self, account_number):
-        # Show tranaction history for chosen account
-        transactions = self.transaction_service.get_history(account_number)
+    def view_account_transactions(self, account_number, page_size=20):
+        # Show tranaction history for chosen account, one page at a time
+        with span("View Transactions", "ui", page=1):
+            page = self.transaction_service.get_history_page(account_number, page_size)
         try:
-            if not transactions:
+            if not page['transactions']:
                 raise AccountNotFoundError
         except AccountNotFoundError:
             self.show_error("No transactions yet")
             self.account_dashboard()
 
+        page_number = 1
+        while True:
+            self.show_transactions_table(account_number, page['transactions'])
+            if page['next_cursor'] is None:
+                break
+
+            options = ["Next page", "Done"]
+            completer = WordCompleter(options)
+            choice = prompt(f"Choose an action [{options}]: ",
+                            completer=completer,
+                            default=options[0])
+            if choice != options[0]:
+                break
+            page_number += 1
+            with span("View Transactions", "ui", page=page_number):
+                page = self.transaction_service.get_history_page(account_number,
+                                                                 page_size,
+                                                                 page['next_cursor'])
+
+    def show_transactions_table(self, account_number, transactions):
+        from rich.table import Table
+
         table = Table(title=f"Transactin history for account: {account_number} ", show_header=True)
         table.add_column("Date", justify='center')
         table.add_column("Senders Number", justify='center')
@@ -206,7 +270,8 @@ class BankingApp:
             account_number = prompt("To account: ", completer=completer)
             amount = prompt("Enter amount to deposit: ")
             # self.simulate_work() 
-            msg = self.transaction_service.make_deposit(account_number, amount)
+            with span("Deposit", "ui"):
+                msg = self.transaction_service.make_deposit(account_number, amount)
         except AccountNotFoundError as e:
             self.show_error("No account created yet")
             self.account_dashboard()
@@ -231,7 +296,8 @@ class BankingApp:
             account_number = prompt("From account: ", completer=completer)
             amount = prompt("Enter amount to withdraw: ")
             # self.simulate_work() 
-            msg = self.transaction_service.make_withdraw(account_number, amount)
+            with span("Withdraw", "ui"):
+                msg = self.transaction_service.make_withdraw(account_number, amount)
         except AccountNotFoundError as e:
             self.show_error(e)
             self.account_dashboard()
@@ -254,9 +320,10 @@ class BankingApp:
             recievers_account_number = prompt("To account: ", completer=completer)
             amount = prompt("Enter amount to transfer: ")
             # self.simulate_work() 
-            msg = self.transaction_service.initiate_transaction(account_number,
-                                                                recievers_account_number,
-                                                                amount)
+            with span("Wire Transfer", "ui"):
+                msg = self.transaction_service.initiate_transaction(account_number,
+                                                                    recievers_account_number,
+                                                                    amount)
         except AccountNotFoundError as e:
             self.show_error(e)
             self.account_dashboard()
@@ -342,7 +409,8 @@ class BankingApp:
                                                            )
 
             try:
-                self.user_manager.create_user(**user_data)
+                with span("Create User", "ui"):
+                    self.user_manager.create_user(**user_data)
                 self.console.print("[green]User created successfully![/green]")
                 self.show_user_managment()
                 break  
@@ -411,7 +479,8 @@ class BankingApp:
                                                            )
 
             try:
-                msg = self.user_manager.update_user(user_data, user.login_id)
+                with span("Edit User", "ui"):
+                    msg = self.user_manager.update_user(user_data, user.login_id)
                 self.console.print(f"[green]{msg['msg']}[/green]")
                 self.show_user_managment()
                 break  
@@ -442,6 +511,8 @@ class BankingApp:
                                                                  default=user_data[retry_field])
 
     def show_all_users(self):
+        from rich.table import Table, box
+
         table = Table(show_header=True, header_style="bold magenta")
         table.box = box.ROUNDED
         table.add_column("Login ID", style="dim")
@@ -450,7 +521,8 @@ class BankingApp:
         table.add_column("Role", justify="center")
 
         try:
-            users = self.user_manager.get_all_users()
+            with span("Show All Users", "ui"):
+                users = self.user_manager.get_all_users()
 
         except Exception as e:
             self.show_error(e)
@@ -505,7 +577,8 @@ class BankingApp:
             if choice == options[0]:
                 account_data['balance'] = prompt(f"Amount: ")
 
-            msg = self.account_service.create_account(**account_data)
+            with span("Create Account", "ui"):
+                msg = self.account_service.create_account(**account_data)
             self.console.print(msg['msg']) 
 
         except Exception as e:
@@ -1,10 +1,17 @@
-import bcrypt
 import random
 import decimal
+import time
 from decimal import Decimal
 from datetime import datetime, timedelta
+from functools import wraps
 
-from frappster.errors import InsufficientFundsError, InvalidAmountError, PermissionDeniedError
+from frappster.errors import (ConcurrentUpdateError,
+                              InsufficientFundsError,
+                              InvalidAmountError,
+                              PermissionDeniedError)
+from frappster.hashing import get_hasher
+from frappster.tracing import is_tracing, span
+from frappster.types import permission_mask
 
 def is_valid_amount(amount, available_funds: Decimal | None = None):
     try:
@@ -24,14 +31,11 @@ def is_valid_amount(amount, available_funds: Decimal | None = None):
     return amount
 
 def hash_password(password):
-    salt = bcrypt.gensalt()
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'),
-                                    salt)
-    return hashed_password.decode('utf-8')
+    # On the shared hasher's pool at its calibrated cost, see hashing.py
+    return get_hasher().hash(password)
 
 def verify_password(password, hashed_password):
-    return bcrypt.checkpw(password.encode('utf-8'),
-                          hashed_password.encode('utf-8'))
+    return get_hasher().verify(password, hashed_password)
 
 def is_too_many_login_attempts(login_attempts: int, max_attempts: int = 3):
     return login_attempts > max_attempts
@@ -41,45 +45,75 @@ def reset_login_attempts(last_attempt: datetime, max_time_seconds: int = 30):
     return time_diff >= timedelta(seconds=max_time_seconds)
 
 def requires_role(minimum_role):
+    minimum_value = minimum_role.value
+
     def decorator(func):
-        def wrapper(self, *args, **kwargs):
+        def check(self):
             if not hasattr(self, 'auth_service') or self.auth_service is None:
                 raise AttributeError("AuthService instance is required for role check")
 
             current_user_role = self.auth_service.current_user.access_role
-            if current_user_role.value < minimum_role.value:
+            if current_user_role.value < minimum_value:
                 raise PermissionDeniedError
+
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if is_tracing():
+                with span("requires_role", "auth", role=minimum_role.name):
+                    check(self)
+            else:
+                check(self)
             return func(self, *args, **kwargs)
         return wrapper
     return decorator
 
 def requires_permissions(*required_permissions):
+    # Permissions may also be given as a single list
+    if len(required_permissions) == 1 and isinstance(required_permissions[0], list):
+        required_permissions = tuple(required_permissions[0])
+    # Resolved once here, every call is then one AND against the role mask
+    required_mask = permission_mask(required_permissions)
+
     def decorator(func):
-        def wrapper(self, *args, **kwargs):
+        def check(self):
             if not hasattr(self, 'auth_service') or self.auth_service is None:
                 raise AttributeError("AuthService instance is required for permissions check")
 
-            permissions_to_check = required_permissions
-            # Unpack permissions if passed as a single list in args
-            if len(args) > 0 and isinstance(args[0], list):
-                permissions_to_check = args[0]
-                args = args[1:]
-
-            has_permision = False
             # If has atleast one given permsion, proceeeed
-            for permission in permissions_to_check:
-                if self.auth_service.has_permission(permission):
-                    has_permision = True
-
             # if has none welp bye bye
-            if not has_permision:
+            if not self.auth_service.has_any_permission(required_mask):
                 raise PermissionDeniedError
 
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if is_tracing():
+                with span("requires_permissions", "auth",
+                          permissions=[permission.name for permission in required_permissions]):
+                    check(self)
+            else:
+                check(self)
             return func(self, *args, **kwargs)
         return wrapper
     return decorator
 
-def gen_randomrange(digits=6):
-    return random.randrange(111111, 999999, digits)
+def retry_on_conflict(attempts=5, base_delay=0.002, max_delay=0.1):
+    """Re-runs the call when it lost a race on an account row
+    (ConcurrentUpdateError), sleeping a jittered exponential backoff
+    between attempts. Last failure is raised as is.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            for attempt in range(attempts):
+                try:
+                    return func(self, *args, **kwargs)
+                except ConcurrentUpdateError:
+                    if attempt == attempts - 1:
+                        raise
+                    delay = min(max_delay, base_delay * 2 ** attempt)
+                    with span("retry backoff", "retry", attempt=attempt + 1):
+                        time.sleep(random.uniform(0, delay))
+        return wrapper
+    return decorator
 
 
@@ -0,0 +1,127 @@
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from frappster.errors import GeneralError
+
+_STOP = object()
+
+
+class GroupCommitQueue:
+    """Write behind queue that commits many money movements at once.
+
+    Operations are collected for up to window_ms, or until max_batch of
+    them are waiting, and then run by one writer thread in a single
+    transaction, each inside its own SAVEPOINT so a failing operation
+    doesn't take the others down. Every submit returns a Future that
+    resolves after the shared commit, i.e. once the write is durable.
+    """
+    def __init__(self, db_manager, window_ms: float = 2.0, max_batch: int = 64) -> None:
+        self.db_manager = db_manager
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name="frappster-group-commit",
+                                                daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Commits whatever is still queued, then stops the writer"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+    def submit(self, operation) -> Future:
+        """Queues operation, a callable doing its db work in the
+        current unit of work. Its return value resolves the future.
+        """
+        if self._thread is None:
+            raise GeneralError("Group commit queue is not running")
+        future = Future()
+        # Runs in the callers context, so its queries count towards the
+        # service call that submitted it
+        self._queue.put((operation, future, contextvars.copy_context()))
+        return future
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+
+        # Anything submitted while stopping still gets written
+        leftover = []
+        while not self._queue.empty():
+            item = self._queue.get()
+            if item is not _STOP:
+                leftover.append(item)
+        if leftover:
+            self._commit(leftover)
+
+    def _commit(self, batch):
+        outcomes = []
+        try:
+            with self.db_manager.unit_of_work(write=True) as session:
+                for operation, future, context in batch:
+                    # Earlier operations may have changed rows with plain
+                    # UPDATEs, don't let this one see stale objects
+                    session.expire_all()
+                    callbacks = session.info.setdefault('after_commit', [])
+                    registered = len(callbacks)
+                    try:
+                        outcomes.append((future, context.run(self._run_nested, session, operation), None))
+                    except Exception as e:
+                        # Rolled back to the savepoint, so are its callbacks
+                        del callbacks[registered:]
+                        outcomes.append((future, None, e))
+        except Exception as e:
+            # Commit failed, nothing of the batch is durable
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    @staticmethod
+    def _run_nested(session, operation):
+        # The savepoint release flushes, so it belongs to the operation too
+        with session.begin_nested():
+            return operation()
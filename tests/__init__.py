@@ -0,0 +1,5 @@
+import os
+
+# bcrypt at its cheapest cost, calibrating to a real login latency
+# would make the suite crawl
+os.environ.setdefault("FRAPPSTER_BCRYPT_ROUNDS", "4")
@@ -0,0 +1,85 @@
+import os
+import tempfile
+from decimal import Decimal
+
+from frappster.auth import AuthService
+from frappster.database import DatabaseManager
+from frappster.models import Account, User, UserData
+from frappster.services import AccountService, TransactionService, UserManager
+from frappster.types import AccessRole, AccountType
+
+
+class Client:
+    """Own AuthService & services on a shared DatabaseManager,
+    like a second BankingApp talking to the same database.
+    """
+    def __init__(self, db_manager, user=None) -> None:
+        self.auth_service = AuthService(db_manager)
+        self.auth_service.current_user = user
+        self.user_manager = UserManager(db_manager, self.auth_service)
+        self.account_service = AccountService(db_manager, self.auth_service)
+        self.transaction_service = TransactionService(db_manager,
+                                                      self.user_manager,
+                                                      self.auth_service,
+                                                      self.account_service)
+
+
+class Bank:
+    """Wires up a DatabaseManager on a throw away sqlite file
+    together with all the services, like BankingApp does.
+    """
+    def __init__(self, **db_kwargs) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "bank.db")
+        self.db_manager = DatabaseManager(f"sqlite:///{self.db_path}", **db_kwargs)
+        self.auth_service = AuthService(self.db_manager)
+        self.user_manager = UserManager(self.db_manager, self.auth_service)
+        self.account_service = AccountService(self.db_manager, self.auth_service)
+        self.transaction_service = TransactionService(self.db_manager,
+                                                      self.user_manager,
+                                                      self.auth_service,
+                                                      self.account_service)
+
+    def add_user(self, login_id, access_role=AccessRole.CUSTOMER, password="x"):
+        session = self.db_manager.open_session()
+        user = User(login_id=login_id,
+                    first_name="Test",
+                    last_name="User",
+                    address="Street 1",
+                    email="test@example.com",
+                    phone_number="123",
+                    password=password,
+                    access_role=access_role)
+        session.add(user)
+        session.commit()
+        data = UserData(**user.to_dict())
+        self.db_manager.close_session()
+        return data
+
+    def add_account(self, user, account_number, balance=0,
+                    account_type=AccountType.CHECKINGS):
+        session = self.db_manager.open_session()
+        session.add(Account(clearings_number=123,
+                            account_number=account_number,
+                            account_type=account_type,
+                            balance=Decimal(str(balance)),
+                            user_id=user.id))
+        session.commit()
+        self.db_manager.close_session()
+
+    def balance(self, account_number):
+        session = self.db_manager.open_session()
+        account = session.query(Account).filter_by(account_number=account_number).one()
+        balance = account.balance
+        self.db_manager.close_session()
+        return balance
+
+    def login_as(self, user):
+        self.auth_service.current_user = user
+
+    def new_client(self, user=None):
+        return Client(self.db_manager, user)
+
+    def close(self):
+        self.db_manager.engine.dispose()
+        self.tmp_dir.cleanup()
@@ -0,0 +1,90 @@
+import unittest
+from decimal import Decimal
+
+from sqlalchemy import event
+
+from frappster.cache import AccountCache
+from frappster.errors import InsufficientFundsError
+from tests.support import Bank
+
+
+class TestAccountCache(unittest.TestCase):
+
+    def setUp(self):
+        self.bank = Bank()
+        self.alice = self.bank.add_user(1001)
+        self.bob = self.bank.add_user(1002)
+        self.bank.add_account(self.alice, 111111, balance=100)
+        self.bank.add_account(self.alice, 111112)
+        self.bank.add_account(self.bob, 222222)
+        self.bank.login_as(self.alice)
+
+        self.cache = AccountCache()
+        self.bank.transaction_service.account_cache = self.cache
+        self.bank.account_service.refresh_accounts(self.cache)
+
+    def tearDown(self):
+        self.bank.close()
+
+    def balances(self):
+        return {account.account_number: account.balance
+                for account in self.cache.accounts()}
+
+    def test_first_refresh_loads_own_accounts(self):
+        self.assertEqual(self.balances(), {111111: 100, 111112: 0})
+        self.assertIsNotNone(self.cache.watermark)
+
+    def test_money_moves_update_in_place(self):
+        statements = []
+        record = lambda *args: statements.append(args[2])
+        service = self.bank.transaction_service
+        service.make_deposit(111111, 50)
+        service.make_withdraw(111111, 20)
+        service.initiate_transaction(111111, 111112, 30)
+        service.initiate_transaction(111111, 222222, 10)
+
+        event.listen(self.bank.db_manager.engine, "before_cursor_execute", record)
+        try:
+            balances = self.balances()
+        finally:
+            event.remove(self.bank.db_manager.engine, "before_cursor_execute", record)
+        self.assertEqual(statements, [])
+        self.assertEqual(balances, {111111: 90, 111112: 30})
+        self.assertNotIn(222222, self.cache)
+
+    def test_batch_updates_in_place(self):
+        results = self.bank.transaction_service.execute_batch([(111111, 111112, 30),
+                                                               (111111, 222222, "12.5"),
+                                                               (111112, 111111, 5)])
+        self.assertTrue(all(result['ok'] for result in results))
+        self.assertEqual(self.balances(), {111111: Decimal("62.5"), 111112: 25})
+        self.assertEqual(self.bank.balance(111111), Decimal("62.5"))
+        self.assertNotIn(222222, self.cache)
+
+    def test_failed_transfer_leaves_cache(self):
+        with self.assertRaises(InsufficientFundsError):
+            self.bank.transaction_service.initiate_transaction(111111, 111112, 1000)
+        self.assertEqual(self.balances(), {111111: 100, 111112: 0})
+
+    def test_refresh_picks_up_other_writers(self):
+        self.bank.add_account(self.alice, 111113, balance=5)
+        self.bank.db_manager.open_session()
+        with self.bank.db_manager.unit_of_work(write=True):
+            account = self.bank.db_manager.get_by_account_number(111112)
+            account.balance += 7
+        self.bank.db_manager.close_session()
+
+        accounts = self.bank.account_service.refresh_accounts(self.cache)
+        self.assertEqual([account.account_number for account in accounts],
+                         [111111, 111112, 111113])
+        self.assertEqual(self.balances()[111112], 7)
+
+    def test_older_version_is_ignored(self):
+        version = self.cache.accounts()[0].version
+        self.cache.apply(111111, Decimal(1), version + 2)
+        self.cache.apply(111111, Decimal(2), version + 1)
+        self.assertEqual(self.balances()[111111], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
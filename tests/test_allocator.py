@@ -0,0 +1,80 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from frappster.allocator import NumberAllocator, is_luhn_valid, luhn_digit, permute
+from frappster.errors import NumberSpaceExhaustedError
+from frappster.models import Account, User
+from frappster.types import AccessRole, AccountType
+from tests.support import Bank
+
+
+class TestNumbers(unittest.TestCase):
+
+    def test_luhn(self):
+        # Classic example, 7992739871 + 3
+        self.assertEqual(luhn_digit(7992739871), 3)
+        self.assertTrue(is_luhn_valid(79927398713))
+        self.assertFalse(is_luhn_valid(79927398714))
+
+    def test_permute_is_a_bijection(self):
+        for size in (1, 2, 10, 900, 1000):
+            values = [permute(index, size, b"key") for index in range(size)]
+            self.assertEqual(sorted(values), list(range(size)))
+        self.assertNotEqual([permute(i, 900, b"key") for i in range(10)],
+                            [permute(i, 900, b"other") for i in range(10)])
+
+
+class TestNumberAllocator(unittest.TestCase):
+
+    def setUp(self):
+        self.bank = Bank()
+
+    def tearDown(self):
+        self.bank.close()
+
+    def test_numbers_are_unique_checked_and_fixed_length(self):
+        allocator = NumberAllocator(self.bank.db_manager, 'test', digits=4, block_size=7)
+        numbers = allocator.take(900)
+        self.assertEqual(len(set(numbers)), 900)
+        self.assertTrue(all(1000 <= number <= 9999 for number in numbers))
+        self.assertTrue(all(is_luhn_valid(number) for number in numbers))
+        self.assertNotEqual(numbers[:10], sorted(numbers[:10]))
+        with self.assertRaises(NumberSpaceExhaustedError):
+            allocator.next()
+
+    def test_unpermuted_is_sequential(self):
+        allocator = NumberAllocator(self.bank.db_manager, 'test', digits=4, permuted=False)
+        self.assertEqual([number // 10 for number in allocator.take(3)], [100, 101, 102])
+
+    def test_allocators_never_share_numbers(self):
+        allocators = [NumberAllocator(self.bank.db_manager, 'test', block_size=5)
+                      for _ in range(4)]
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            batches = list(pool.map(lambda allocator: [allocator.next() for _ in range(50)],
+                                    allocators))
+        numbers = [number for batch in batches for number in batch]
+        self.assertEqual(len(set(numbers)), 200)
+
+    def test_services_use_the_allocator(self):
+        self.bank.login_as(self.bank.add_user(1000, AccessRole.ADMIN))
+        user_id = self.bank.user_manager.create_user(first_name="A", last_name="B",
+                                                     address="-", email="a@b",
+                                                     phone_number="-", password="pw",
+                                                     access_role=AccessRole.CUSTOMER)
+        session = self.bank.db_manager.open_session()
+        login_id = session.get(User, user_id).login_id
+        self.bank.db_manager.close_session()
+        self.assertTrue(is_luhn_valid(login_id))
+        self.assertEqual(len(str(login_id)), 7)
+
+        self.bank.account_service.create_account(user_id=login_id,
+                                                 account_type=AccountType.SAVINGS)
+        session = self.bank.db_manager.open_session()
+        account_number = session.query(Account).filter_by(user_id=user_id).one().account_number
+        self.bank.db_manager.close_session()
+        self.assertTrue(is_luhn_valid(account_number))
+        self.assertEqual(len(str(account_number)), 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import time
+import unittest
+
+from frappster.cache import LRUCache
+from frappster.errors import InvalidPasswordOrIDError, UserNotFoundError
+from frappster.types import AccessRole
+from frappster.utils import hash_password
+from tests.support import Bank
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_counts_hits_and_misses(self):
+        cache = LRUCache()
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('b')
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_entries_expire(self):
+        cache = LRUCache(ttl=0.01)
+        cache.set('a', 1)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+
+class TestUserCache(unittest.TestCase):
+
+    def setUp(self):
+        self.bank = Bank()
+        self.employee = self.bank.add_user(1000, AccessRole.EMPLOYEE)
+        self.alice = self.bank.add_user(1001, password=hash_password("pw"))
+        self.bank.login_as(self.employee)
+        self.cache = self.bank.db_manager.user_cache
+
+    def tearDown(self):
+        self.bank.close()
+
+    def test_get_user_reads_through(self):
+        self.bank.user_manager.get_user(1001)
+        self.bank.user_manager.get_user(1001)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_update_user_invalidates(self):
+        self.bank.user_manager.get_user(1001)
+        self.bank.user_manager.update_user({'email': "new@example.com", 'access_role': AccessRole.CUSTOMER}, 1001)
+        self.assertEqual(self.bank.user_manager.get_user(1001).email, "new@example.com")
+
+    def test_changed_login_id_invalidates_the_old_one(self):
+        self.bank.user_manager.get_user(1001)
+        self.bank.user_manager.update_user({'login_id': 1005, 'access_role': AccessRole.CUSTOMER}, 1001)
+        self.assertNotIn('1001', self.cache._data)
+        with self.assertRaises(UserNotFoundError):
+            self.bank.user_manager.get_user(1001)
+        self.assertEqual(self.bank.user_manager.get_user(1005).login_id, 1005)
+
+    def test_update_password_invalidates(self):
+        self.bank.user_manager.get_user(1001)
+        self.bank.auth_service.update_password(1001, "new pw")
+        self.assertNotIn('1001', self.cache._data)
+
+    def test_failed_login_still_reads_the_row(self):
+        self.bank.user_manager.get_user(1001)
+        auth = self.bank.new_client().auth_service
+        with self.assertRaises(InvalidPasswordOrIDError):
+            auth.login_user(1001, "wrong")
+        auth.login_user(1001, "pw")
+        self.assertEqual(auth.current_user.login_id, 1001)
+
+    def test_rolled_back_write_is_not_cached(self):
+        db_manager = self.bank.db_manager
+        with self.assertRaises(RuntimeError):
+            with db_manager.unit_of_work(write=True):
+                user = db_manager.get_by_login_id(1001)
+                user.email = "rolled@back.se"
+                db_manager.get_user_data(1001)
+                raise RuntimeError
+        self.assertEqual(self.bank.user_manager.get_user(1001).email, "test@example.com")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from sqlalchemy import update
+
+from frappster.errors import ConcurrentUpdateError
+from frappster.models import Account, Transaction
+from frappster.utils import retry_on_conflict
+from tests.support import Bank
+
+ROUNDS = 60
+
+
+class TestConcurrentServices(unittest.TestCase):
+    """Hammers one DatabaseManager from a thread pool with several
+    clients at once and checks nothing got lost or mixed up.
+    """
+
+    def setUp(self):
+        self.bank = Bank()
+        self.alice = self.bank.add_user(1001)
+        self.bob = self.bank.add_user(1002)
+        self.bank.add_account(self.alice, 111111, balance=1000)
+        self.bank.add_account(self.alice, 111112, balance=1000)
+        self.bank.add_account(self.bob, 222222, balance=1000)
+
+    def tearDown(self):
+        self.bank.close()
+
+    def test_no_lost_updates_or_cross_talk(self):
+        alice = self.bank.new_client(self.alice)
+        bob = self.bank.new_client(self.bob)
+
+        def alice_accounts():
+            accounts = alice.account_service.get_user_accounts()
+            return {account.user_id for account in accounts}
+
+        def bob_accounts():
+            accounts = bob.account_service.get_user_accounts()
+            return {account.user_id for account in accounts}
+
+        jobs = []
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            for _ in range(ROUNDS):
+                jobs.append(pool.submit(alice.transaction_service.make_deposit, 111111, 1))
+                jobs.append(pool.submit(alice.transaction_service.initiate_transaction,
+                                        111112, 222222, 1))
+                jobs.append(pool.submit(bob.transaction_service.make_withdraw, 222222, 1))
+                jobs.append(pool.submit(alice_accounts))
+                jobs.append(pool.submit(bob_accounts))
+
+            results = [job.result() for job in jobs]
+
+        owners = [result for result in results if isinstance(result, set)]
+        self.assertEqual(owners.count({self.alice.id}), ROUNDS)
+        self.assertEqual(owners.count({self.bob.id}), ROUNDS)
+
+        self.assertEqual(self.bank.balance(111111), Decimal(1000 + ROUNDS))
+        self.assertEqual(self.bank.balance(111112), Decimal(1000 - ROUNDS))
+        self.assertEqual(self.bank.balance(222222), Decimal(1000))
+
+        session = self.bank.db_manager.open_session()
+        self.assertEqual(session.query(Transaction).count(), 3 * ROUNDS)
+        self.bank.db_manager.close_session()
+
+
+class TestOptimisticLocking(unittest.TestCase):
+
+    def setUp(self):
+        self.bank = Bank()
+        self.alice = self.bank.add_user(1001)
+        self.bank.add_account(self.alice, 111111, balance=100)
+
+    def tearDown(self):
+        self.bank.close()
+
+    def test_balance_changes_bump_version(self):
+        self.bank.login_as(self.alice)
+        self.bank.transaction_service.make_deposit(111111, 5)
+        self.bank.transaction_service.make_withdraw(111111, 5)
+        session = self.bank.db_manager.open_session()
+        self.assertEqual(session.query(Account.version).scalar(), 3)
+        self.bank.db_manager.close_session()
+
+    def test_write_on_stale_row_is_a_conflict(self):
+        db_manager = self.bank.db_manager
+        with self.assertRaises(ConcurrentUpdateError):
+            with db_manager.unit_of_work():
+                account = db_manager.get_by_account_number(111111)
+                # Someone else changes the row after we read it
+                with db_manager.engine.begin() as other:
+                    other.execute(update(Account).values(balance=Account.balance + 1,
+                                                         version=Account.version + 1))
+                account.balance -= 10
+        self.assertEqual(self.bank.balance(111111), Decimal(101))
+
+    def test_retry_on_conflict(self):
+        class Flaky:
+            calls = 0
+
+            @retry_on_conflict(attempts=3, base_delay=0)
+            def run(self):
+                self.calls += 1
+                if self.calls < 3:
+                    raise ConcurrentUpdateError
+                return self.calls
+
+        self.assertEqual(Flaky().run(), 3)
+
+        class Hopeless:
+            @retry_on_conflict(attempts=2, base_delay=0)
+            def run(self):
+                raise ConcurrentUpdateError
+
+        with self.assertRaises(ConcurrentUpdateError):
+            Hopeless().run()
+
+
+if __name__ == '__main__':
+    unittest.main()
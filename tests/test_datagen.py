@@ -0,0 +1,99 @@
+import unittest
+from collections import Counter
+
+from sqlalchemy import select
+
+from frappster.datagen import DataGenerator
+from frappster.models import Account, Transaction, User
+from frappster.reconcile import reconcile_range
+from frappster.types import AccessRole, AccountType
+from tests.support import Bank
+
+
+def generate(bank, seed=7, **kwargs):
+    generator = DataGenerator(bank.db_manager, seed, batch_size=100, **kwargs)
+    return generator.generate(users=20, accounts=40, transactions=500)
+
+
+def dump(bank):
+    """Every generated row, minus the salted password & timestamps"""
+    with bank.db_manager.unit_of_work() as session:
+        users = session.execute(select(User.login_id, User.first_name, User.last_name,
+                                       User.email, User.address, User.access_role)
+                                .where(User.login_id != 42069)
+                                .order_by(User.id)).all()
+        accounts = session.execute(select(Account.account_number, Account.account_type,
+                                          Account.balance, Account.user_id)
+                                   .order_by(Account.id)).all()
+        transactions = session.execute(select(Transaction.senders_account_number,
+                                              Transaction.recipients_account_number,
+                                              Transaction.type, Transaction.amount,
+                                              Transaction.date)
+                                       .order_by(Transaction.id)).all()
+    return users, accounts, transactions
+
+
+class TestDataGenerator(unittest.TestCase):
+
+    def setUp(self):
+        self.bank = Bank()
+
+    def tearDown(self):
+        self.bank.close()
+
+    def test_creates_requested_rows(self):
+        created = generate(self.bank)
+        users, accounts, transactions = dump(self.bank)
+        self.assertEqual(len(created['login_ids']), 20)
+        self.assertEqual([user.login_id for user in users], created['login_ids'])
+        self.assertEqual([account.account_number for account in accounts],
+                         created['account_numbers'])
+        # One opening deposit per account on top
+        self.assertEqual(len(transactions), 540)
+        self.assertEqual(users[0].access_role, AccessRole.EMPLOYEE)
+        self.assertEqual(users[1].access_role, AccessRole.CUSTOMER)
+        self.assertEqual(set(AccountType), {account.account_type for account in accounts})
+
+    def test_same_seed_same_data(self):
+        generate(self.bank)
+        other = Bank()
+        try:
+            generate(other)
+            self.assertEqual(dump(self.bank), dump(other))
+        finally:
+            other.close()
+
+    def test_other_seed_other_data(self):
+        generate(self.bank)
+        other = Bank()
+        try:
+            generate(other, seed=8)
+            self.assertNotEqual(dump(self.bank), dump(other))
+        finally:
+            other.close()
+
+    def test_balances_match_ledger(self):
+        generate(self.bank)
+        with self.bank.db_manager.unit_of_work() as session:
+            self.assertEqual(reconcile_range(session, 0, 10 ** 8), [])
+            balances = session.execute(select(Account.balance)).scalars().all()
+        self.assertTrue(all(balance >= 0 for balance in balances))
+
+    def test_hot_accounts_take_their_share(self):
+        created = generate(self.bank, hot_accounts=0.05, hot_share=0.6)
+        _, _, transactions = dump(self.bank)
+        touched = Counter()
+        for row in transactions[40:]:
+            for number in {row.senders_account_number, row.recipients_account_number} - {None}:
+                touched[number] += 1
+        hot = created['account_numbers'][:2]
+        self.assertGreater(sum(touched[number] for number in hot), 0.5 * 500)
+
+    def test_generated_users_can_log_in(self):
+        created = generate(self.bank, password="secret")
+        self.bank.auth_service.login_user(created['login_ids'][3], "secret")
+        self.assertEqual(self.bank.auth_service.current_user.login_id, created['login_ids'][3])
+
+
+if __name__ == '__main__':
+    unittest.main()
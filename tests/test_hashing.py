@@ -0,0 +1,68 @@
+import unittest
+
+from frappster.auth import AuthService
+from frappster.hashing import (MAX_ROUNDS, MIN_ROUNDS, PasswordHasher,
+                               calibrate_rounds, hash_rounds)
+from frappster.models import User
+from tests.support import Bank
+
+
+class TestPasswordHasher(unittest.TestCase):
+
+    def setUp(self):
+        self.hasher = PasswordHasher(rounds=4, workers=2)
+
+    def tearDown(self):
+        self.hasher.shutdown()
+
+    def test_hash_and_verify(self):
+        hashed = self.hasher.hash("pw")
+        self.assertEqual(hash_rounds(hashed), 4)
+        self.assertTrue(self.hasher.verify("pw", hashed))
+        self.assertFalse(self.hasher.verify("nope", hashed))
+
+    def test_needs_rehash_only_below_current_cost(self):
+        self.assertFalse(self.hasher.needs_rehash(self.hasher.hash("pw")))
+        stronger = PasswordHasher(rounds=5, executor=self.hasher.executor)
+        self.assertTrue(stronger.needs_rehash(self.hasher.hash("pw")))
+        self.assertFalse(self.hasher.needs_rehash(stronger.hash("pw")))
+        self.assertFalse(self.hasher.needs_rehash("not a bcrypt hash"))
+
+    def test_calibration_stays_in_bounds(self):
+        self.assertEqual(calibrate_rounds(target_ms=0.001), MIN_ROUNDS)
+        self.assertEqual(calibrate_rounds(target_ms=10**9), MAX_ROUNDS)
+
+
+class TestRehashOnLogin(unittest.TestCase):
+
+    def setUp(self):
+        self.bank = Bank()
+        self.old = PasswordHasher(rounds=4, workers=1)
+        self.new = PasswordHasher(rounds=5, workers=1)
+        self.bank.add_user(1001, password=self.old.hash("pw"))
+
+    def tearDown(self):
+        self.old.shutdown()
+        self.new.shutdown()
+        self.bank.close()
+
+    def stored_password(self):
+        session = self.bank.db_manager.open_session()
+        password = session.query(User).filter_by(login_id=1001).one().password
+        self.bank.db_manager.close_session()
+        return password
+
+    def test_outdated_cost_is_upgraded(self):
+        AuthService(self.bank.db_manager, self.new).login_user(1001, "pw")
+        stored = self.stored_password()
+        self.assertEqual(hash_rounds(stored), 5)
+        self.assertTrue(self.new.verify("pw", stored))
+
+    def test_current_cost_is_kept(self):
+        before = self.stored_password()
+        AuthService(self.bank.db_manager, self.old).login_user(1001, "pw")
+        self.assertEqual(self.stored_password(), before)
+
+
+if __name__ == '__main__':
+    unittest.main()
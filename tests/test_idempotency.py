@@ -0,0 +1,108 @@
+import unittest
+from datetime import timedelta
+from decimal import Decimal
+
+from sqlalchemy import event
+
+from frappster.errors import IdempotencyKeyReusedError, InsufficientFundsError
+from frappster.models import IdempotencyKey, Transaction
+from tests.support import Bank
+
+
+class TestIdempotencyKeys(unittest.TestCase):
+
+    def setUp(self):
+        self.bank = Bank()
+        self.alice = self.bank.add_user(1001)
+        self.bob = self.bank.add_user(1002)
+        self.bank.add_account(self.alice, 111111, balance=100)
+        self.bank.add_account(self.bob, 222222, balance=100)
+        self.bank.login_as(self.alice)
+        self.service = self.bank.transaction_service
+        self.store = self.service.idempotency_store
+
+        self.statements = []
+        event.listen(self.bank.db_manager.engine, "before_cursor_execute", self.record)
+
+    def tearDown(self):
+        event.remove(self.bank.db_manager.engine, "before_cursor_execute", self.record)
+        self.bank.close()
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def ledger_size(self):
+        session = self.bank.db_manager.open_session()
+        size = session.query(Transaction).count()
+        self.bank.db_manager.close_session()
+        return size
+
+    def test_replayed_transfer_posts_once(self):
+        first = self.service.initiate_transaction(111111, 222222, 10, idempotency_key="t-1")
+
+        # From the in process cache, no SQL at all
+        self.statements.clear()
+        self.assertEqual(self.service.initiate_transaction(111111, 222222, 10, idempotency_key="t-1"), first)
+        self.assertEqual(self.statements, [])
+
+        # From the table, a plain read without the write lock
+        self.store.cache.clear()
+        self.statements.clear()
+        self.assertEqual(self.service.initiate_transaction(111111, 222222, 10, idempotency_key="t-1"), first)
+        self.assertNotIn("BEGIN IMMEDIATE", self.statements)
+
+        self.assertEqual(self.bank.balance(111111), Decimal(90))
+        self.assertEqual(self.bank.balance(222222), Decimal(110))
+        self.assertEqual(self.ledger_size(), 1)
+
+    def test_deposit_and_withdraw(self):
+        self.service.make_deposit(111111, 5, idempotency_key="d-1")
+        self.service.make_deposit(111111, 5, idempotency_key="d-1")
+        self.service.make_withdraw(111111, 20, idempotency_key="w-1")
+        self.service.make_withdraw(111111, 20, idempotency_key="w-1")
+        self.assertEqual(self.bank.balance(111111), Decimal(85))
+        self.assertEqual(self.ledger_size(), 2)
+
+    def test_key_bound_to_its_request(self):
+        self.service.make_deposit(111111, 5, idempotency_key="k")
+        with self.assertRaises(IdempotencyKeyReusedError):
+            self.service.make_deposit(111111, 6, idempotency_key="k")
+        with self.assertRaises(IdempotencyKeyReusedError):
+            self.service.make_withdraw(111111, 5, idempotency_key="k")
+
+    def test_retry_may_spell_the_amount_differently(self):
+        self.service.make_deposit(111111, 5, idempotency_key="k")
+        self.service.make_deposit("111111", "5.0", idempotency_key="k")
+        self.service.make_deposit(111111, Decimal("5.00"), idempotency_key="k")
+        self.service.initiate_transaction(111111, 222222, "2.50", idempotency_key="t")
+        self.service.initiate_transaction("111111", "222222", 2.5, idempotency_key="t")
+        self.assertEqual(self.bank.balance(111111), Decimal("102.5"))
+        self.assertEqual(self.ledger_size(), 2)
+
+    def test_failed_request_is_not_remembered(self):
+        with self.assertRaises(InsufficientFundsError):
+            self.service.initiate_transaction(111111, 222222, 150, idempotency_key="t-2")
+        self.service.make_deposit(111111, 100)
+        self.service.initiate_transaction(111111, 222222, 150, idempotency_key="t-2")
+        self.assertEqual(self.bank.balance(222222), Decimal(250))
+
+    def test_keys_are_per_user(self):
+        self.service.make_deposit(111111, 5, idempotency_key="same")
+        bob = self.bank.new_client(self.bob)
+        bob.transaction_service.make_deposit(222222, 5, idempotency_key="same")
+        self.assertEqual(self.bank.balance(222222), Decimal(105))
+
+    def test_expired_keys_are_purged_and_reusable(self):
+        self.service.make_deposit(111111, 5, idempotency_key="old")
+        self.store.retention = timedelta(seconds=-1)
+        self.assertEqual(self.store.purge_expired(), 1)
+
+        self.service.make_deposit(111111, 5, idempotency_key="old")
+        self.assertEqual(self.bank.balance(111111), Decimal(110))
+        session = self.bank.db_manager.open_session()
+        self.assertEqual(session.query(IdempotencyKey).count(), 1)
+        self.bank.db_manager.close_session()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import csv
+import json
+import os
+import unittest
+
+from frappster.allocator import is_luhn_valid
+from frappster.errors import PermissionDeniedError
+from frappster.hashing import PasswordHasher
+from frappster.importer import UserImporter
+from frappster.models import User
+from frappster.types import AccessRole
+from tests.support import Bank
+
+
+def user_row(i, **overrides):
+    row = {'first_name': f"First{i}", 'last_name': "Last",
+           'address': "Street 1", 'email': f"user{i}@example.com",
+           'phone_number': "123", 'password': f"pw{i}"}
+    row.update(overrides)
+    return row
+
+
+class TestUserImporter(unittest.TestCase):
+
+    def setUp(self):
+        self.bank = Bank()
+        self.employee = self.bank.add_user(1000, AccessRole.EMPLOYEE)
+        self.bank.login_as(self.employee)
+        self.hasher = PasswordHasher(rounds=4, workers=2)
+        self.importer = UserImporter(self.bank.db_manager, self.bank.auth_service,
+                                     batch_size=3, hasher=self.hasher)
+        self.errors = []
+
+    def tearDown(self):
+        self.hasher.shutdown()
+        self.bank.close()
+
+    def write_jsonl(self, rows):
+        path = os.path.join(self.bank.tmp_dir.name, "users.jsonl")
+        with open(path, "w") as file:
+            for row in rows:
+                file.write((row if isinstance(row, str) else json.dumps(row)) + "\n")
+        return path
+
+    def run_import(self, path, start=0):
+        return self.importer.import_file(path, start,
+                                         on_error=lambda offset, e: self.errors.append((offset, e.reason)))
+
+    def users(self):
+        session = self.bank.db_manager.open_session()
+        users = session.query(User).filter(User.first_name.startswith("First")).order_by(User.id).all()
+        result = [(user.login_id, user.first_name, user.access_role, user.password) for user in users]
+        self.bank.db_manager.close_session()
+        return result
+
+    def test_imports_in_batches_with_login_id_blocks(self):
+        batches = []
+        path = self.write_jsonl([user_row(i) for i in range(7)])
+        report = self.importer.import_file(path, on_batch=lambda r: batches.append(r.imported))
+        self.assertEqual(batches, [3, 6, 7])
+        self.assertEqual(report.to_dict(), {'imported': 7, 'failed': 0, 'next_offset': 7})
+        self.assertEqual([offset for offset, _ in report.last_batch], [6])
+        users = self.users()
+        self.assertEqual(len(users), 7)
+        self.assertTrue(all(is_luhn_valid(user[0]) for user in users))
+        self.assertTrue(self.hasher.verify("pw3", users[3][3]))
+        self.assertEqual({user[2] for user in users}, {AccessRole.CUSTOMER})
+
+    def test_bad_rows_are_reported_and_skipped(self):
+        path = self.write_jsonl([user_row(0),
+                                 user_row(1, email="nope"),
+                                 "{not json",
+                                 user_row(3, last_name=""),
+                                 user_row(4, access_role="admin"),
+                                 user_row(5, first_name="x" * 31),
+                                 user_row(6, access_role="employee")])
+        report = self.run_import(path)
+        self.assertEqual((report.imported, report.failed), (2, 5))
+        self.assertEqual([offset for offset, _ in self.errors], [1, 2, 3, 4, 5])
+        self.assertEqual([user[1] for user in self.users()], ["First0", "First6"])
+
+    def test_resume_from_offset(self):
+        path = self.write_jsonl([user_row(i) for i in range(5)])
+        report = self.run_import(path, start=3)
+        self.assertEqual(report.imported, 2)
+        self.assertEqual([user[1] for user in self.users()], ["First3", "First4"])
+
+    def test_csv(self):
+        path = os.path.join(self.bank.tmp_dir.name, "users.csv")
+        with open(path, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=list(user_row(0)) + ['middle_name'])
+            writer.writeheader()
+            writer.writerow(user_row(0, middle_name=""))
+            writer.writerow(user_row(1, middle_name="Mid"))
+        self.assertEqual(self.run_import(path).imported, 2)
+
+    def test_customers_cant_import(self):
+        self.bank.login_as(self.bank.add_user(1, AccessRole.CUSTOMER))
+        with self.assertRaises(PermissionDeniedError):
+            self.run_import(self.write_jsonl([user_row(0)]))
+
+
+class TestProcessPoolHashing(unittest.TestCase):
+
+    def test_default_hasher_uses_processes(self):
+        bank = Bank()
+        try:
+            bank.login_as(bank.add_user(1000, AccessRole.EMPLOYEE))
+            path = os.path.join(bank.tmp_dir.name, "users.jsonl")
+            with open(path, "w") as file:
+                file.write(json.dumps(user_row(0)) + "\n")
+            report = UserImporter(bank.db_manager, bank.auth_service,
+                                  processes=2).import_file(path)
+            self.assertEqual(report.imported, 1)
+        finally:
+            bank.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+
+from sqlalchemy import or_, select
+
+from frappster.instrumentation import current_call, instrumented
+from frappster.models import Transaction
+from frappster.types import AccessRole
+from frappster.write_queue import GroupCommitQueue
+from tests.support import Bank
+
+
+class OldHistory:
+    """get_history the way it used to be, to_dict on every ORM row"""
+    def __init__(self, db_manager) -> None:
+        self.db_manager = db_manager
+
+    @instrumented
+    def get_history(self, account_number):
+        with self.db_manager.unit_of_work() as session:
+            rows = session.execute(select(Transaction)
+                                   .where(or_(Transaction.senders_account_number == account_number,
+                                              Transaction.recipients_account_number == account_number))
+                                   ).scalars().all()
+            return [row.to_dict() for row in rows]
+
+
+class TestQueryInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.bank = Bank()
+        self.alice = self.bank.add_user(1001)
+        self.bob = self.bank.add_user(1002)
+        self.bank.add_account(self.alice, 111111, balance=100)
+        self.bank.add_account(self.bob, 222222)
+        self.bank.login_as(self.alice)
+        self.instrumentation = self.bank.db_manager.instrumentation
+        self.instrumentation.reset()
+
+    def tearDown(self):
+        self.bank.close()
+
+    def test_counts_per_service_call(self):
+        transactions = self.bank.transaction_service
+        transactions.make_deposit(111111, 5)
+        transactions.make_deposit(111111, 5)
+        transactions.get_history_page(111111)
+
+        summary = self.instrumentation.summary()
+        deposit = summary['TransactionService.make_deposit']
+        self.assertEqual(deposit['calls'], 2)
+        # account, balance update, ledger insert
+        self.assertEqual(deposit['queries'], 6)
+        # account read, one row updated, one row inserted
+        self.assertEqual(deposit['rows'], 6)
+        self.assertGreater(deposit['db_ms'], 0)
+
+        history = summary['TransactionService.get_history_page']
+        self.assertEqual(history['queries'], 2)
+        self.assertEqual(history['n_plus_one'], 0)
+
+    def test_nested_calls_count_towards_the_outer_one(self):
+        self.bank.transaction_service.get_history(111111)
+        summary = self.instrumentation.summary()
+        self.assertIn('TransactionService.get_history', summary)
+        self.assertNotIn('TransactionService.get_history_page', summary)
+
+    def test_queries_outside_calls_are_not_counted(self):
+        self.assertIsNone(current_call())
+        self.bank.balance(111111)
+        self.assertEqual(self.instrumentation.summary(), {})
+
+    def test_flags_lazy_loads_per_row(self):
+        for _ in range(6):
+            self.bank.transaction_service.initiate_transaction(111111, 222222, 1)
+
+        with self.assertLogs('frappster.instrumentation', 'WARNING') as logs:
+            history = OldHistory(self.bank.db_manager).get_history(111111)
+        self.assertEqual(len(history), 6)
+        self.assertIn("possible N+1 in OldHistory.get_history", logs.output[0])
+        self.assertEqual(self.instrumentation.summary()['OldHistory.get_history']['n_plus_one'], 1)
+
+        # The current history reads plain rows, nothing to flag
+        with self.assertNoLogs('frappster.instrumentation', 'WARNING'):
+            self.assertEqual(len(self.bank.transaction_service.get_history(111111)), 6)
+
+    def test_logs_slow_queries(self):
+        self.instrumentation.slow_query_ms = 0
+        with self.assertLogs('frappster.instrumentation', 'WARNING') as logs:
+            self.bank.account_service.get_user_accounts()
+        self.assertIn("slow query", logs.output[0])
+        self.assertIn("AccountService.get_user_accounts", logs.output[0])
+        _, name, statement = self.instrumentation.slow_queries[-1]
+        self.assertEqual(name, "AccountService.get_user_accounts")
+        self.assertIn("FROM accounts", statement)
+
+    def test_write_queue_runs_in_the_callers_context(self):
+        with GroupCommitQueue(self.bank.db_manager, window_ms=1) as queue:
+            self.bank.transaction_service.write_queue = queue
+            self.bank.transaction_service.make_deposit(111111, 5)
+        self.assertEqual(self.instrumentation.summary()['TransactionService.make_deposit']['queries'], 3)
+
+    def test_admin_calls_are_tagged(self):
+        self.bank.login_as(self.bank.add_user(1000, AccessRole.EMPLOYEE))
+        self.bank.user_manager.get_all_users()
+        self.assertEqual(self.instrumentation.summary()['UserManager.get_all_users']['rows'], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
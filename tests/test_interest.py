@@ -0,0 +1,79 @@
+import unittest
+from decimal import Decimal
+
+from sqlalchemy import func, select
+
+from frappster.errors import PermissionDeniedError
+from frappster.interest import InterestEngine
+from frappster.models import InterestAccrual, Transaction
+from frappster.types import AccessRole, AccountType, TransactionType
+from tests.support import Bank
+
+
+class TestInterestEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.bank = Bank()
+        self.employee = self.bank.add_user(1000, AccessRole.EMPLOYEE)
+        self.alice = self.bank.add_user(1001)
+        self.bank.add_account(self.alice, 111111, balance=1000, account_type=AccountType.SAVINGS)
+        self.bank.add_account(self.alice, 111112, balance=250, account_type=AccountType.SAVINGS)
+        self.bank.add_account(self.alice, 111113, balance=0, account_type=AccountType.SAVINGS)
+        self.bank.add_account(self.alice, 111114, balance=1000)
+        self.bank.login_as(self.employee)
+        self.engine = InterestEngine(self.bank.db_manager, self.bank.auth_service, chunk_size=2)
+
+    def tearDown(self):
+        self.bank.close()
+
+    def ledger(self):
+        session = self.bank.db_manager.open_session()
+        rows = session.execute(select(Transaction.recipients_account_number,
+                                      Transaction.type,
+                                      Transaction.amount)
+                               .order_by(Transaction.recipients_account_number)).all()
+        self.bank.db_manager.close_session()
+        return [(number, kind, Decimal(str(amount))) for number, kind, amount in rows]
+
+    def test_accrues_savings_accounts_only(self):
+        chunks = []
+        summary = self.engine.accrue("2024-06", "0.01", on_chunk=lambda s: chunks.append(s['accounts']))
+        self.assertEqual(summary['accounts'], 2)
+        self.assertEqual(summary['total'], Decimal("12.5"))
+        self.assertEqual(chunks, [2, 2])
+        self.assertEqual(self.bank.balance(111111), Decimal("1010"))
+        self.assertEqual(self.bank.balance(111112), Decimal("252.5"))
+        self.assertEqual(self.bank.balance(111113), Decimal("0"))
+        self.assertEqual(self.bank.balance(111114), Decimal("1000"))
+        self.assertEqual(self.ledger(), [(111111, TransactionType.DEPOSIT, Decimal("10")),
+                                         (111112, TransactionType.DEPOSIT, Decimal("2.5"))])
+
+    def test_rerunning_a_period_accrues_nothing(self):
+        self.engine.accrue("2024-06", "0.01")
+        summary = self.engine.accrue("2024-06", "0.01")
+        self.assertEqual(summary['accounts'], 0)
+        self.assertEqual(self.bank.balance(111111), Decimal("1010"))
+        self.assertEqual(len(self.ledger()), 2)
+
+        self.engine.accrue("2024-07", "0.01")
+        self.assertEqual(self.bank.balance(111111), Decimal("1020.1"))
+
+    def test_restarts_after_a_partial_run(self):
+        # Only the first id range committed before the "crash"
+        self.engine._accrue_range("2024-06", Decimal("0.01"), AccountType.SAVINGS, 1, 2)
+        summary = self.engine.accrue("2024-06", "0.01")
+        self.assertEqual(summary['accounts'], 1)
+        session = self.bank.db_manager.open_session()
+        accruals = session.execute(select(func.count()).select_from(InterestAccrual)).scalar()
+        self.bank.db_manager.close_session()
+        self.assertEqual(accruals, 2)
+        self.assertEqual(self.bank.balance(111112), Decimal("252.5"))
+
+    def test_customers_cant_run_it(self):
+        self.bank.login_as(self.alice)
+        with self.assertRaises(PermissionDeniedError):
+            self.engine.accrue("2024-06", "0.01")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+
+from sqlalchemy import event
+
+from frappster.types import AccessRole
+from frappster.utils import hash_password
+from tests.support import Bank
+
+
+class TestQueryCounts(unittest.TestCase):
+    """Pins the number of statements each service method issues,
+    so a loader option creeping back in shows up here.
+    """
+
+    def setUp(self):
+        self.bank = Bank()
+        self.employee = self.bank.add_user(1000, AccessRole.EMPLOYEE)
+        self.alice = self.bank.add_user(1001, password=hash_password("pw"))
+        self.bob = self.bank.add_user(1002)
+        self.bank.add_account(self.alice, 111111, balance=100)
+        self.bank.add_account(self.alice, 111112)
+        self.bank.add_account(self.bob, 222222)
+
+        self.statements = []
+        event.listen(self.bank.db_manager.engine, "before_cursor_execute", self.record)
+
+    def tearDown(self):
+        event.remove(self.bank.db_manager.engine, "before_cursor_execute", self.record)
+        self.bank.close()
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        if not statement.startswith("BEGIN"):
+            self.statements.append(statement)
+
+    def count(self, func, *args, **kwargs):
+        self.statements.clear()
+        func(*args, **kwargs)
+        return len(self.statements)
+
+    def test_login_reads_only_the_user_row(self):
+        auth = self.bank.auth_service
+        # select user, bcrypt outside the transaction,
+        # select user again, update login bookkeeping
+        self.assertEqual(self.count(auth.login_user, 1001, "pw"), 3)
+        self.assertTrue(all("JOIN" not in statement for statement in self.statements))
+
+    def test_customer_methods(self):
+        self.bank.login_as(self.alice)
+        transactions = self.bank.transaction_service
+        # only the accounts, the logged in user already knows its id
+        self.assertEqual(self.count(self.bank.account_service.get_user_accounts), 1)
+        # account, balance update, ledger insert
+        self.assertEqual(self.count(transactions.make_deposit, 111111, 5), 3)
+        self.assertEqual(self.count(transactions.make_withdraw, 111111, 5), 3)
+        # two owner lookups, debit, credit, ledger insert
+        self.assertEqual(self.count(transactions.initiate_transaction, 111111, 222222, 5), 5)
+        # owner lookup, one history query
+        self.assertEqual(self.count(transactions.get_history_page, 111111), 2)
+        self.assertTrue(all("JOIN" not in statement for statement in self.statements))
+
+    def test_employee_methods(self):
+        self.bank.login_as(self.employee)
+        users = self.bank.user_manager
+        self.assertEqual(self.count(users.get_user, 1001), 1)
+        # served from the user cache
+        self.assertEqual(self.count(users.get_user, 1001), 0)
+        self.assertEqual(self.count(users.get_all_users), 1)
+        # select user, update user
+        self.assertEqual(self.count(users.update_user, {'email': "a@b.se", 'access_role': AccessRole.CUSTOMER}, 1001), 2)
+        self.assertTrue(all("JOIN" not in statement for statement in self.statements))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import os
+import tempfile
+import threading
+import unittest
+import urllib.request
+
+from frappster.errors import InsufficientFundsError, TooManyLoginAttemptsError
+from frappster.metrics import (REGISTRY, Histogram, MetricsRegistry,
+                               bucket_index, bucket_upper)
+from frappster.utils import hash_password
+from tests.support import Bank
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_buckets_are_within_three_percent(self):
+        for value in list(range(0, 5000)) + [10 ** exponent + 7 for exponent in range(4, 13)]:
+            index = bucket_index(value)
+            upper = bucket_upper(index)
+            lower = bucket_upper(index - 1) if index else 0
+            self.assertTrue(lower <= value < upper, value)
+            self.assertLessEqual(upper - lower, max(1, lower / 32))
+
+    def test_percentiles(self):
+        histogram = Histogram()
+        for micros in range(1, 10001):
+            histogram.record(micros * 1000)
+        self.assertEqual(histogram.count, 10000)
+        self.assertEqual(histogram.total, sum(range(1, 10001)) * 1000)
+        self.assertAlmostEqual(histogram.percentile(0.5), 5_000_000, delta=5_000_000 * 0.04)
+        self.assertAlmostEqual(histogram.percentile(0.99), 9_900_000, delta=9_900_000 * 0.04)
+
+    def test_threads_record_into_their_own_shard(self):
+        histogram = Histogram()
+
+        def record():
+            for _ in range(1000):
+                histogram.record(1500)
+
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(histogram.count, 4000)
+
+    def test_render(self):
+        registry = MetricsRegistry()
+        metrics = registry.method("Service.call")
+        metrics.latency.record(3_000_000)
+        metrics.latency.record(30_000_000)
+        metrics.failed(InsufficientFundsError())
+        text = registry.render()
+        self.assertIn('frappster_call_duration_seconds_bucket{method="Service.call",le="0.005"} 1', text)
+        self.assertIn('frappster_call_duration_seconds_bucket{method="Service.call",le="+Inf"} 2', text)
+        self.assertIn('frappster_call_duration_seconds_sum{method="Service.call"} 0.033000000', text)
+        self.assertIn('frappster_calls_total{method="Service.call",outcome="ok"} 1', text)
+        self.assertIn('frappster_call_errors_total{method="Service.call",error="InsufficientFundsError"} 1',
+                      text)
+
+
+class TestServiceMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.bank = Bank()
+        self.alice = self.bank.add_user(1001, password=hash_password("pw"))
+        self.bank.add_account(self.alice, 111111, balance=100)
+        self.bank.login_as(self.alice)
+
+    def tearDown(self):
+        self.bank.close()
+
+    def test_counts_successes_and_errors_by_class(self):
+        withdraw = REGISTRY.method('TransactionService.make_withdraw')
+        calls = withdraw.latency.count
+        failures = withdraw.errors.get('InsufficientFundsError', 0)
+
+        self.bank.transaction_service.make_withdraw(111111, 10)
+        with self.assertRaises(InsufficientFundsError):
+            self.bank.transaction_service.make_withdraw(111111, 1000)
+
+        self.assertEqual(withdraw.latency.count, calls + 2)
+        self.assertEqual(withdraw.errors['InsufficientFundsError'], failures + 1)
+        self.assertIn('error="InsufficientFundsError"', REGISTRY.render())
+
+    def test_counts_login_lockouts(self):
+        login = REGISTRY.method('AuthService.login_user')
+        lockouts = login.errors.get('TooManyLoginAttemptsError', 0)
+        auth = self.bank.auth_service
+        auth.current_user = None
+        for _ in range(auth.max_login_attempts):
+            with self.assertRaises(Exception):
+                auth.login_user(1001, "wrong")
+        with self.assertRaises(TooManyLoginAttemptsError):
+            auth.login_user(1001, "pw")
+        self.assertEqual(login.errors['TooManyLoginAttemptsError'], lockouts + 1)
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        self.registry.method("Service.call").latency.record(1000)
+
+    def test_textfile(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "frappster.prom")
+            self.registry.write_textfile(path)
+            with open(path, encoding="utf-8") as file:
+                self.assertEqual(file.read(), self.registry.render())
+            self.assertEqual(os.listdir(tmp_dir), ["frappster.prom"])
+
+    def test_scrape_endpoint(self):
+        server = self.registry.serve(0)
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            with urllib.request.urlopen(url) as response:
+                self.assertTrue(response.headers['Content-Type'].startswith("text/plain"))
+                self.assertEqual(response.read().decode(), self.registry.render())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
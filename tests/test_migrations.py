@@ -0,0 +1,58 @@
+import contextlib
+import io
+import unittest
+
+from sqlalchemy import delete, func, select
+
+from frappster.database import DatabaseManager
+from frappster.migrations import SCHEMA_VERSION, get_schema_version
+from frappster.models import SchemaVersion, User
+from frappster.types import AccessRole
+from tests.support import Bank
+
+
+def count_admins(db_manager):
+    with db_manager.unit_of_work() as session:
+        return session.execute(select(func.count())
+                               .select_from(User)
+                               .where(User.access_role == AccessRole.ADMIN)).scalar()
+
+
+class TestStartup(unittest.TestCase):
+
+    def setUp(self):
+        self.bank = Bank()
+
+    def tearDown(self):
+        self.bank.close()
+
+    def reopen(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            db_manager = DatabaseManager(f"sqlite:///{self.bank.db_path}")
+        self.addCleanup(db_manager.engine.dispose)
+        return db_manager, output.getvalue()
+
+    def test_new_database_is_bootstrapped(self):
+        with self.bank.db_manager.engine.connect() as connection:
+            self.assertEqual(get_schema_version(connection), SCHEMA_VERSION)
+        self.assertEqual(count_admins(self.bank.db_manager), 1)
+
+    def test_up_to_date_database_skips_setup(self):
+        db_manager, output = self.reopen()
+        self.assertEqual(output, "")
+        self.assertEqual(count_admins(db_manager), 1)
+
+    def test_older_database_gets_the_admin(self):
+        with self.bank.db_manager.engine.begin() as connection:
+            connection.execute(delete(User))
+            # Back to before the super admin migration
+            connection.execute(delete(SchemaVersion).where(SchemaVersion.version >= 5))
+
+        db_manager, output = self.reopen()
+        self.assertEqual(output, "Super admin account created.\n")
+        self.assertEqual(count_admins(db_manager), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+
+from frappster.auth import AuthService
+from frappster.errors import PermissionDeniedError
+from frappster.models import UserData
+from frappster.types import ROLE_PERMISSIONS, AccessRole, Permissions
+from frappster.utils import requires_permissions
+
+
+class Guarded:
+    def __init__(self, auth_service) -> None:
+        self.auth_service = auth_service
+
+    @requires_permissions(Permissions.MANAGE_USERS, Permissions.VIEW_USER)
+    def any_of(self):
+        return True
+
+    @requires_permissions([Permissions.DELETE_USER, Permissions.FREEZE_ACCOUNT])
+    def as_list(self):
+        return True
+
+
+def as_role(role):
+    auth = AuthService(None)
+    auth.current_user = UserData(id=1, login_id=1, first_name="A",
+                                 middle_name=None, last_name="B",
+                                 address="-", email="-", phone_number="-",
+                                 access_role=role)
+    return auth
+
+
+class TestPermissionMasks(unittest.TestCase):
+
+    def test_masks_match_role_permissions(self):
+        for role in AccessRole:
+            auth = as_role(role)
+            for permission in Permissions:
+                self.assertEqual(auth.has_permission(permission),
+                                 permission in ROLE_PERMISSIONS[role],
+                                 f"{role} {permission}")
+
+    def test_requires_any_of_the_permissions(self):
+        self.assertTrue(Guarded(as_role(AccessRole.CUSTOMER)).any_of())
+        self.assertTrue(Guarded(as_role(AccessRole.EMPLOYEE)).any_of())
+        self.assertTrue(Guarded(as_role(AccessRole.ADMIN)).as_list())
+        with self.assertRaises(PermissionDeniedError):
+            Guarded(as_role(AccessRole.CUSTOMER)).as_list()
+
+    def test_logged_out_has_no_permissions(self):
+        auth = AuthService(None)
+        self.assertFalse(auth.has_permission(Permissions.VIEW_USER))
+        with self.assertRaises(PermissionDeniedError):
+            Guarded(auth).any_of()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import io
+import unittest
+
+from sqlalchemy import event
+
+from frappster.cache import AccountCache
+from frappster.errors import InsufficientFundsError
+from frappster.interest import InterestEngine
+from frappster.types import AccessRole, AccountType
+from tests.support import Bank
+
+# Tables that must only ever be reached through an index
+INDEXED_TABLES = ("users", "accounts", "transactions")
+
+
+class TestQueryPlans(unittest.TestCase):
+    """Runs EXPLAIN QUERY PLAN on every statement a service call
+    issues and fails on any full table scan.
+    """
+
+    def setUp(self):
+        self.bank = Bank()
+        self.alice = self.bank.add_user(1001)
+        self.bob = self.bank.add_user(1002)
+        self.bank.add_account(self.alice, 111111, balance=100)
+        self.bank.add_account(self.bob, 222222)
+        self.bank.login_as(self.alice)
+
+        self.statements = []
+        event.listen(self.bank.db_manager.engine, "before_cursor_execute", self.record)
+
+    def tearDown(self):
+        event.remove(self.bank.db_manager.engine, "before_cursor_execute", self.record)
+        self.bank.close()
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            self.statements.append((statement, parameters))
+
+    def assert_indexed(self):
+        self.assertTrue(self.statements)
+        connection = self.bank.db_manager.engine.raw_connection()
+        try:
+            for statement, parameters in self.statements:
+                plan = connection.execute(f"EXPLAIN QUERY PLAN {statement}",
+                                          parameters).fetchall()
+                for row in plan:
+                    detail = row[-1]
+                    for table in INDEXED_TABLES:
+                        self.assertFalse(detail.startswith(f"SCAN {table}"),
+                                         f"{detail}\n{statement}")
+        finally:
+            connection.close()
+
+    def test_transfer(self):
+        service = self.bank.transaction_service
+        service.initiate_transaction(111111, 222222, 10)
+        with self.assertRaises(InsufficientFundsError):
+            service.initiate_transaction(111111, 222222, 1000)
+        self.assert_indexed()
+
+    def test_history(self):
+        service = self.bank.transaction_service
+        service.initiate_transaction(111111, 222222, 10)
+        service.initiate_transaction(111111, 222222, 10)
+        page = service.get_history_page(111111, limit=1)
+        service.get_history_page(111111, limit=1, cursor=page['next_cursor'])
+        self.assert_indexed()
+
+    def test_statement_export(self):
+        service = self.bank.transaction_service
+        service.initiate_transaction(111111, 222222, 10)
+        service.export_statement(111111, out=io.StringIO())
+        self.assert_indexed()
+
+    def test_interest_accrual(self):
+        self.bank.login_as(self.bank.add_user(1000, AccessRole.EMPLOYEE))
+        InterestEngine(self.bank.db_manager, self.bank.auth_service).accrue("2024-06", "0.01",
+                                                                             AccountType.CHECKINGS)
+        self.assert_indexed()
+
+    def test_account_lookup(self):
+        self.bank.account_service.get_user_accounts()
+        cache = AccountCache()
+        self.bank.account_service.refresh_accounts(cache)
+        self.bank.account_service.refresh_accounts(cache)
+        self.bank.db_manager.open_session()
+        self.bank.db_manager.get_by_account_number(111111)
+        self.bank.db_manager.close_session()
+        self.assert_indexed()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from decimal import Decimal
+
+from sqlalchemy import update
+
+from frappster.errors import PermissionDeniedError
+from frappster.models import Account
+from frappster.reconcile import Reconciler
+from frappster.types import AccessRole, AccountType
+from tests.support import Bank
+
+
+class TestReconciler(unittest.TestCase):
+
+    def setUp(self):
+        self.bank = Bank()
+        self.employee = self.bank.add_user(1000, AccessRole.EMPLOYEE)
+        self.bank.login_as(self.employee)
+        self.alice = self.bank.add_user(1001)
+        self.bob = self.bank.add_user(1002)
+        # Opened through the service, so the opening balance is in the ledger
+        for owner in (1001, 1001, 1002):
+            self.bank.account_service.create_account(user_id=owner,
+                                                     account_type=AccountType.CHECKINGS,
+                                                     balance=100)
+        session = self.bank.db_manager.open_session()
+        self.numbers = [number for (number,) in session.query(Account.account_number).order_by(Account.id)]
+        self.bank.db_manager.close_session()
+
+        self.bank.login_as(self.alice)
+        service = self.bank.transaction_service
+        service.initiate_transaction(self.numbers[0], self.numbers[2], "12.5")
+        service.make_deposit(self.numbers[1], 40)
+        service.make_withdraw(self.numbers[0], "0.1")
+        self.bank.login_as(self.employee)
+        self.found = []
+
+    def tearDown(self):
+        self.bank.close()
+
+    def reconcile(self, processes=1):
+        reconciler = Reconciler(self.bank.db_manager, self.bank.auth_service, processes)
+        return reconciler.run(on_discrepancy=lambda *mismatch: self.found.append(mismatch))
+
+    def corrupt(self, number, balance):
+        session = self.bank.db_manager.open_session()
+        session.execute(update(Account).where(Account.account_number == number).values(balance=balance))
+        session.commit()
+        self.bank.db_manager.close_session()
+
+    def test_consistent_books(self):
+        self.assertEqual(self.reconcile(), {'checked': 3, 'discrepancies': 0})
+
+    def test_reports_every_discrepancy(self):
+        self.corrupt(self.numbers[0], 1)
+        self.corrupt(self.numbers[2], "112.51")
+        summary = self.reconcile()
+        self.assertEqual(summary['discrepancies'], 2)
+        self.assertEqual(sorted(self.found),
+                         sorted([(self.numbers[0], Decimal("1.00"), Decimal("87.40")),
+                                 (self.numbers[2], Decimal("112.51"), Decimal("112.50"))]))
+
+    def test_accounts_without_ledger_rows(self):
+        self.bank.add_account(self.bob, 9999999, balance=5)
+        self.reconcile()
+        self.assertEqual(self.found, [(9999999, Decimal("5.00"), Decimal("0.00"))])
+
+    def test_split_across_processes(self):
+        self.corrupt(self.numbers[1], 0)
+        summary = self.reconcile(processes=2)
+        self.assertEqual(summary, {'checked': 3, 'discrepancies': 1})
+        self.assertEqual(self.found[0][0], self.numbers[1])
+
+    def test_split_covers_range(self):
+        reconciler = Reconciler(self.bank.db_manager, self.bank.auth_service, 3)
+        ranges = reconciler.split(10, 100)
+        self.assertEqual(ranges[0][0], 10)
+        self.assertEqual(ranges[-1][1], 100)
+        for (_, high), (low, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(low, high + 1)
+
+    def test_customers_cant_run_it(self):
+        self.bank.login_as(self.alice)
+        with self.assertRaises(PermissionDeniedError):
+            self.reconcile()
+
+
+if __name__ == '__main__':
+    unittest.main()
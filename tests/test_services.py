@@ -1,67 +1,62 @@
 import unittest
 
-from frappster.database import DatabaseManager
-from frappster.models import User
-from frappster.services import AuthService, UserManager
+from frappster.errors import PermissionDeniedError
 from frappster.types import AccessRole
+from tests.support import Bank
 
-    # db_manager = DatabaseManager()
-    # auth_service = AuthService(db_manager)
-    # user_manager = UserManager(db_manager)
-    # user_manager = UserManager(db_manager)
-    # new_user = user_manager.create_user(
-    #         first_name="Alice",
-    #         last_name="Smith",
-    #         address="456 Elm Street",
-    #         email="alice.smith@example.com",
-    #         phone_number="987-654-3210",
-    #         username="alicesmith",
-    #         password="alicepassword",  
-    #         access_role=AccessRole.ADMIN
-    #         )
-    #
-    # user_manager.create_user(
-    #         first_name="Alice",
-    #         last_name="Smith",
-    #         address="456 Elm Street",
-    #         email="alice.smith@example.com",
-    #         phone_number="987-654-3210",
-    #         username="alicesmith",
-    #         password="alicepassword",  
-    #         access_role=AccessRole.CUSTOMER
-    #         )
-    # print(new_user.id)
-    # user = user_manager.get_user(2)
-    # auth_service.current_user = user
-    # auth_service.update_password(user, "alicee")
-    # print(user.access_role)
 
 class TestUserManager(unittest.TestCase):
 
     def setUp(self):
-        self.db_manager = DatabaseManager()
-        self.user_manager = UserManager(self.db_manager)
+        self.bank = Bank()
+        self.admin = self.bank.add_user(1000, AccessRole.ADMIN)
+        self.bank.login_as(self.admin)
+        self.user_manager = self.bank.user_manager
 
-    def test_create_user(self):
+    def tearDown(self):
+        self.bank.close()
 
-        user_id = self.user_manager.create_user(
+    def create_alice(self, access_role=AccessRole.CUSTOMER):
+        return self.user_manager.create_user(
             first_name="Alice",
             last_name="Smith",
             address="456 Elm Street",
             email="alice.smith@example.com",
             phone_number="987-654-3210",
-            username="alicesmith",
-            password="alicepassword",  
-            access_role=AccessRole.ADMIN
+            password="alicepassword",
+            access_role=access_role
         )
-        self.assertEqual(user_id, 1)
+
+    def login_id_of(self, user_id):
+        return next(user.login_id for user in self.user_manager.get_all_users()
+                    if user.id == user_id)
+
+    def test_create_user(self):
+        user_id = self.create_alice(AccessRole.ADMIN)
+        # The super admin & the test admin come first
+        self.assertEqual(user_id, 3)
+
+    def test_only_admins_create_admins(self):
+        employee = self.bank.add_user(1001, AccessRole.EMPLOYEE)
+        self.bank.login_as(employee)
+        with self.assertRaises(PermissionDeniedError):
+            self.create_alice(AccessRole.ADMIN)
 
     def test_get_user(self):
+        user_id = self.create_alice()
+        login_id = self.login_id_of(user_id)
 
-        user = self.user_manager.get_user(user_id=1)
+        user = self.user_manager.get_user(login_id)
         self.assertIsNotNone(user)
-        self.assertEqual(user.id, 1)
+        self.assertEqual(user.id, user_id)
+        self.assertEqual(user.first_name, "Alice")
+
+    def test_created_user_can_log_in(self):
+        login_id = self.login_id_of(self.create_alice())
+        self.bank.auth_service.logout_user()
+        self.bank.auth_service.login_user(login_id, "alicepassword")
+        self.assertEqual(self.bank.auth_service.current_user.login_id, login_id)
+
 
 if __name__ == '__main__':
     unittest.main()
-
@@ -0,0 +1,105 @@
+import json
+import os
+import tempfile
+import unittest
+
+from frappster.errors import InsufficientFundsError
+from frappster.tracing import is_tracing, span, start_tracing, stop_tracing, traced
+from frappster.utils import hash_password
+from tests.support import Bank
+
+
+def read_spans(path):
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.bank = Bank()
+        self.alice = self.bank.add_user(1001, password=hash_password("pw"))
+        self.bob = self.bank.add_user(1002)
+        self.bank.add_account(self.alice, 111111, balance=100)
+        self.bank.add_account(self.bob, 222222)
+        self.bank.login_as(self.alice)
+
+    def tearDown(self):
+        stop_tracing()
+        self.bank.close()
+        self.tmp_dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir.name, name)
+
+    def test_ui_action_down_to_sql(self):
+        path = self.path("trace.jsonl")
+        start_tracing(path)
+        with span("Deposit", "ui"):
+            self.bank.transaction_service.make_deposit(111111, 5)
+        stop_tracing()
+
+        spans = read_spans(path)
+        by_name = {record['name']: record for record in spans}
+        ui = by_name['Deposit']
+        service = by_name['TransactionService.make_deposit']
+        self.assertIsNone(ui['parent_id'])
+        self.assertEqual(service['parent_id'], ui['span_id'])
+        self.assertEqual(by_name['requires_role']['parent_id'], service['span_id'])
+        self.assertEqual(by_name['COMMIT']['parent_id'], service['span_id'])
+        self.assertEqual(by_name['UPDATE accounts']['category'], "sql")
+        self.assertEqual({record['trace_id'] for record in spans}, {ui['span_id']})
+        # Children end before their parents do
+        self.assertLessEqual(service['duration_ms'], ui['duration_ms'])
+
+    def test_login_traces_bcrypt(self):
+        path = self.path("trace.jsonl")
+        self.bank.login_as(None)
+        start_tracing(path)
+        self.bank.auth_service.login_user(1001, "pw")
+        stop_tracing()
+
+        by_name = {record['name']: record for record in read_spans(path)}
+        self.assertEqual(by_name['bcrypt verify']['parent_id'],
+                         by_name['AuthService.login_user']['span_id'])
+
+    def test_errors_are_recorded(self):
+        path = self.path("trace.jsonl")
+        start_tracing(path)
+        with self.assertRaises(InsufficientFundsError):
+            self.bank.transaction_service.make_withdraw(111111, 1000)
+        stop_tracing()
+
+        by_name = {record['name']: record for record in read_spans(path)}
+        self.assertEqual(by_name['TransactionService.make_withdraw']['error'],
+                         "InsufficientFundsError")
+
+    def test_chrome_format(self):
+        path = self.path("trace.json")
+        start_tracing(path)
+
+        @traced()
+        def render():
+            self.bank.account_service.get_user_accounts()
+        render()
+        stop_tracing()
+
+        with open(path, encoding="utf-8") as file:
+            events = json.load(file)
+        spans = [event for event in events if event['ph'] == "X"]
+        names = {event['name'] for event in spans}
+        self.assertIn("TestTracing.test_chrome_format.<locals>.render", names)
+        self.assertIn("AccountService.get_user_accounts", names)
+        self.assertTrue(all(event['dur'] >= 0 for event in spans))
+
+    def test_nothing_traced_when_off(self):
+        self.assertFalse(is_tracing())
+        with span("Deposit", "ui") as current:
+            self.bank.transaction_service.make_deposit(111111, 5)
+        self.assertIsNone(current)
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,239 @@
+import csv
+import io
+import json
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import insert
+
+from frappster.errors import (AccountNotFoundError,
+                              InsufficientFundsError,
+                              PermissionDeniedError)
+from frappster.models import Transaction
+from frappster.types import TransactionType
+from tests.support import Bank
+
+
+class TestInitiateTransaction(unittest.TestCase):
+
+    def setUp(self):
+        self.bank = Bank()
+        self.alice = self.bank.add_user(1001)
+        self.bob = self.bank.add_user(1002)
+        self.bank.add_account(self.alice, 111111, balance=100)
+        self.bank.add_account(self.bob, 222222, balance=5)
+        self.bank.login_as(self.alice)
+        self.service = self.bank.transaction_service
+
+    def tearDown(self):
+        self.bank.close()
+
+    def test_transfer_moves_balance_and_writes_ledger(self):
+        msg = self.service.initiate_transaction(111111, "222222", "40.5")
+        self.assertEqual(msg, {"msg": "Sent to account: 222222"})
+        self.assertEqual(self.bank.balance(111111), Decimal("59.5"))
+        self.assertEqual(self.bank.balance(222222), Decimal("45.5"))
+
+        session = self.bank.db_manager.open_session()
+        ledger = session.query(Transaction).all()
+        self.assertEqual(len(ledger), 1)
+        self.assertEqual(ledger[0].type, TransactionType.TRANSFER)
+        self.assertEqual(ledger[0].senders_account_number, 111111)
+        self.assertEqual(ledger[0].recipients_account_number, 222222)
+        self.bank.db_manager.close_session()
+
+    def test_insufficient_funds_leaves_nothing_behind(self):
+        with self.assertRaises(InsufficientFundsError):
+            self.service.initiate_transaction(111111, 222222, 100.01)
+        self.assertEqual(self.bank.balance(111111), Decimal("100"))
+        self.assertEqual(self.bank.balance(222222), Decimal("5"))
+
+    def test_unknown_recipient(self):
+        with self.assertRaises(AccountNotFoundError):
+            self.service.initiate_transaction(111111, 999999, 1)
+        self.assertEqual(self.bank.balance(111111), Decimal("100"))
+
+    def test_cannot_send_from_someone_elses_account(self):
+        with self.assertRaises(PermissionDeniedError):
+            self.service.initiate_transaction(222222, 111111, 1)
+
+
+class TestHistoryPages(unittest.TestCase):
+
+    def setUp(self):
+        self.bank = Bank()
+        self.alice = self.bank.add_user(1001)
+        self.bob = self.bank.add_user(1002)
+        self.bank.add_account(self.alice, 111111, balance=1000)
+        self.bank.add_account(self.bob, 222222)
+        self.bank.login_as(self.alice)
+        self.service = self.bank.transaction_service
+
+        # Old rows with explicit dates, newer ones stamped by the db
+        self.old_day = datetime(2020, 1, 1)
+        session = self.bank.db_manager.open_session()
+        session.execute(insert(Transaction), [
+            {'recipients_account_number': 111111,
+             'type': TransactionType.DEPOSIT,
+             'amount': 1,
+             'date': self.old_day + timedelta(minutes=i)}
+            for i in range(7)])
+        session.commit()
+        self.bank.db_manager.close_session()
+        for _ in range(8):
+            self.service.initiate_transaction(111111, 222222, 1)
+
+    def tearDown(self):
+        self.bank.close()
+
+    def test_pages_cover_history_once_newest_first(self):
+        seen = []
+        page = self.service.get_history_page(111111, limit=4)
+        pages = 1
+        while True:
+            self.assertLessEqual(len(page['transactions']), 4)
+            seen.extend(page['transactions'])
+            if page['next_cursor'] is None:
+                break
+            page = self.service.get_history_page(111111, 4, page['next_cursor'])
+            pages += 1
+
+        self.assertEqual(pages, 4)
+        self.assertEqual(len(seen), 15)
+        self.assertEqual(len({t['id'] for t in seen}), 15)
+        keys = [(t['date'], t['id']) for t in seen]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+        self.assertEqual(seen, self.service.get_history(111111))
+
+    def test_date_range(self):
+        page = self.service.get_history_page(111111,
+                                             limit=10,
+                                             start=self.old_day,
+                                             end=self.old_day + timedelta(minutes=3))
+        self.assertEqual([t['type'] for t in page['transactions']], ['DEPOSIT'] * 3)
+        self.assertIsNone(page['next_cursor'])
+
+    def test_bounds_at_a_db_stamped_time(self):
+        # Stored as 'YYYY-MM-DD HH:MM:SS' by CURRENT_TIMESTAMP, no fraction
+        self.service.make_deposit(111111, 5)
+        session = self.bank.db_manager.open_session()
+        stamped = session.query(Transaction).filter_by(type=TransactionType.DEPOSIT) \
+                                            .order_by(Transaction.id.desc()).first().date
+        self.bank.db_manager.close_session()
+        self.assertEqual(stamped.microsecond, 0)
+
+        from_stamp = self.service.get_history_page(111111, start=stamped)['transactions']
+        self.assertIn('DEPOSIT', [t['type'] for t in from_stamp])
+        before_stamp = self.service.get_history_page(111111, start=self.old_day + timedelta(days=1),
+                                                     end=stamped)['transactions']
+        self.assertNotIn('DEPOSIT', [t['type'] for t in before_stamp])
+
+    def test_bounds_at_a_python_datetime(self):
+        at = self.old_day + timedelta(minutes=2)
+        self.assertEqual(len(self.service.get_history_page(111111, start=at, end=at)['transactions']), 0)
+        self.assertEqual(len(self.service.get_history_page(
+                111111, start=at, end=at + timedelta(microseconds=1))['transactions']), 1)
+
+    def test_only_own_accounts(self):
+        with self.assertRaises(PermissionDeniedError):
+            self.service.get_history_page(222222)
+
+
+class TestStatementExport(unittest.TestCase):
+    # Same history as the paging tests
+    setUp = TestHistoryPages.setUp
+    tearDown = TestHistoryPages.tearDown
+
+    def export(self, **kwargs):
+        out = io.StringIO()
+        written = self.service.export_statement(111111, out=out, **kwargs)
+        return written, out.getvalue()
+
+    def test_csv_oldest_first_with_running_balance(self):
+        written, text = self.export()
+        rows = list(csv.DictReader(io.StringIO(text)))
+        self.assertEqual(written, 15)
+        self.assertEqual(len(rows), 15)
+        self.assertEqual([row['type'] for row in rows], ['DEPOSIT'] * 7 + ['TRANSFER'] * 8)
+        self.assertEqual(rows[0]['amount'], "1.00")
+        self.assertEqual(rows[-1]['amount'], "-1.00")
+        # Ends on the balance the account has now
+        self.assertEqual(Decimal(rows[-1]['balance']), self.bank.balance(111111))
+        self.assertEqual(Decimal(rows[6]['balance']), Decimal("1000"))
+
+    def test_jsonl_date_range(self):
+        written, text = self.export(start=self.old_day + timedelta(minutes=3),
+                                    end=self.old_day + timedelta(minutes=5),
+                                    fmt="jsonl")
+        rows = [json.loads(line) for line in text.splitlines()]
+        self.assertEqual(written, 2)
+        # 992 now, minus the 4 deposits & 8 transfers since start
+        self.assertEqual([row['balance'] for row in rows], ["997.00", "998.00"])
+
+    def test_start_includes_rows_stamped_at_it(self):
+        self.service.make_deposit(111111, 5)
+        session = self.bank.db_manager.open_session()
+        stamped = session.query(Transaction).filter_by(type=TransactionType.DEPOSIT) \
+                                            .order_by(Transaction.id.desc()).first().date
+        self.bank.db_manager.close_session()
+
+        written, text = self.export(start=stamped)
+        rows = list(csv.DictReader(io.StringIO(text)))
+        self.assertIn("5.00", [row['amount'] for row in rows])
+        self.assertEqual(Decimal(rows[-1]['balance']), self.bank.balance(111111))
+
+    def test_only_own_accounts(self):
+        with self.assertRaises(PermissionDeniedError):
+            self.service.export_statement(222222, out=io.StringIO())
+
+
+class TestExecuteBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.bank = Bank()
+        self.alice = self.bank.add_user(1001)
+        self.bob = self.bank.add_user(1002)
+        self.bank.add_account(self.alice, 111111, balance=100)
+        self.bank.add_account(self.alice, 111112, balance=0)
+        self.bank.add_account(self.bob, 222222, balance=50)
+        self.bank.login_as(self.alice)
+        self.service = self.bank.transaction_service
+
+    def tearDown(self):
+        self.bank.close()
+
+    def test_lines_apply_in_order_and_fail_alone(self):
+        results = self.service.execute_batch([
+            (111111, 222222, 60),
+            (111111, 222222, 60),      # only 40 left
+            (111111, 111112, 40),
+            (111112, 222222, 30),      # funded by the line above
+            (222222, 111111, 1),       # not alices account
+            (111111, 999999, 1),       # no such account
+            (111111, 222222, "-5"),
+            ("abc", 222222, 1),
+            (111111, 111111, 1),
+        ])
+
+        self.assertEqual([result['line'] for result in results], list(range(9)))
+        self.assertEqual([result['ok'] for result in results],
+                         [True, False, True, True, False, False, False, False, False])
+        self.assertEqual(results[1]['error'], str(InsufficientFundsError()))
+        self.assertEqual(results[4]['error'], str(PermissionDeniedError()))
+        self.assertEqual(results[5]['error'], str(AccountNotFoundError()))
+
+        self.assertEqual(self.bank.balance(111111), Decimal(0))
+        self.assertEqual(self.bank.balance(111112), Decimal(10))
+        self.assertEqual(self.bank.balance(222222), Decimal(140))
+
+        session = self.bank.db_manager.open_session()
+        self.assertEqual(session.query(Transaction).count(), 3)
+        self.bank.db_manager.close_session()
+
+    def test_empty_batch(self):
+        self.assertEqual(self.service.execute_batch([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
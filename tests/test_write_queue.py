@@ -0,0 +1,82 @@
+import unittest
+from decimal import Decimal
+
+from sqlalchemy import event
+
+from frappster.errors import InsufficientFundsError
+from frappster.models import Transaction
+from frappster.write_queue import GroupCommitQueue
+from tests.support import Bank
+
+
+class TestGroupCommitQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.bank = Bank()
+        self.alice = self.bank.add_user(1001)
+        self.bob = self.bank.add_user(1002)
+        self.bank.add_account(self.alice, 111111, balance=100)
+        self.bank.add_account(self.bob, 222222, balance=0)
+        self.bank.login_as(self.alice)
+
+        self.queue = GroupCommitQueue(self.bank.db_manager, window_ms=200, max_batch=10)
+        self.service = self.bank.transaction_service
+        self.service.write_queue = self.queue
+
+        self.begins = 0
+        event.listen(self.bank.db_manager.engine, "before_cursor_execute", self.record)
+
+    def tearDown(self):
+        self.queue.stop()
+        event.remove(self.bank.db_manager.engine, "before_cursor_execute", self.record)
+        self.bank.close()
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        if statement == "BEGIN IMMEDIATE":
+            self.begins += 1
+
+    def test_operations_share_one_commit(self):
+        self.queue.start()
+        futures = [self.service.submit_deposit(111111, 1) for _ in range(5)]
+        futures.append(self.service.submit_withdraw(111111, 500))
+        futures.append(self.service.submit_transaction(111111, 222222, 50))
+        futures.append(self.service.submit_withdraw(111111, 5))
+
+        self.assertEqual(futures[0].result(), {'msg': "Successfull deposit"})
+        with self.assertRaises(InsufficientFundsError):
+            futures[5].result()
+        self.assertEqual(futures[6].result(), {'msg': "Sent to account: 222222"})
+        self.assertEqual(futures[7].result(), {'msg': "Succefull withdraw"})
+
+        self.assertEqual(self.begins, 1)
+        self.assertEqual(self.bank.balance(111111), Decimal(50))
+        self.assertEqual(self.bank.balance(222222), Decimal(50))
+        session = self.bank.db_manager.open_session()
+        self.assertEqual(session.query(Transaction).count(), 7)
+        self.bank.db_manager.close_session()
+
+    def test_batches_are_capped(self):
+        self.queue.start()
+        futures = [self.service.submit_deposit(111111, 1) for _ in range(25)]
+        for future in futures:
+            future.result()
+        self.assertEqual(self.begins, 3)
+        self.assertEqual(self.bank.balance(111111), Decimal(125))
+
+    def test_blocking_calls_go_through_the_queue(self):
+        self.queue.start()
+        self.service.make_deposit(111111, 1, idempotency_key="d")
+        self.service.make_deposit(111111, 1, idempotency_key="d")
+        self.assertEqual(self.bank.balance(111111), Decimal(101))
+
+    def test_stop_writes_what_is_queued(self):
+        self.queue.window = 10
+        self.queue.start()
+        futures = [self.service.submit_deposit(111111, 1) for _ in range(3)]
+        self.queue.stop()
+        self.assertTrue(all(future.done() for future in futures))
+        self.assertEqual(self.bank.balance(111111), Decimal(103))
+
+
+if __name__ == '__main__':
+    unittest.main()